@@ -0,0 +1,201 @@
+# benchmarks/generators.py
+
+# Синтетические данные для бенчмарков: карточки товаров (как их отдает
+# parser.parse_product_card), HTML карточек и страниц листинга в разметке
+# сайта, RAW база любого размера и Excel-сметы в формате upload_excel.py.
+# Генерация детерминирована: одинаковые seed и размер дают одинаковые данные.
+
+import html
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+
+from src.common import database
+from src.dwh_builder import upload_excel
+from src.raw_data_parser import parser
+
+# Сколько строк RAW записывается за одну транзакцию при генерации
+GENERATE_BATCH_SIZE = 10000
+# По скольким дням обхода распределяется parsed_at сгенерированных товаров
+CRAWL_DAYS = 7
+FIRST_CRAWL_DATE = datetime(2026, 1, 1)
+
+_NOUNS = ('Цемент', 'Кирпич', 'Профиль', 'Саморез', 'Гипсокартон', 'Утеплитель', 'Плитка', 'Труба', 'Краска',
+          'Грунтовка', 'Штукатурка', 'Шпаклевка', 'Клей', 'Доска', 'Брус', 'Фанера', 'Арматура', 'Сетка',
+          'Герметик', 'Пена')
+_ADJECTIVES = ('строительный', 'облицовочный', 'монтажный', 'полимерный', 'минеральный', 'гипсовый', 'цементный',
+               'акриловый', 'оцинкованный', 'влагостойкий', 'фасадный', 'универсальный')
+_BRANDS = ('Knauf', 'Ceresit', 'Волма', 'Основит', 'Технониколь', 'Rockwool', 'Tikkurila', 'Bergauf', 'Unis',
+           'Weber', 'Петрович', 'ЛСР', 'Старатели', 'Грас', 'Кнауф Инсулейшн')
+_CATEGORY_TREE = {
+    'Строительные материалы': {'Сухие смеси': ('Цемент', 'Штукатурка', 'Шпаклевка', 'Клей плиточный'),
+                               'Листовые материалы': ('Гипсокартон', 'Фанера', 'ОСБ'),
+                               'Утеплители': ('Минеральная вата', 'Пенополистирол')},
+    'Крепеж': {'Саморезы': ('По металлу', 'По дереву'), 'Анкеры': ('Химические', 'Клиновые')},
+    'Лакокрасочные материалы': {'Краски': ('Фасадные', 'Интерьерные'), 'Грунтовки': ('Глубокого проникновения',)},
+    'Пиломатериалы': {'Доска': ('Обрезная', 'Строганая'), 'Брус': ('Клееный', 'Профилированный')},
+}
+_CATEGORY_PATHS = tuple((l1, l2, l3) for l1, level2 in _CATEGORY_TREE.items()
+                        for l2, level3 in level2.items() for l3 in level3)
+_UNITS = ('шт', 'м2', 'м3', 'кг', 'упак', 'м')
+
+
+def make_product(index: int, rng: random.Random) -> dict:
+    """
+    Карточка товара с номером index в том виде, в каком ее возвращает
+    parser.parse_product_card (categories и features — JSON-строки, raw_html не заполнен).
+    """
+    product_id = 100000 + index
+    brand = rng.choice(_BRANDS)
+    thickness = rng.choice((6, 8, 9.5, 10, 12, 12.5, 15, 20, 50, 100))
+    title = (f"{rng.choice(_NOUNS)} {rng.choice(_ADJECTIVES)} {brand} "
+             f"{rng.randint(1, 300)}x{rng.randint(1, 300)} мм {thickness} мм")
+    features = {
+        'Бренд': brand,
+        'Модель': f"{brand[:3].upper()}-{rng.randint(100, 999)}",
+        'Толщина': f"{thickness} мм".replace('.', ','),
+        'Вес, кг': str(rng.randint(1, 60)),
+        'Цвет': rng.choice(('серый', 'белый', 'бежевый', 'черный')),
+        'Страна производства': rng.choice(('Россия', 'Германия', 'Финляндия', 'Беларусь')),
+    }
+    retail_price = round(rng.uniform(10, 20000), 2)
+    return {
+        'url': f"{parser.BASE_URL}/product/{product_id}/",
+        'title': title,
+        'product_id': product_id,
+        'gold_price': round(retail_price * 0.95, 2),
+        'retail_price': retail_price,
+        'unit': rng.choice(_UNITS),
+        'categories': json.dumps(list(rng.choice(_CATEGORY_PATHS)), ensure_ascii=False),
+        'features': json.dumps(features, ensure_ascii=False),
+    }
+
+
+def _format_price(price: float) -> str:
+    """Цена в разметке сайта: разряды через тонкий пробел, копейки через запятую."""
+    return f"{price:,.2f}".replace(',', '\u2009').replace('.', ',') + '\u00a0₽'
+
+
+def render_card_html(product: dict) -> str:
+    """HTML карточки товара в разметке листинга (по селекторам parser.parse_product_card)."""
+    escape = html.escape
+    categories = json.loads(product['categories'])
+    features = json.loads(product['features'])
+    breadcrumbs = ''.join(f'<a href="/catalog/{100 + level}/" class="breadcrumbs-link">{escape(name)}</a>'
+                          for level, name in enumerate(categories))
+    description = '<br>'.join(f'{escape(key)}: {escape(value)}' for key, value in features.items())
+    unit_tabs = ''.join(
+        f'<div class="price-switcher-tab{" tab-active" if unit == product["unit"] else ""}" '
+        f'data-test="price-switcher-tab"><span>{escape(unit)}</span></div>'
+        for unit in dict.fromkeys((product['unit'], 'шт'))
+    )
+    product_path = product['url'][len(parser.BASE_URL):]
+    return (
+        f'<div data-test="product-card-catalog-wide" class="product-card product-card--wide">'
+        f'<div class="product-card__image"><a href="{product_path}" tabindex="-1">'
+        f'<img src="/static/img/{product["product_id"]}.webp" alt="{escape(product["title"])}" loading="lazy" '
+        f'width="220" height="220"></a>'
+        f'<button class="favorite-button" aria-label="В избранное"><svg viewBox="0 0 24 24" width="24" height="24">'
+        f'<path d="M12 21.35l-1.45-1.32C5.4 15.36 2 12.28 2 8.5 2 5.42 4.42 3 7.5 3c1.74 0 3.41.81 4.5 2.09"></path>'
+        f'</svg></button></div>'
+        f'<div class="product-card__info">'
+        f'<div data-test="product-breadcrumbs" class="product-card__breadcrumbs">{breadcrumbs}</div>'
+        f'<a data-test="product-link" href="{product_path}" class="product-card__link">'
+        f'<span data-test="product-title" class="product-card__title">{escape(product["title"])}</span></a>'
+        f'<p data-test="product-code" class="product-card__code">{product["product_id"]}</p>'
+        f'<p data-test="product-description" class="product-card__description">{description}</p></div>'
+        f'<div class="product-card__price">'
+        f'<div class="price-switcher">{unit_tabs}</div>'
+        f'<p data-test="product-gold-price" class="price price--gold">{_format_price(product["gold_price"])}</p>'
+        f'<p data-test="product-retail-price" class="price price--retail">{_format_price(product["retail_price"])}</p>'
+        f'<button data-test="add-to-cart" class="button button--primary">В корзину</button></div>'
+        f'</div>'
+    )
+
+
+def render_listing_page(products: list, page_num: int = 1, page_count: int = 1) -> str:
+    """Страница листинга категории с карточками products и пагинацией."""
+    pagination = ''.join(f'<a href="/catalog/101/?p={number}" class="pagination__link">{number}</a>'
+                         for number in range(1, page_count + 1))
+    cards = '\n'.join(render_card_html(product) for product in products)
+    return (
+        '<!DOCTYPE html>\n<html lang="ru"><head><meta charset="utf-8"><title>Каталог — Петрович</title>'
+        '<link rel="stylesheet" href="/static/css/app.css">'
+        '<script>window.__INITIAL_STATE__ = {"page": %d, "region": "spb"};</script>'
+        '<style>.product-card{display:flex}.price--gold{color:#c90}</style></head>\n'
+        '<body><header class="header"><nav class="header__menu"><a href="/catalog/">Каталог</a>'
+        '<a href="/promo/">Акции</a></nav></header>\n<main class="listing">'
+        '<h1 class="listing__title">Строительные материалы</h1>'
+        '<span data-test="products-count" class="listing__count">%d</span>\n'
+        '<div class="listing__items">\n%s\n</div>\n<nav class="pagination">%s</nav></main>\n'
+        '<footer class="footer">© Петрович</footer><script src="/static/js/app.js" defer></script></body></html>\n'
+    ) % (page_num, len(products) * page_count, cards, pagination)
+
+
+def iter_products(count: int, seed: int = 0, start: int = 0):
+    """Генератор: count карточек с номерами start, start+1, ... (одинаковы для одного seed)."""
+    rng = random.Random(seed)
+    for index in range(start, start + count):
+        yield make_product(index, rng)
+
+
+def generate_raw_db(source_name: str, count: int, seed: int = 0, is_test: bool = False) -> str:
+    """
+    Создает RAW базу источника с count товарами (без HTML карточек), parsed_at
+    распределен по CRAWL_DAYS дням обхода. Пишет напрямую пакетами, минуя
+    RawWriter, чтобы генерация миллионов строк не мерила запись RAW. Возвращает путь к базе.
+    """
+    database.init_raw_db(source_name, is_test=is_test)
+    db_path = database.get_raw_db_path(source_name, is_test=is_test)
+    conn = database.get_db_connection(db_path)
+    for pragma in database.RAW_WRITER_PRAGMAS:
+        conn.execute(pragma)
+    seconds_per_product = CRAWL_DAYS * 86400 / max(count, 1)
+    batch = []
+    try:
+        for index, product in enumerate(iter_products(count, seed)):
+            parsed_at = FIRST_CRAWL_DATE + timedelta(seconds=int(index * seconds_per_product))
+            batch.append((str(product['product_id']), product['url'], product['title'], product['gold_price'],
+                          product['retail_price'], product['unit'], product['categories'], product['features'],
+                          parsed_at.strftime('%Y-%m-%d %H:%M:%S')))
+            if len(batch) >= GENERATE_BATCH_SIZE:
+                _insert_raw_batch(conn, batch)
+                batch = []
+        _insert_raw_batch(conn, batch)
+    finally:
+        conn.close()
+    return db_path
+
+
+def _insert_raw_batch(conn, rows: list):
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO products
+                (product_id, url, title, gold_price, retail_price, unit, categories, features, parsed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+
+def generate_estimate_workbook(file_path: str, rows_count: int, seed: int = 0) -> str:
+    """
+    Пишет Excel-смету в формате, который читает upload_excel.py: шапка документа,
+    строка заголовков COLUMNS_MAP и rows_count строк ресурсов. Возвращает путь к файлу.
+    """
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Смета')
+    sheet.append(['Локальный сметный расчет № 1'])
+    sheet.append(['Объект: жилой дом, секция 1'])
+    sheet.append([])
+    sheet.append(['№ п/п', *upload_excel.COLUMNS_MAP, 'Количество', 'Стоимость, руб.'])
+    for index, product in enumerate(iter_products(rows_count, seed)):
+        price = product['retail_price']
+        quantity = rng.randint(1, 500)
+        sheet.append([index + 1, f"{rng.randint(1, 99):02d}.{rng.randint(1, 9999):04d}-{index}",
+                      product['title'], product['unit'], price, quantity, round(price * quantity, 2)])
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    workbook.save(file_path)
+    return file_path
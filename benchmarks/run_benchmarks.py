@@ -0,0 +1,350 @@
+# benchmarks/run_benchmarks.py
+
+# Офлайн-бенчмарки конвейера: без сети и без браузера.
+#
+#   parse_cards_bs4 / parse_cards_lxml — разбор сохраненных страниц листинга
+#                                        (benchmarks/fixtures/*.html), карточек в секунду;
+#   raw_write                          — запись карточек в RAW через RawWriter;
+#   raw_to_ods                         — перенос RAW -> ODS (main_dwh.build_ods) на синтетической RAW базе;
+#   ods_to_dds_python / ods_to_dds_sql — построение DDS обоими движками (main_dwh.build_dds);
+#   excel_ingest                       — загрузка сгенерированных Excel-смет (upload_excel.py).
+#
+# Все базы создаются во временном каталоге, рабочие data/ не затрагиваются.
+# Каждый бенчмарк замеряется несколько раз (не меньше --repeats и, пока замеры
+# в сумме не займут MIN_BENCH_SECONDS, до MAX_BENCH_REPEATS) на пустой целевой
+# базе; в результат идет медианный замер — одиночный замер в доли секунды
+# слишком шумный, а лучший зависит от того, попал ли он в случайное затишье машины.
+# Результат пишется в JSON (benchmarks/results/latest.json) и сравнивается
+# с baseline.json того же размера, снятым на той же машине: если пропускная
+# способность какого-либо бенчмарка упала больше чем на --threshold, запуск
+# завершается с кодом 1.
+#
+# Запуск из корня проекта:
+#   python -m benchmarks.run_benchmarks                      # 10 000 товаров
+#   python -m benchmarks.run_benchmarks --scale 1000000 --repeats 1 --only raw_to_ods ods_to_dds_sql
+#   python -m benchmarks.run_benchmarks --update-baseline    # сохранить результат как эталон
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from src.common import database
+from src.dwh_builder import main_dwh
+from src.dwh_builder import upload_excel
+from src.raw_data_parser import fast_parser
+
+from benchmarks import generators
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, 'fixtures')
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+RESULTS_PATH = os.path.join(BENCHMARKS_DIR, 'results', 'latest.json')
+
+DEFAULT_SCALE = 10000
+# Допустимое падение пропускной способности относительно эталона (0.2 = на 20%)
+DEFAULT_THRESHOLD = 0.2
+# Один замер разбора — проходы по фикстурам, пока не наберется столько секунд
+MIN_PARSE_SECONDS = 0.5
+# Сколько раз замеряется каждый бенчмарк: не меньше DEFAULT_REPEATS, а короткие —
+# пока замеры в сумме не займут MIN_BENCH_SECONDS, но не больше MAX_BENCH_REPEATS
+DEFAULT_REPEATS = 5
+MIN_BENCH_SECONDS = 5.0
+MAX_BENCH_REPEATS = 50
+# Excel-сметы: сколько файлов, и не больше скольких строк в одном (остальное урезается)
+EXCEL_FILES = 4
+EXCEL_MAX_ROWS = 250000
+
+SOURCE_NAME = 'bench'
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Подавляет вывод конвейера (print, tqdm), чтобы он не мешал отчету бенчмарков."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def _timed(function, *args, **kwargs) -> float:
+    """Выполняет функцию без ее вывода и возвращает время в секундах."""
+    with _quiet():
+        started = time.perf_counter()
+        function(*args, **kwargs)
+        return time.perf_counter() - started
+
+
+def _result(items: int, seconds: float, unit: str) -> dict:
+    return {'items': items, 'seconds': round(seconds, 4), 'unit': unit,
+            'items_per_sec': round(items / seconds, 1) if seconds else None}
+
+
+def _fresh_dir(path: str) -> str:
+    """Пустой каталог для целевой базы очередного замера."""
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+# --- Бенчмарки ---
+# Каждый принимает контекст (scale, workdir и т.п.) и возвращает _result(...) одного замера.
+# Замер повторяется: входные данные готовятся один раз и кэшируются в контексте,
+# а целевая база каждый раз создается заново
+
+def _load_fixtures() -> list:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))):
+        with open(path, encoding='utf-8') as f:
+            pages.append(f.read())
+    if not pages:
+        raise FileNotFoundError(f"В {FIXTURES_DIR} нет HTML-фикстур страниц листинга")
+    return pages
+
+
+def _bench_parse(engine: str):
+    def bench(context: dict) -> dict:
+        pages = _load_fixtures()
+        parse_listing = fast_parser.get_listing_parser(engine)
+        cards_count = 0
+        started = time.perf_counter()
+        while True:
+            for html in pages:
+                cards_count += len(parse_listing(html))
+            elapsed = time.perf_counter() - started
+            if elapsed >= MIN_PARSE_SECONDS:
+                return _result(cards_count, elapsed, 'cards')
+    return bench
+
+
+def bench_raw_write(context: dict) -> dict:
+    """Запись scale карточек с HTML через RawWriter (как при парсинге) в пустую RAW базу."""
+    source_name = f"{SOURCE_NAME}_write"
+    products = context.get('raw_write_products')
+    if products is None:
+        products = context['raw_write_products'] = []
+        for product in generators.iter_products(context['scale'], context['seed']):
+            product['raw_html'] = generators.render_card_html(product)
+            products.append(product)
+    database.RAW_DATA_DIR = _fresh_dir(os.path.join(context['workdir'], 'raw_write'))
+    with _quiet():
+        database.init_raw_db(source_name)
+
+    def write():
+        with database.RawWriter(source_name) as raw_writer:
+            for product in products:
+                raw_writer.add(product)
+    return _result(len(products), _timed(write), 'products')
+
+
+def _ensure_raw(context: dict):
+    """Синтетическая RAW база из scale товаров (генерируется один раз, без замера)."""
+    if not context.get('raw_ready'):
+        with _quiet():
+            generators.generate_raw_db(SOURCE_NAME, context['scale'], context['seed'])
+        context['raw_ready'] = True
+
+
+def bench_raw_to_ods(context: dict) -> dict:
+    """Перенос в пустую ODS синтетической RAW базы из scale товаров (генерация в замер не входит)."""
+    _ensure_raw(context)
+    _fresh_dir(database.ODS_DATA_DIR)
+    seconds = _timed(main_dwh.build_ods, SOURCE_NAME, full_refresh=True)
+    context['ods_ready'] = True
+    return _result(context['scale'], seconds, 'products')
+
+
+def _ensure_ods(context: dict):
+    """ODS для бенчмарков DDS: если raw_to_ods не запускался, RAW и ODS готовятся без замера."""
+    if not context.get('ods_ready'):
+        _ensure_raw(context)
+        with _quiet():
+            main_dwh.build_ods(SOURCE_NAME, full_refresh=True)
+        context['ods_ready'] = True
+
+
+def _bench_ods_to_dds(engine: str):
+    def bench(context: dict) -> dict:
+        _ensure_ods(context)
+        # У каждого движка своя пустая DDS база
+        database.DDS_DATA_DIR = _fresh_dir(os.path.join(context['workdir'], f'dds_{engine}'))
+        seconds = _timed(main_dwh.build_dds, SOURCE_NAME, full_refresh=True, dds_engine=engine)
+        return _result(context['scale'], seconds, 'products')
+    return bench
+
+
+def bench_excel_ingest(context: dict) -> dict:
+    """Загрузка EXCEL_FILES сгенерированных смет (всего scale строк) в пустую таблицу fact_estimates."""
+    rows_per_file = min(max(context['scale'] // EXCEL_FILES, 1), EXCEL_MAX_ROWS)
+    excel_dir = os.path.join(context['workdir'], 'estimates')
+    paths = context.get('excel_paths')
+    if paths is None:
+        with _quiet():
+            paths = context['excel_paths'] = [
+                generators.generate_estimate_workbook(os.path.join(excel_dir, f'estimate_{number}.xlsx'),
+                                                      rows_per_file, seed=context['seed'] + number)
+                for number in range(EXCEL_FILES)]
+    database.DDS_DATA_DIR = _fresh_dir(os.path.join(context['workdir'], 'dds_estimates'))
+    conn = database.get_db_connection(database.get_dds_db_path())
+    try:
+        def ingest():
+            upload_excel.init_estimates_table(conn)
+            upload_excel.load_estimate_files(conn, upload_excel.find_new_files(conn, paths), workers=1)
+        seconds = _timed(ingest)
+    finally:
+        conn.close()
+    return _result(rows_per_file * EXCEL_FILES, seconds, 'rows')
+
+
+BENCHMARKS = {
+    'parse_cards_bs4': _bench_parse('bs4'),
+    'parse_cards_lxml': _bench_parse('lxml'),
+    'raw_write': bench_raw_write,
+    'raw_to_ods': bench_raw_to_ods,
+    'ods_to_dds_python': _bench_ods_to_dds('python'),
+    'ods_to_dds_sql': _bench_ods_to_dds('sql'),
+    'excel_ingest': bench_excel_ingest,
+}
+
+
+# --- Эталон и сравнение ---
+
+def load_baseline(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _run_repeated(bench, context: dict, repeats: int) -> dict:
+    """
+    Замеряет бенчмарк не меньше repeats раз, а короткий — пока замеры в сумме
+    не займут MIN_BENCH_SECONDS (не больше MAX_BENCH_REPEATS). Возвращает результат
+    медианного замера с числом замеров и лучшим временем.
+    """
+    runs = []
+    while len(runs) < repeats or (sum(run['seconds'] for run in runs) < MIN_BENCH_SECONDS
+                                  and len(runs) < MAX_BENCH_REPEATS):
+        database.RAW_DATA_DIR = os.path.join(context['workdir'], 'raw')
+        database.ODS_DATA_DIR = os.path.join(context['workdir'], 'ods')
+        database.DDS_DATA_DIR = os.path.join(context['workdir'], 'dds')
+        runs.append(bench(context))
+    runs.sort(key=lambda run: run['seconds'] / run['items'])
+    result = dict(runs[(len(runs) - 1) // 2])
+    result['runs'] = len(runs)
+    result['best_seconds'] = runs[0]['seconds']
+    return result
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Сравнивает пропускную способность (по медианному замеру) с эталоном. Возвращает список строк
+    с описанием регрессий (пустой — регрессий нет). Бенчмарки, которых нет
+    в эталоне, не сравниваются.
+    """
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        reference = baseline['benchmarks'].get(name)
+        if not reference or not reference.get('items_per_sec') or not result.get('items_per_sec'):
+            continue
+        ratio = result['items_per_sec'] / reference['items_per_sec']
+        result['baseline_items_per_sec'] = reference['items_per_sec']
+        result['ratio'] = round(ratio, 3)
+        if ratio < 1 - threshold:
+            regressions.append(f"{name}: {result['items_per_sec']} {result['unit']}/s против "
+                               f"{reference['items_per_sec']} в эталоне ({ratio:.0%})")
+    return regressions
+
+
+def _write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def run_benchmarks(names: list, scale: int, seed: int = 0, repeats: int = DEFAULT_REPEATS) -> dict:
+    """Запускает бенчмарки names во временном каталоге и возвращает результаты."""
+    workdir = tempfile.mkdtemp(prefix='petrovich_bench_')
+    data_dirs = (database.RAW_DATA_DIR, database.ODS_DATA_DIR, database.DDS_DATA_DIR)
+    context = {'scale': scale, 'seed': seed, 'workdir': workdir}
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'seed': seed,
+        'repeats': repeats,
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPU",
+        'benchmarks': {},
+    }
+    try:
+        for name in names:
+            print(f"{name}...", end=' ', flush=True)
+            result = _run_repeated(BENCHMARKS[name], context, repeats)
+            results['benchmarks'][name] = result
+            print(f"{result['items_per_sec']} {result['unit']}/s ({result['items']} за {result['seconds']} с, "
+                  f"медиана {result['runs']} замеров, лучший {result['best_seconds']} с)")
+    finally:
+        database.RAW_DATA_DIR, database.ODS_DATA_DIR, database.DDS_DATA_DIR = data_dirs
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Офлайн-бенчмарки конвейера парсинга и DWH.')
+    arg_parser.add_argument('--scale', type=int, default=DEFAULT_SCALE,
+                            help='число товаров в синтетических данных (10k - 5M)')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                            help='запустить только эти бенчмарки')
+    arg_parser.add_argument('--baseline', default=BASELINE_PATH, help='файл эталона')
+    arg_parser.add_argument('--output', default=RESULTS_PATH, help='куда записать результаты (JSON)')
+    arg_parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                            help='минимальное число замеров каждого бенчмарка (в результат идет медианный)')
+    arg_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='допустимое падение пропускной способности, доля (0.2 = 20%%)')
+    arg_parser.add_argument('--update-baseline', action='store_true',
+                            help='записать результаты в файл эталона вместо сравнения')
+    args = arg_parser.parse_args(argv)
+
+    print(f"Бенчмарки на {args.scale} товарах: {', '.join(args.only)}")
+    results = run_benchmarks(args.only, args.scale, args.seed, args.repeats)
+
+    if args.update_baseline:
+        _write_json(args.baseline, results)
+        print(f"Эталон сохранен: {args.baseline}")
+        return 0
+
+    regressions = []
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"Эталон {args.baseline} не найден, сравнение пропущено.")
+    elif baseline.get('scale') != args.scale:
+        print(f"Эталон снят на {baseline.get('scale')} товарах, а не на {args.scale}: сравнение пропущено.")
+    elif baseline.get('machine') != results['machine']:
+        # Пропускная способность на другой машине несравнима: снимите эталон здесь (--update-baseline)
+        print(f"Эталон снят на другой машине ({baseline.get('machine')}, здесь {results['machine']}): "
+              f"сравнение пропущено.")
+    else:
+        regressions = find_regressions(results, baseline, args.threshold)
+    results['threshold'] = args.threshold
+    results['regressions'] = regressions
+    _write_json(args.output, results)
+    print(f"Результаты записаны: {args.output}")
+
+    if regressions:
+        print(f"\nРЕГРЕССИЯ производительности (порог {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+# benchmarks/save_fixture.py
+
+# Сохраняет живую страницу листинга в benchmarks/fixtures/, чтобы бенчмарки
+# разбора карточек шли на актуальной разметке сайта (нужны сеть и, для
+# fetch_mode='selenium', браузер). Сами бенчмарки сеть не используют.
+#
+#   python -m benchmarks.save_fixture https://moscow.petrovich.ru/catalog/1281/ listing_page_1.html
+
+import argparse
+import os
+
+from src.raw_data_parser import fast_parser
+from src.raw_data_parser import fetchers
+
+from benchmarks.run_benchmarks import FIXTURES_DIR
+
+
+def save_fixture(url: str, filename: str, fetch_mode: str = 'auto') -> str:
+    """Загружает страницу и сохраняет ее HTML в FIXTURES_DIR. Возвращает путь к файлу."""
+    fetcher = fetchers.create_fetcher(fetch_mode)
+    if not fetcher:
+        raise RuntimeError("Не удалось запустить загрузчик страниц")
+    try:
+        html = fetcher.fetch_html(url)
+    finally:
+        fetcher.close()
+    cards = fast_parser.get_listing_parser('lxml')(html or '')
+    if not cards:
+        raise ValueError(f"На странице {url} не найдено карточек товаров, фикстура не сохранена")
+    path = os.path.join(FIXTURES_DIR, filename)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    print(f"Сохранено {len(cards)} карточек: {path}")
+    return path
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Сохранить страницу листинга как фикстуру бенчмарков.')
+    arg_parser.add_argument('url')
+    arg_parser.add_argument('filename')
+    arg_parser.add_argument('--fetch-mode', default='auto', choices=fetchers.FETCH_MODES)
+    args = arg_parser.parse_args()
+    save_fixture(args.url, args.filename, args.fetch_mode)
@@ -9,8 +9,19 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 # Импортируем наши модули-оркестраторы
 from raw_data_parser import main_parser
 from dwh_builder import main_dwh
+from dwh_builder import estimate_matching
+from dwh_builder import parquet_export
 
-def run_pipeline_for_source(source_name: str, is_test: bool = False):
+def run_pipeline_for_source(source_name: str, is_test: bool = False, parser_workers: int = 1,
+                            fetch_mode: str = 'auto', parser_engine: str = 'sync',
+                            parser_concurrency: int = 8, parse_engine: str = 'lxml',
+                            fingerprint_pages: int = 1, full_recrawl_days: float = 7, restart_crawl: bool = False,
+                            category_tree_ttl_hours: float = 24, refresh_category_tree: bool = False,
+                            request_interval: float = 1.0,
+                            full_dwh_refresh: bool = False, dwh_chunk_size: int = 5000,
+                            transform_workers: int = 1, dds_engine: str = 'python',
+                            match_estimates: bool = True, full_rematch: bool = False,
+                            export_parquet: bool = True, full_parquet_export: bool = False):
     """
     Запускает полный конвейер (ETL) для одного источника
     с поддержкой тестового режима.
@@ -29,7 +40,13 @@ def run_pipeline_for_source(source_name: str, is_test: bool = False):
         print(f"\n[ЭТАП 1/2] Запуск парсера для '{source_name}'...")
         try:
             # Передаем флаг is_test в функцию парсера
-            main_parser.run_petrovich_parser(is_test=is_test)
+            main_parser.run_petrovich_parser(is_test=is_test, workers=parser_workers, fetch_mode=fetch_mode,
+                                             engine=parser_engine, concurrency=parser_concurrency,
+                                             parse_engine=parse_engine, fingerprint_pages=fingerprint_pages,
+                                             full_refresh_days=full_recrawl_days, restart_crawl=restart_crawl,
+                                             category_tree_ttl_hours=category_tree_ttl_hours,
+                                             refresh_category_tree=refresh_category_tree,
+                                             request_interval=request_interval)
             print(f"[ЭТАП 1/2] Сбор сырых данных для '{source_name}' успешно завершен.")
         except Exception as e:
             print(f"[ЭТАП 1/2] КРИТИЧЕСКАЯ ОШИБКА ПАРСЕРА: {e}")
@@ -43,7 +60,15 @@ def run_pipeline_for_source(source_name: str, is_test: bool = False):
     print(f"\n[ЭТАП 2/2] Запуск трансформации данных и построение DWH для '{source_name}'...")
     try:
         # Передаем оба параметра: имя источника и флаг теста
-        main_dwh.run_dwh_build(source_name=source_name, is_test=is_test)
+        main_dwh.run_dwh_build(source_name=source_name, is_test=is_test, full_refresh=full_dwh_refresh,
+                               chunk_size=dwh_chunk_size, transform_workers=transform_workers,
+                               dds_engine=dds_engine)
+        # Колоночная выгрузка витрины для BI: новые партиции data/parquet/source=.../crawl_date=...
+        if export_parquet:
+            parquet_export.export_source_to_parquet(source_name, is_test=is_test, full_refresh=full_parquet_export)
+        # Сопоставление загруженных смет (upload_excel.py) с обновленной витриной товаров
+        if match_estimates:
+            estimate_matching.run_estimate_matching(source_name, is_test=is_test, full_rematch=full_rematch)
     except Exception as e:
         print(f"[ЭТАП 2/2] КРИТИЧЕСКАЯ ОШИБКА ТРАНСФОРМАЦИИ: {e}")
 
@@ -58,5 +83,61 @@ if __name__ == "__main__":
     # === КОНФИГУРАЦИЯ ИСТОЧНИКА ===
     # Здесь мы определяем, какой источник обрабатывать.
     SOURCE_TO_PROCESS = "petrovich"
+
+    # === КОНФИГУРАЦИЯ ПАРСЕРА ===
+    # Количество процессов-воркеров, у каждого свой браузер. 1 = последовательный обход.
+    PARSER_WORKERS = 1
+    # Способ загрузки страниц: 'auto' (HTTP с откатом на браузер), 'http' или 'selenium'
+    FETCH_MODE = 'auto'
+    # Движок обхода: 'sync' (загрузчик страниц + процессы) или 'async' (асинхронный HTTP)
+    PARSER_ENGINE = 'sync'
+    # Для 'async': сколько запросов к сайту может быть в полете одновременно
+    PARSER_CONCURRENCY = 8
+    # Движок извлечения карточек: 'lxml' (быстрый, один проход по странице) или 'bs4' (эталонный)
+    PARSE_ENGINE = 'lxml'
+    # Сколько первых страниц категории сверять с прошлым обходом: если они не изменились,
+    # остальные страницы не загружаются (0 — всегда обходить категории целиком)
+    FINGERPRINT_PAGES = 1
+    # Раз во сколько дней категория обходится целиком независимо от отпечатков
+    FULL_RECRAWL_DAYS = 7
+    # True — начать обход всех категорий заново; False — продолжить прерванный обход
+    # с той страницы, на которой он остановился (прогресс хранится в crawl_frontier RAW базы)
+    RESTART_CRAWL = False
+    # Сколько часов список категорий берется из кэша data/category_tree.json, не загружая каталог
+    CATEGORY_TREE_TTL_HOURS = 24
+    # True — загрузить каталог заново, даже если кэш категорий еще свежий
+    REFRESH_CATEGORY_TREE = False
+    # Минимальный интервал (в секундах) между запросами одного загрузчика/воркера — вежливость к сайту.
+    # Готовность страницы браузер теперь ждет по появлению карточек, а не фиксированной паузой
+    REQUEST_INTERVAL = 1.0
+
+    # === КОНФИГУРАЦИЯ DWH ===
+    # False — переносить в ODS/DDS только изменившиеся с прошлой сборки строки,
+    # True — пересобрать слои целиком (например, после изменения логики трансформации)
+    FULL_DWH_REFRESH = False
+    # Сколько строк читается и записывается за одну транзакцию при сборке DWH
+    DWH_CHUNK_SIZE = 5000
+    # Количество процессов для трансформации RAW -> ODS. 1 = последовательно.
+    TRANSFORM_WORKERS = 1
+    # Движок построения DDS: 'python' (построчно) или 'sql' (INSERT ... SELECT внутри SQLite)
+    DDS_ENGINE = 'python'
+    # Сопоставлять ли строки смет (fact_estimates) с товарами после сборки DWH
+    MATCH_ESTIMATES = True
+    # True — сопоставить заново все строки смет; False — только новые и затронутые изменениями товаров
+    FULL_REMATCH = False
+    # Выгружать ли витрину товаров с измерениями в Parquet (data/parquet/), по партициям дней обхода
+    EXPORT_PARQUET = True
+    # True — выгрузить все партиции заново; False — дописать строки новее прошлой выгрузки
+    # (в том числе в партиции уже выгруженных дней — отдельными файлами)
+    FULL_PARQUET_EXPORT = False
     
-    run_pipeline_for_source(SOURCE_TO_PROCESS, is_test=TEST_MODE)
+    run_pipeline_for_source(SOURCE_TO_PROCESS, is_test=TEST_MODE, parser_workers=PARSER_WORKERS,
+                            fetch_mode=FETCH_MODE, parser_engine=PARSER_ENGINE,
+                            parser_concurrency=PARSER_CONCURRENCY, parse_engine=PARSE_ENGINE,
+                            fingerprint_pages=FINGERPRINT_PAGES, full_recrawl_days=FULL_RECRAWL_DAYS,
+                            restart_crawl=RESTART_CRAWL, category_tree_ttl_hours=CATEGORY_TREE_TTL_HOURS,
+                            refresh_category_tree=REFRESH_CATEGORY_TREE, request_interval=REQUEST_INTERVAL,
+                            full_dwh_refresh=FULL_DWH_REFRESH, dwh_chunk_size=DWH_CHUNK_SIZE,
+                            transform_workers=TRANSFORM_WORKERS, dds_engine=DDS_ENGINE,
+                            match_estimates=MATCH_ESTIMATES, full_rematch=FULL_REMATCH,
+                            export_parquet=EXPORT_PARQUET, full_parquet_export=FULL_PARQUET_EXPORT)
@@ -1,13 +1,16 @@
 # src/common/database.py
 
 import sqlite3
+import hashlib
 import os
+import zlib
 
 # --- КОНФИГУРАЦИЯ ПУТЕЙ (остается без изменений) ---
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 RAW_DATA_DIR = os.path.join(BASE_DIR, 'data', 'raw')
 ODS_DATA_DIR = os.path.join(BASE_DIR, 'data', 'ods')
 DDS_DATA_DIR = os.path.join(BASE_DIR, 'data', 'dds')
+PARQUET_DATA_DIR = os.path.join(BASE_DIR, 'data', 'parquet')
 
 # --- УНИВЕРСАЛЬНАЯ ФУНКЦИЯ (переименована для ясности) ---
 def get_db_connection(db_path: str) -> sqlite3.Connection:
@@ -39,30 +42,255 @@ def init_raw_db(source_name: str, is_test: bool = False):
         categories TEXT,
         features TEXT,
         raw_html TEXT,
-        parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        parsed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        html_hash TEXT,
+        last_seen_at TIMESTAMP
     )
     ''')
+    # HTML карточек хранится сжатым, по одному экземпляру на уникальное содержимое.
+    # В products.raw_html остаются только данные, записанные до появления этой таблицы.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS raw_html_blobs (
+        html_hash TEXT PRIMARY KEY,
+        html BLOB NOT NULL
+    )
+    ''')
+    # Отпечатки страниц листинга (см. raw_data_parser/fingerprints.py): по ним
+    # повторный обход пропускает категории, первые страницы которых не изменились
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS listing_fingerprints (
+        category_url TEXT NOT NULL,
+        page_num INTEGER NOT NULL,
+        fingerprint TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (category_url, page_num)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS category_crawl_state (
+        category_url TEXT PRIMARY KEY,
+        last_full_crawl_at TIMESTAMP,
+        last_checked_at TIMESTAMP
+    )
+    ''')
+    # Фронтир обхода (см. raw_data_parser/frontier.py): статус, следующая страница,
+    # аренда и число товаров (из дерева категорий) каждой категории
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_frontier (
+        category_url TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'pending',
+        next_page INTEGER NOT NULL DEFAULT 1,
+        seen_first_urls TEXT,
+        lease_owner TEXT,
+        lease_expires_at TIMESTAMP,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        item_count INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    _add_missing_columns(cursor, 'crawl_frontier', {'item_count': 'INTEGER'})
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_crawl_frontier_status ON crawl_frontier (status, lease_expires_at)')
+    _add_missing_columns(cursor, 'products', {'html_hash': 'TEXT', 'last_seen_at': 'TIMESTAMP'})
+    # Индекс для инкрементальной сборки DWH (выборка строк новее водяного знака)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_parsed_at ON products (parsed_at)')
     conn.commit()
+    _migrate_raw_html_to_blobs(conn)
     conn.close()
 
-def save_product_to_raw_db(source_name: str, product_data: dict, is_test: bool = False):
-    """Сохраняет одну карточку товара в RAW базу конкретного источника."""
-    db_path = get_raw_db_path(source_name, is_test=is_test)
-    conn = get_db_connection(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
+def _add_missing_columns(cursor, table_name: str, columns: dict) -> list:
+    """
+    Добавляет в существующую таблицу колонки, которых в ней еще нет (миграция старых баз).
+    Возвращает имена добавленных колонок.
+    """
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table_name})')}
+    added = []
+    for column_name, column_type in columns.items():
+        if column_name not in existing:
+            cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}')
+            added.append(column_name)
+    return added
+
+def _migrate_raw_html_to_blobs(conn: sqlite3.Connection, chunk_size: int = 1000):
+    """Переносит несжатый raw_html старых записей в raw_html_blobs."""
+    while True:
+        rows = conn.execute(
+            'SELECT product_id, raw_html FROM products WHERE raw_html IS NOT NULL LIMIT ?', (chunk_size,)
+        ).fetchall()
+        if not rows:
+            return
+        with conn:
+            for product_id, raw_html in rows:
+                html_hash = compute_html_hash(raw_html)
+                conn.execute('INSERT OR IGNORE INTO raw_html_blobs (html_hash, html) VALUES (?, ?)',
+                             (html_hash, compress_html(raw_html)))
+                conn.execute('UPDATE products SET html_hash = ?, raw_html = NULL WHERE product_id = ?',
+                             (html_hash, product_id))
+
+# --- СЖАТОЕ ХРАНЕНИЕ raw_html ---
+
+RAW_HTML_COMPRESSION_LEVEL = 6
+
+def compute_html_hash(raw_html: str) -> str:
+    """Хеш содержимого карточки: ключ в raw_html_blobs."""
+    return hashlib.sha1(raw_html.encode('utf-8')).hexdigest()
+
+def compress_html(raw_html: str) -> bytes:
+    return zlib.compress(raw_html.encode('utf-8'), RAW_HTML_COMPRESSION_LEVEL)
+
+def decompress_html(blob: bytes) -> str:
+    return zlib.decompress(blob).decode('utf-8')
+
+def get_raw_html(conn: sqlite3.Connection, product_id) -> str:
+    """
+    Возвращает исходный HTML карточки товара из RAW базы, прозрачно
+    распаковывая его из raw_html_blobs (или беря из старой колонки raw_html).
+    """
+    row = conn.execute('''
+        SELECT p.raw_html, b.html FROM products p
+        LEFT JOIN raw_html_blobs b ON b.html_hash = p.html_hash
+        WHERE p.product_id = ?
+    ''', (product_id,)).fetchone()
+    if not row:
+        return None
+    legacy_html, blob = row
+    return decompress_html(blob) if blob is not None else legacy_html
+
+RAW_INSERT_SQL = '''
     INSERT OR REPLACE INTO products (
         product_id, url, title, gold_price, retail_price, unit, 
-        categories, features, raw_html
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+        categories, features, html_hash, last_seen_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+'''
+
+RAW_TOUCH_SQL = 'UPDATE products SET last_seen_at = CURRENT_TIMESTAMP WHERE product_id = ?'
+
+def _raw_product_values(product_data: dict, html_hash: str) -> tuple:
+    """Превращает словарь карточки в кортеж параметров для RAW_INSERT_SQL."""
+    return (
         product_data.get('product_id'), product_data.get('url'), product_data.get('title'),
         product_data.get('gold_price'), product_data.get('retail_price'),
         product_data.get('unit'), product_data.get('categories'),
-        product_data.get('features'), product_data.get('raw_html')
-    ))
-    conn.commit()
-    conn.close()
+        product_data.get('features'), html_hash
+    )
+
+def save_product_to_raw_db(source_name: str, product_data: dict, is_test: bool = False):
+    """Сохраняет одну карточку товара в RAW базу конкретного источника."""
+    with RawWriter(source_name, is_test=is_test) as raw_writer:
+        raw_writer.add(product_data)
+
+# --- ПАКЕТНАЯ ЗАПИСЬ В RAW СЛОЙ ---
+
+# Прагмы для долгоживущего соединения записи: WAL позволяет читать базу
+# во время парсинга, а synchronous=NORMAL убирает fsync на каждый коммит.
+RAW_WRITER_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA busy_timeout=30000',
+)
+
+class RawWriter:
+    """
+    Писатель RAW слоя: держит одно соединение на всю сессию парсинга,
+    копит карточки в буфере и сбрасывает их одной транзакцией через executemany.
+    HTML карточек хранится сжатым в raw_html_blobs (см. compute_html_hash).
+
+    Используется как контекстный менеджер: при выходе (в том числе по
+    исключению или Ctrl-C) буфер сбрасывается, а соединение закрывается.
+    """
+
+    def __init__(self, source_name: str, is_test: bool = False, batch_size: int = 500):
+        self.source_name = source_name
+        self.is_test = is_test
+        self.batch_size = batch_size
+        self.total_written = 0
+        self.total_unchanged = 0
+        self._buffer = []
+        self.conn = get_db_connection(get_raw_db_path(source_name, is_test=is_test))
+        for pragma in RAW_WRITER_PRAGMAS:
+            self.conn.execute(pragma)
+
+    def add(self, product_data: dict):
+        """Кладет карточку в буфер; при достижении batch_size буфер сбрасывается."""
+        self._buffer.append(product_data)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self, checkpoint=None) -> int:
+        """
+        Записывает накопленные карточки одной транзакцией. Возвращает их число.
+        Карточки, HTML которых не изменился с прошлого раза, не перезаписываются:
+        у них обновляется только last_seen_at.
+        checkpoint(conn) выполняется в той же транзакции (например, сдвиг позиции
+        обхода во фронтире), так что товары и чекпоинт фиксируются атомарно.
+        """
+        if not self._buffer and checkpoint is None:
+            return 0
+        products, self._buffer = self._buffer, []
+        # Если товар встретился в буфере дважды, побеждает последняя версия
+        products = list({str(p.get('product_id')): p for p in products}.values())
+        hashes = [compute_html_hash(p['raw_html']) if p.get('raw_html') is not None else None
+                  for p in products]
+        with self.conn:
+            known_hashes = self._select_pairs(
+                'SELECT product_id, html_hash FROM products WHERE product_id IN ({})',
+                [str(p.get('product_id')) for p in products]
+            )
+            changed_rows, unchanged_ids, new_blobs = [], [], {}
+            for product_data, html_hash in zip(products, hashes):
+                product_id = str(product_data.get('product_id'))
+                if html_hash is not None and known_hashes.get(product_id) == html_hash:
+                    unchanged_ids.append((product_id,))
+                    continue
+                changed_rows.append(_raw_product_values(product_data, html_hash))
+                if html_hash is not None:
+                    new_blobs[html_hash] = product_data['raw_html']
+
+            # Одинаковый HTML (у разных товаров или в прошлых запусках) хранится один раз
+            stored_blobs = self._select_pairs(
+                'SELECT html_hash, 1 FROM raw_html_blobs WHERE html_hash IN ({})', list(new_blobs)
+            )
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO raw_html_blobs (html_hash, html) VALUES (?, ?)',
+                [(h, compress_html(html)) for h, html in new_blobs.items() if h not in stored_blobs]
+            )
+            self.conn.executemany(RAW_INSERT_SQL, changed_rows)
+            self.conn.executemany(RAW_TOUCH_SQL, unchanged_ids)
+            if checkpoint:
+                checkpoint(self.conn)
+        self.total_written += len(products)
+        self.total_unchanged += len(unchanged_ids)
+        return len(products)
+
+    def _select_pairs(self, sql_template: str, keys: list, chunk_size: int = 500) -> dict:
+        """Выполняет SELECT key, value ... WHERE key IN (...) порциями и возвращает словарь."""
+        result = {}
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            result.update(self.conn.execute(sql_template.format(placeholders), chunk).fetchall())
+        return result
+
+    def close(self):
+        """Сбрасывает остаток буфера и закрывает соединение."""
+        if self.conn is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
 
 # --- РАБОТА С ODS СЛОЕМ (НОВЫЙ БЛОК) ---
 
@@ -77,25 +305,197 @@ def init_ods_db(source_name: str, is_test: bool = False):
     conn = get_db_connection(db_path)
     cursor = conn.cursor()
     print(f"\nИнициализация ODS базы для '{source_name}' по пути: {db_path}")
+    # Переход на row_id — одной транзакцией: в режиме по умолчанию sqlite3 выполняет
+    # DDL вне транзакции, и прерванная миграция оставила бы строки в ods_products_old
+    cursor.execute('BEGIN')
+    try:
+        legacy_columns = _detach_legacy_ods_products(cursor)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ods_products (
+            row_id INTEGER PRIMARY KEY,
+            product_id TEXT NOT NULL UNIQUE,
+            url TEXT,
+            title TEXT,
+            gold_price REAL,
+            retail_price REAL,
+            unit TEXT,
+            brand TEXT,
+            model TEXT,
+            category_l1 TEXT,
+            category_l2 TEXT,
+            category_l3 TEXT,
+            category_l4 TEXT,
+            parsed_at TIMESTAMP,
+            features_text TEXT
+        )
+        ''')
+        if legacy_columns:
+            _attach_legacy_ods_products(cursor, legacy_columns)
+        else:
+            _recover_stranded_ods_products(cursor)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ods_products_parsed_at ON ods_products (parsed_at)')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    init_watermarks_table(conn)
+    attributes_exist = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ods_product_attributes'").fetchone()
+    _init_ods_attributes(cursor)
+    added_columns = _add_missing_columns(cursor, 'ods_products', {'features_text': 'TEXT'})
+    if added_columns or not attributes_exist:
+        # Характеристики есть только в RAW: сбрасываем водяной знак RAW -> ODS,
+        # чтобы следующая сборка перенесла все строки заново и заполнила новые колонки и таблицы
+        cursor.execute("DELETE FROM etl_watermarks WHERE source_name = ? AND stage = 'raw_to_ods'", (source_name,))
+    _init_ods_fts(cursor)
+    conn.commit()
+    conn.close()
+
+# --- ХАРАКТЕРИСТИКИ ТОВАРОВ В ODS ---
+# Каждая характеристика из RAW (JSON products.features) хранится отдельной
+# строкой: ключ характеристики — ссылка на словарь ods_attribute_keys, рядом
+# исходное значение и, если его удалось разобрать, число с единицей измерения.
+# Индекс (attribute_key_id, numeric_value) превращает запросы вида «Толщина от
+# 10 до 12 мм» в поиск по диапазону индекса. Разбор и запросы — dwh_builder/attributes.py.
+
+def _init_ods_attributes(cursor):
+    """Создает словарь ключей характеристик и таблицу значений характеристик ODS."""
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS ods_products (
-        product_id TEXT PRIMARY KEY,
-        url TEXT,
-        title TEXT,
-        gold_price REAL,
-        retail_price REAL,
-        unit TEXT,
-        brand TEXT,
-        model TEXT,
-        category_l1 TEXT,
-        category_l2 TEXT,
-        category_l3 TEXT,
-        category_l4 TEXT,
-        parsed_at TIMESTAMP
+    CREATE TABLE IF NOT EXISTS ods_attribute_keys (
+        attribute_key_id INTEGER PRIMARY KEY,
+        attribute_name TEXT NOT NULL UNIQUE
     )
     ''')
-    conn.commit()
-    conn.close()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ods_product_attributes (
+        product_id TEXT NOT NULL,
+        attribute_key_id INTEGER NOT NULL,
+        raw_value TEXT,
+        numeric_value REAL,
+        value_unit TEXT,
+        PRIMARY KEY (product_id, attribute_key_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_ods_product_attributes_value
+    ON ods_product_attributes (attribute_key_id, numeric_value)
+    ''')
+    # Единицы, записанные до нормализации степеней: «м²» -> «м2», «м³» -> «м3»
+    cursor.execute('''
+    UPDATE ods_product_attributes SET value_unit = replace(replace(value_unit, '²', '2'), '³', '3')
+    WHERE value_unit GLOB '*[²³]*'
+    ''')
+
+# --- ПОЛНОТЕКСТОВЫЙ ИНДЕКС ODS ---
+# FTS5-таблица с внешним содержимым (content='ods_products'): текст хранится
+# только в ods_products, а индекс поддерживается триггерами при каждой
+# вставке, изменении и удалении строки. Строки индекса ссылаются на row_id —
+# явный INTEGER PRIMARY KEY: неявный rowid таблицы с текстовым ключом VACUUM
+# может перенумеровать, и индекс указывал бы на чужие товары. ODS обновляется
+# через INSERT ... ON CONFLICT DO UPDATE: row_id строки не меняется, а INSERT OR
+# REPLACE удалял бы строку в обход триггеров. Поиск — см. dwh_builder/search.py.
+
+ODS_FTS_TABLE = 'ods_products_fts'
+ODS_FTS_COLUMNS = ('title', 'brand', 'model', 'category_l1', 'category_l2', 'category_l3', 'category_l4',
+                   'features_text')
+
+def _init_ods_fts(cursor):
+    """Создает FTS5-индекс ODS и триггеры синхронизации; новый индекс заполняется по существующим строкам."""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (ODS_FTS_TABLE,)).fetchone()
+    columns = ', '.join(ODS_FTS_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in ODS_FTS_COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in ODS_FTS_COLUMNS)
+    changed = ' OR '.join(f'old.{column} IS NOT new.{column}' for column in ODS_FTS_COLUMNS)
+    cursor.executescript(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {ODS_FTS_TABLE} USING fts5(
+        {columns},
+        content='ods_products', content_rowid='row_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    CREATE TRIGGER IF NOT EXISTS {ODS_FTS_TABLE}_insert AFTER INSERT ON ods_products BEGIN
+        INSERT INTO {ODS_FTS_TABLE} (rowid, {columns}) VALUES (new.row_id, {new_values});
+    END;
+    CREATE TRIGGER IF NOT EXISTS {ODS_FTS_TABLE}_delete AFTER DELETE ON ods_products BEGIN
+        INSERT INTO {ODS_FTS_TABLE} ({ODS_FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.row_id, {old_values});
+    END;
+    -- Изменение только цен индекс не трогает
+    CREATE TRIGGER IF NOT EXISTS {ODS_FTS_TABLE}_update AFTER UPDATE ON ods_products WHEN {changed} BEGIN
+        INSERT INTO {ODS_FTS_TABLE} ({ODS_FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.row_id, {old_values});
+        INSERT INTO {ODS_FTS_TABLE} (rowid, {columns}) VALUES (new.row_id, {new_values});
+    END;
+    ''')
+    if not exists:
+        cursor.execute(f"INSERT INTO {ODS_FTS_TABLE} ({ODS_FTS_TABLE}) VALUES ('rebuild')")
+
+def _detach_legacy_ods_products(cursor) -> list:
+    """
+    Миграция старых баз, где у ods_products текстовый первичный ключ без row_id:
+    переименовывает таблицу в ods_products_old и удаляет FTS-индекс (он строится
+    заново в _init_ods_fts). Возвращает колонки старой таблицы или пустой список,
+    если мигрировать нечего. Строки переносит _attach_legacy_ods_products
+    в той же транзакции (ее открывает и фиксирует init_ods_db).
+    """
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(ods_products)')]
+    if not columns or 'row_id' in columns:
+        return []
+    print("Перестраиваю ods_products: явный row_id для полнотекстового индекса...")
+    for trigger in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {ODS_FTS_TABLE}_{trigger}')
+    cursor.execute(f'DROP TABLE IF EXISTS {ODS_FTS_TABLE}')
+    cursor.execute('DROP INDEX IF EXISTS idx_ods_products_parsed_at')
+    cursor.execute('ALTER TABLE ods_products RENAME TO ods_products_old')
+    return columns
+
+def _attach_legacy_ods_products(cursor, columns: list):
+    """Переносит строки ods_products_old в новую ods_products, сохраняя прежний rowid как row_id."""
+    column_list = ', '.join(columns)
+    cursor.execute(f'INSERT INTO ods_products (row_id, {column_list}) SELECT rowid, {column_list} FROM ods_products_old')
+    cursor.execute('DROP TABLE ods_products_old')
+
+def _recover_stranded_ods_products(cursor):
+    """
+    Досоздает строки, оставшиеся в ods_products_old после прерванной миграции
+    прежних версий (переименование уже зафиксировано, перенос строк — нет).
+    Строки, которые уже успели попасть в новую ods_products, не перезаписываются;
+    row_id новым строкам выдается заново, FTS-индекс обновляют триггеры.
+    """
+    old_columns = [row[1] for row in cursor.execute('PRAGMA table_info(ods_products_old)')]
+    if not old_columns:
+        return
+    print("Переношу строки, оставшиеся в ods_products_old после прерванной миграции...")
+    column_list = ', '.join(column for column in old_columns if column != 'row_id')
+    cursor.execute(f'INSERT OR IGNORE INTO ods_products ({column_list}) SELECT {column_list} FROM ods_products_old')
+    cursor.execute('DROP TABLE ods_products_old')
+
+# --- ВОДЯНЫЕ ЗНАКИ ИНКРЕМЕНТАЛЬНОЙ СБОРКИ ---
+# Для каждого источника и этапа хранится максимальный parsed_at уже
+# перенесенных строк. Следующий запуск берет только строки не старше него.
+
+def init_watermarks_table(conn: sqlite3.Connection):
+    """Создает таблицу водяных знаков в переданной базе (ODS или DDS)."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS etl_watermarks (
+        source_name TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        high_water_mark TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source_name, stage)
+    )''')
+
+def get_watermark(conn: sqlite3.Connection, source_name: str, stage: str):
+    """Возвращает водяной знак этапа или None, если этап еще ни разу не выполнялся."""
+    row = conn.execute(
+        'SELECT high_water_mark FROM etl_watermarks WHERE source_name = ? AND stage = ?',
+        (source_name, stage)
+    ).fetchone()
+    return row[0] if row else None
+
+def set_watermark(conn: sqlite3.Connection, source_name: str, stage: str, value):
+    """Сохраняет водяной знак этапа (без коммита — он идет в одной транзакции с данными)."""
+    conn.execute('''
+        INSERT OR REPLACE INTO etl_watermarks (source_name, stage, high_water_mark, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (source_name, stage, value))
 
 # --- РАБОТА С DDS СЛОЕМ (НОВЫЙ БЛОК, ОБЩИЙ ФАЙЛ) ---
 
@@ -104,6 +504,12 @@ def get_dds_db_path(is_test: bool = False) -> str:
     filename = 'analytics_test.db' if is_test else 'analytics.db'
     return os.path.join(DDS_DATA_DIR, filename)
 
+def get_parquet_data_dir(is_test: bool = False) -> str:
+    """Каталог Parquet-выгрузки витрин (см. dwh_builder/parquet_export.py)."""
+    data_dir = PARQUET_DATA_DIR + '_test' if is_test else PARQUET_DATA_DIR
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
 def init_dds_db(source_name: str, is_test: bool = False):
     """Инициализирует таблицы для КОНКРЕТНОГО источника в общей DWH."""
     db_path = get_dds_db_path(is_test=is_test)
@@ -118,6 +524,11 @@ def init_dds_db(source_name: str, is_test: bool = False):
         category_l1 TEXT, category_l2 TEXT, category_l3 TEXT, category_l4 TEXT,
         UNIQUE(category_l1, category_l2, category_l3, category_l4)
     )''')
+    # Категории ищутся с учетом COALESCE(..., ''), по обычному UNIQUE-индексу такой поиск не идет
+    cursor.execute(f'''
+    CREATE INDEX IF NOT EXISTS idx_{source_name}_dim_categories_lookup ON {source_name}_dim_categories (
+        COALESCE(category_l1, ''), COALESCE(category_l2, ''), COALESCE(category_l3, ''), COALESCE(category_l4, '')
+    )''')
     
     cursor.execute(f'''
     CREATE TABLE IF NOT EXISTS {source_name}_dim_brands (
@@ -139,6 +550,30 @@ def init_dds_db(source_name: str, is_test: bool = False):
         FOREIGN KEY (category_key) REFERENCES {source_name}_dim_categories (category_key),
         FOREIGN KEY (brand_key) REFERENCES {source_name}_dim_brands (brand_key)
     )''')
+
+    # История цен: новая строка появляется только при изменении цены или единицы.
+    # Открытая (текущая) строка имеет valid_to = NULL.
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {source_name}_fact_price_history (
+        product_id TEXT NOT NULL,
+        valid_from TIMESTAMP NOT NULL,
+        valid_to TIMESTAMP,
+        gold_price REAL,
+        retail_price REAL,
+        unit TEXT,
+        price_hash TEXT NOT NULL,
+        PRIMARY KEY (product_id, valid_from)
+    ) WITHOUT ROWID''')
+    # "Изменения цен за период"
+    cursor.execute(f'''
+    CREATE INDEX IF NOT EXISTS idx_{source_name}_price_history_valid_from
+    ON {source_name}_fact_price_history (valid_from)''')
+    # Текущая цена товара (для сравнения хэшей при сборке)
+    cursor.execute(f'''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_{source_name}_price_history_current
+    ON {source_name}_fact_price_history (product_id) WHERE valid_to IS NULL''')
+
+    init_watermarks_table(conn)
     
     conn.commit()
     conn.close()
@@ -0,0 +1,186 @@
+# src/dwh_builder/attributes.py
+
+# Характеристики товаров в ODS: таблицы ods_attribute_keys (словарь ключей)
+# и ods_product_attributes (значения), см. database.init_ods_db.
+# parse_attributes() разбирает характеристики одного товара при трансформации
+# RAW -> ODS (в том числе в процессах parallel_transform), AttributeKeyCache
+# выдает ключам постоянные идентификаторы, write_product_attributes() заменяет
+# характеристики перенесенных товаров. find_products_by_range() — запрос по
+# диапазону числового значения через индекс (attribute_key_id, numeric_value).
+
+import re
+
+from src.common import database
+
+# Единица измерения: буквы, части через «/» или «.» («кг/м3», «шт/уп», «п.м»),
+# степень — «²», «³» или одна цифра 2/3 сразу после букв («м2»); отдельно «%» и «°C»
+UNIT_TOKEN = r'(?:[^\W\d_]+[²³23]?(?:[/.][^\W\d_]+[²³23]?)*\.?|%|°\s?[CС])'
+# Число в начале значения: «12», «12,5», «1 200 кг» (пробел между разрядами)
+# и необязательная единица измерения после него. Разряды через пробел
+# признаются только перед единицей: «100 200» без нее — скорее два числа
+NUMERIC_VALUE_RE = re.compile(
+    r'^(?:([-+]?\d{1,3}(?:[ \u00a0]\d{3})+)(?=(?:[.,]\d+)?\s*' + UNIT_TOKEN + r'$)|([-+]?\d+))'
+    r'(?:[.,](\d+))?\s*(' + UNIT_TOKEN + r')?$'
+)
+# Размеры вида «1200x600», «10х20х30» — это не одно число
+DIMENSIONS_RE = re.compile(r'\d\s*[xхXХ×*]\s*\d')
+# Единица измерения в названии характеристики: «Толщина, мм», «Вес (кг)»
+KEY_UNIT_RE = re.compile(r'(?:,\s*|\s*\()(' + UNIT_TOKEN + r')\)?$')
+# Единицы, которые признаются в названии характеристики: иначе «Цвет, оттенок»
+# дал бы единицу «оттенок». Составные («кг/м3», «шт/уп») проверяются по частям
+KNOWN_UNITS = {
+    'мкм', 'мм', 'см', 'дм', 'м', 'км', 'м2', 'м3', 'п.м', 'пог.м', 'мг', 'г', 'кг', 'т', 'мл', 'л',
+    'шт', 'уп', 'упак', 'компл', 'рул', 'лист', 'меш', '%', '°c', 'в', 'вт', 'квт', 'а', 'ач', 'па', 'кпа', 'мпа',
+    'бар', 'дб', 'ч', 'мин', 'с', 'сут', 'об/мин', 'лм', 'к', 'гц',
+}
+# Однобуквенные единицы, которые в названии характеристики чаще означают класс
+# или категорию («Класс, А», «Категория, В»): там они единицей не считаются
+AMBIGUOUS_KEY_UNITS = {'а', 'в', 'с', 'к'}
+
+
+def _normalize_unit(unit):
+    """Единица измерения в нижнем регистре, без точки в конце, степени — цифрами («Мм.» -> «мм», «м²» -> «м2»)."""
+    if not unit:
+        return None
+    unit = unit.strip().rstrip('.').lower().replace(' ', '').replace('²', '2').replace('³', '3')
+    return unit or None
+
+
+def _is_known_unit(unit) -> bool:
+    """Единица из KNOWN_UNITS (составная — если известны все ее части через «/»)."""
+    unit = _normalize_unit(unit)
+    return bool(unit) and (unit in KNOWN_UNITS or all(part in KNOWN_UNITS for part in unit.split('/')))
+
+
+def split_key_unit(attribute_name: str) -> tuple:
+    """
+    Отделяет единицу измерения от названия характеристики: «Толщина, мм» -> («Толщина», «мм»).
+    Суффикс, не являющийся известной единицей («Цвет, оттенок», «Класс, А»), остается частью названия.
+    """
+    match = KEY_UNIT_RE.search(attribute_name)
+    if (match and match.start() > 0 and _is_known_unit(match.group(1))
+            and _normalize_unit(match.group(1)) not in AMBIGUOUS_KEY_UNITS):
+        return attribute_name[:match.start()], _normalize_unit(match.group(1))
+    return attribute_name, None
+
+
+def parse_numeric_value(raw_value, attribute_name: str = None) -> tuple:
+    """
+    Разбирает значение характеристики: (число, единица измерения) или (None, None),
+    если значение не является одним числом («1200x600», «до 50 кг», «Да»).
+    Если в значении нет единицы, она берется из названия характеристики («Толщина, мм»).
+    """
+    if isinstance(raw_value, bool) or raw_value is None:
+        return None, None
+    if isinstance(raw_value, (int, float)):
+        number, unit = float(raw_value), None
+    else:
+        text = str(raw_value).strip()
+        match = None if DIMENSIONS_RE.search(text) else NUMERIC_VALUE_RE.match(text)
+        if not match:
+            return None, None
+        grouped_part, integer_part, fraction_part, unit = match.groups()
+        integer_part = re.sub(r'[ \u00a0]', '', grouped_part) if grouped_part else integer_part
+        number = float(integer_part + ('.' + fraction_part if fraction_part else ''))
+    if not unit and attribute_name:
+        unit = split_key_unit(attribute_name)[1]
+    return number, _normalize_unit(unit)
+
+
+def parse_attributes(features_dict: dict) -> list:
+    """
+    Характеристики товара из словаря features: список
+    (название, исходное значение, число, единица измерения). Пустые значения пропускаются.
+    """
+    attributes = []
+    for attribute_name, raw_value in features_dict.items():
+        if not attribute_name or raw_value is None or raw_value == '':
+            continue
+        numeric_value, unit = parse_numeric_value(raw_value, attribute_name)
+        attributes.append((attribute_name, str(raw_value), numeric_value, unit))
+    return attributes
+
+
+class AttributeKeyCache:
+    """
+    Словарь ключей характеристик ODS в памяти (интернирование названий).
+    key_id() выдает идентификатор сразу, новые ключи записываются через flush(cursor)
+    в той же транзакции, что и значения характеристик.
+    """
+
+    def __init__(self, cursor):
+        self.key_ids = dict(cursor.execute('SELECT attribute_name, attribute_key_id FROM ods_attribute_keys'))
+        self._next_key_id = (cursor.execute('SELECT MAX(attribute_key_id) FROM ods_attribute_keys').fetchone()[0] or 0) + 1
+        self._new_keys = []
+
+    def key_id(self, attribute_name: str) -> int:
+        """Идентификатор ключа характеристики; новый ключ записывается при flush()."""
+        key_id = self.key_ids.get(attribute_name)
+        if key_id is None:
+            key_id = self.key_ids[attribute_name] = self._next_key_id
+            self._next_key_id += 1
+            self._new_keys.append((key_id, attribute_name))
+        return key_id
+
+    def flush(self, cursor):
+        """Пакетно записывает новые ключи (коммит — на вызывающей стороне)."""
+        if self._new_keys:
+            cursor.executemany('INSERT INTO ods_attribute_keys (attribute_key_id, attribute_name) VALUES (?, ?)',
+                               self._new_keys)
+            self._new_keys = []
+
+
+def write_product_attributes(cursor, key_cache: AttributeKeyCache, ods_products: list) -> int:
+    """
+    Заменяет характеристики перенесенных товаров значениями из ods_product['attributes'].
+    Возвращает число записанных значений. Коммит — на вызывающей стороне.
+    """
+    rows = {}
+    for ods_product in ods_products:
+        for attribute_name, raw_value, numeric_value, unit in ods_product['attributes']:
+            # Повторяющийся ключ в одной карточке: остается последнее значение, как в JSON
+            rows[(ods_product['product_id'], key_cache.key_id(attribute_name))] = (raw_value, numeric_value, unit)
+    key_cache.flush(cursor)
+    cursor.executemany('DELETE FROM ods_product_attributes WHERE product_id = ?',
+                       [(ods_product['product_id'],) for ods_product in ods_products])
+    cursor.executemany('''
+        INSERT INTO ods_product_attributes (product_id, attribute_key_id, raw_value, numeric_value, value_unit)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(product_id, key_id, *values) for (product_id, key_id), values in rows.items()])
+    return len(rows)
+
+
+def find_products_by_range(source_name: str, attribute_name: str, min_value: float = None, max_value: float = None,
+                           unit: str = None, is_test: bool = False) -> list:
+    """
+    Товары, у которых числовое значение характеристики лежит в [min_value, max_value]
+    (любая граница может быть None). attribute_name ищется как есть и с единицей
+    в названии («Толщина» находит и «Толщина, мм»); unit дополнительно фильтрует
+    по единице измерения. Возвращает список (product_id, numeric_value, value_unit).
+    """
+    conditions = ['numeric_value IS NOT NULL']
+    params = []
+    if min_value is not None:
+        conditions.append('numeric_value >= ?')
+        params.append(min_value)
+    if max_value is not None:
+        conditions.append('numeric_value <= ?')
+        params.append(max_value)
+    if unit is not None:
+        conditions.append('value_unit = ?')
+        params.append(_normalize_unit(unit))
+
+    conn = database.get_db_connection(database.get_ods_db_path(source_name, is_test=is_test))
+    try:
+        key_ids = [key_id for key_id, name in conn.execute('SELECT attribute_key_id, attribute_name FROM ods_attribute_keys')
+                   if name == attribute_name or split_key_unit(name)[0] == attribute_name]
+        if not key_ids:
+            return []
+        return conn.execute(f'''
+            SELECT product_id, numeric_value, value_unit
+            FROM ods_product_attributes
+            WHERE attribute_key_id IN ({', '.join('?' * len(key_ids))}) AND {' AND '.join(conditions)}
+            ORDER BY numeric_value, product_id
+        ''', (*key_ids, *params)).fetchall()
+    finally:
+        conn.close()
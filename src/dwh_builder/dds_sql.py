@@ -0,0 +1,145 @@
+# src/dwh_builder/dds_sql.py
+
+# Построение DDS целиком внутри SQLite: база ODS подключается к analytics.db
+# через ATTACH, а измерения и факты заполняются несколькими INSERT ... SELECT
+# в одной транзакции, без построчного прохода в Python.
+#
+# Результат совпадает с построчным движком main_dwh: новые бренды и категории
+# получают ключи в порядке первого появления в ODS (parsed_at, rowid),
+# категории сравниваются с учетом COALESCE(..., ''), а при нескольких
+# совпадающих категориях берется меньший ключ.
+
+from src.dwh_builder import price_history
+
+ODS_ALIAS = 'ods'
+
+# Факт товара обновляется на месте (product_key не меняется),
+# и только если что-то действительно изменилось
+FACT_UPSERT_SQL = '''
+    ON CONFLICT (product_id) DO UPDATE SET
+        title = excluded.title, category_key = excluded.category_key, brand_key = excluded.brand_key,
+        gold_price = excluded.gold_price, retail_price = excluded.retail_price,
+        unit = excluded.unit, parsed_at = excluded.parsed_at
+    WHERE title IS NOT excluded.title OR category_key IS NOT excluded.category_key
+       OR brand_key IS NOT excluded.brand_key OR gold_price IS NOT excluded.gold_price
+       OR retail_price IS NOT excluded.retail_price OR unit IS NOT excluded.unit
+       OR parsed_at IS NOT excluded.parsed_at
+'''
+
+# Ключ сравнения категорий (тот же, что в dimension_cache._category_lookup_key)
+_CATEGORY_LOOKUP = ("COALESCE({p}category_l1, ''), COALESCE({p}category_l2, ''), "
+                    "COALESCE({p}category_l3, ''), COALESCE({p}category_l4, '')")
+
+
+def _ods_filter(watermark) -> tuple:
+    """Условие на строки ODS, не старше водяного знака (как в main_dwh._incremental_query)."""
+    return ("AND o.parsed_at >= ?", (watermark,)) if watermark else ("", ())
+
+
+def build_dds(dds_conn, ods_db_path: str, source_name: str, watermark=None) -> tuple:
+    """
+    Переносит строки ODS (parsed_at >= watermark, либо все) в измерения, факты и историю цен DDS.
+    Вся работа выполняется одной транзакцией; водяной знак вызывающая сторона
+    двигает сама. Возвращает (количество перенесенных строк, максимальный parsed_at).
+    """
+    brands_table = f'{source_name}_dim_brands'
+    categories_table = f'{source_name}_dim_categories'
+    facts_table = f'{source_name}_fact_products'
+    history_table = f'{source_name}_fact_price_history'
+    price_hash = price_history.PRICE_HASH_FUNCTION
+    where_sql, params = _ods_filter(watermark)
+    category_lookup_o = _CATEGORY_LOOKUP.format(p='o.')
+    category_lookup_c = _CATEGORY_LOOKUP.format(p='c.')
+
+    price_history.register_sql_functions(dds_conn)
+    # ATTACH нельзя выполнить внутри транзакции, поэтому он идет до нее
+    dds_conn.execute(f'ATTACH DATABASE ? AS {ODS_ALIAS}', (ods_db_path,))
+    try:
+        with dds_conn:
+            rows_count, max_parsed_at = dds_conn.execute(f'''
+                SELECT COUNT(*), MAX(o.parsed_at) FROM {ODS_ALIAS}.ods_products o WHERE 1 = 1 {where_sql}
+            ''', params).fetchone()
+            if not rows_count:
+                return 0, None
+
+            # Новые бренды в порядке первого появления
+            dds_conn.execute(f'''
+                INSERT INTO {brands_table} (brand_name)
+                SELECT brand FROM (
+                    SELECT o.brand, o.parsed_at, o.rowid AS ods_rowid,
+                           ROW_NUMBER() OVER (PARTITION BY o.brand ORDER BY o.parsed_at, o.rowid) AS appearance
+                    FROM {ODS_ALIAS}.ods_products o
+                    WHERE o.brand IS NOT NULL {where_sql}
+                ) first_seen
+                WHERE appearance = 1
+                  AND NOT EXISTS (SELECT 1 FROM {brands_table} b WHERE b.brand_name = first_seen.brand)
+                ORDER BY parsed_at, ods_rowid
+            ''', params)
+
+            # Новые категории в порядке первого появления (сравнение через COALESCE)
+            dds_conn.execute(f'''
+                INSERT INTO {categories_table} (category_l1, category_l2, category_l3, category_l4)
+                SELECT category_l1, category_l2, category_l3, category_l4 FROM (
+                    SELECT o.category_l1, o.category_l2, o.category_l3, o.category_l4,
+                           o.parsed_at, o.rowid AS ods_rowid,
+                           ROW_NUMBER() OVER (PARTITION BY {category_lookup_o} ORDER BY o.parsed_at, o.rowid) AS appearance
+                    FROM {ODS_ALIAS}.ods_products o
+                    WHERE 1 = 1 {where_sql}
+                ) o
+                WHERE appearance = 1
+                  AND NOT EXISTS (
+                      SELECT 1 FROM {categories_table} c
+                      WHERE ({category_lookup_c}) = ({category_lookup_o})
+                  )
+                ORDER BY parsed_at, ods_rowid
+            ''', params)
+
+            # Факты: ключи измерений подставляются join-ами по индексам
+            dds_conn.execute(f'''
+                INSERT INTO {facts_table}
+                    (product_id, title, category_key, brand_key, gold_price, retail_price, unit, parsed_at)
+                SELECT o.product_id, o.title,
+                       (SELECT MIN(c.category_key) FROM {categories_table} c
+                        WHERE ({category_lookup_c}) = ({category_lookup_o})),
+                       b.brand_key,
+                       o.gold_price, o.retail_price, o.unit, o.parsed_at
+                FROM {ODS_ALIAS}.ods_products o
+                LEFT JOIN {brands_table} b ON b.brand_name = o.brand
+                WHERE 1 = 1 {where_sql}
+                ORDER BY o.parsed_at, o.rowid
+                {FACT_UPSERT_SQL}
+            ''', params)
+
+            # История цен (та же логика, что в price_history.PriceHistoryTracker):
+            # 1) цена изменилась позже открытой строки — закрываем ее
+            dds_conn.execute(f'''
+                UPDATE {history_table} AS h SET valid_to = o.parsed_at
+                FROM {ODS_ALIAS}.ods_products o
+                WHERE h.product_id = o.product_id AND h.valid_to IS NULL
+                  AND o.parsed_at > h.valid_from
+                  AND h.price_hash != {price_hash}(o.gold_price, o.retail_price, o.unit) {where_sql}
+            ''', params)
+            # 2) цена изменилась в тот же момент, что и открытая строка, — исправляем ее на месте
+            dds_conn.execute(f'''
+                UPDATE {history_table} AS h SET
+                    gold_price = o.gold_price, retail_price = o.retail_price, unit = o.unit,
+                    price_hash = {price_hash}(o.gold_price, o.retail_price, o.unit)
+                FROM {ODS_ALIAS}.ods_products o
+                WHERE h.product_id = o.product_id AND h.valid_to IS NULL
+                  AND o.parsed_at = h.valid_from
+                  AND h.price_hash != {price_hash}(o.gold_price, o.retail_price, o.unit) {where_sql}
+            ''', params)
+            # 3) у товара нет открытой строки (новый товар или строку только что закрыли) — открываем новую
+            dds_conn.execute(f'''
+                INSERT INTO {history_table} (product_id, valid_from, gold_price, retail_price, unit, price_hash)
+                SELECT o.product_id, o.parsed_at, o.gold_price, o.retail_price, o.unit,
+                       {price_hash}(o.gold_price, o.retail_price, o.unit)
+                FROM {ODS_ALIAS}.ods_products o
+                WHERE o.product_id IS NOT NULL AND o.parsed_at IS NOT NULL {where_sql}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM {history_table} h WHERE h.product_id = o.product_id AND h.valid_to IS NULL
+                  )
+            ''', params)
+            return rows_count, max_parsed_at
+    finally:
+        dds_conn.execute(f'DETACH DATABASE {ODS_ALIAS}')
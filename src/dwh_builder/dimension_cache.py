@@ -0,0 +1,78 @@
+# src/dwh_builder/dimension_cache.py
+
+# Кэш ключей измерений DDS: таблицы {source}_dim_brands и {source}_dim_categories
+# один раз за сборку читаются в словари, дальше ключи ищутся в памяти.
+# Новые значения получают ключи сразу (без обращения к базе) и записываются
+# в измерения пакетом через flush(), в той же транзакции, что и факты.
+
+
+def _category_lookup_key(categories: tuple) -> tuple:
+    """Ключ поиска категории: NULL и '' считаются одинаковыми (как COALESCE(..., '') в прежнем SELECT)."""
+    return tuple('' if value is None else value for value in categories)
+
+
+def _next_key(cursor, table_name: str, key_column: str) -> int:
+    """Следующий свободный ключ AUTOINCREMENT-таблицы (с учетом sqlite_sequence, ключи не переиспользуются)."""
+    max_key = cursor.execute(f'SELECT MAX({key_column}) FROM {table_name}').fetchone()[0] or 0
+    seq_row = cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table_name,)).fetchone()
+    return max(max_key, seq_row[0] if seq_row else 0) + 1
+
+
+class DimensionKeyCache:
+    """
+    Ключи брендов и категорий одного источника в памяти.
+    Использование: brand_key()/category_key() для каждой строки, затем
+    flush(cursor) перед записью фактов — он дописывает в измерения новые значения.
+    """
+
+    def __init__(self, cursor, source_name: str):
+        self.brands_table = f'{source_name}_dim_brands'
+        self.categories_table = f'{source_name}_dim_categories'
+
+        self.brand_keys = dict(cursor.execute(f'SELECT brand_name, brand_key FROM {self.brands_table}'))
+        self.category_keys = {}
+        for category_key, *categories in cursor.execute(f'''
+            SELECT category_key, category_l1, category_l2, category_l3, category_l4
+            FROM {self.categories_table} ORDER BY category_key
+        '''):
+            self.category_keys.setdefault(_category_lookup_key(categories), category_key)
+
+        self._next_brand_key = _next_key(cursor, self.brands_table, 'brand_key')
+        self._next_category_key = _next_key(cursor, self.categories_table, 'category_key')
+        self._new_brands = []
+        self._new_categories = []
+
+    def brand_key(self, brand_name):
+        """Ключ бренда; для нового бренда ключ выдается сразу, а запись откладывается до flush()."""
+        if brand_name is None:
+            return None
+        key = self.brand_keys.get(brand_name)
+        if key is None:
+            key = self.brand_keys[brand_name] = self._next_brand_key
+            self._next_brand_key += 1
+            self._new_brands.append((key, brand_name))
+        return key
+
+    def category_key(self, category_l1, category_l2, category_l3, category_l4):
+        """Ключ категории по четырем уровням; новая категория записывается при flush()."""
+        categories = (category_l1, category_l2, category_l3, category_l4)
+        lookup_key = _category_lookup_key(categories)
+        key = self.category_keys.get(lookup_key)
+        if key is None:
+            key = self.category_keys[lookup_key] = self._next_category_key
+            self._next_category_key += 1
+            self._new_categories.append((key, *categories))
+        return key
+
+    def flush(self, cursor):
+        """Пакетно записывает накопленные новые значения измерений (коммит — на вызывающей стороне)."""
+        if self._new_brands:
+            cursor.executemany(f'INSERT INTO {self.brands_table} (brand_key, brand_name) VALUES (?, ?)',
+                               self._new_brands)
+            self._new_brands = []
+        if self._new_categories:
+            cursor.executemany(f'''
+                INSERT INTO {self.categories_table} (category_key, category_l1, category_l2, category_l3, category_l4)
+                VALUES (?, ?, ?, ?, ?)
+            ''', self._new_categories)
+            self._new_categories = []
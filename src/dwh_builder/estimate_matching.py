@@ -0,0 +1,479 @@
+# src/dwh_builder/estimate_matching.py
+
+# Сопоставление строк смет (fact_estimates) с товарами каталога ({source}_fact_products).
+# По названию, бренду и единице измерения товара строится инвертированный
+# индекс {source}_match_postings: термы — основы слов (первые STEM_LENGTH букв),
+# числа, символьные триграммы слов и единица измерения.
+#
+# Сопоставление идет в два шага:
+#   1) кандидаты — одним SQL-запросом на пачку строк сметы: товары, у которых
+#      больше всего общих редких основ (для слов, которых в индексе нет, —
+#      триграмм), по CANDIDATES_PER_ESTIMATE на строку;
+#   2) оценка — косинусная близость векторов термов с весами idf между строкой
+#      сметы и каждым кандидатом. Лучшие MATCHES_PER_ESTIMATE совпадений с оценкой
+#      не ниже MIN_SCORE пишутся в {source}_estimate_matches.
+#
+# Обе стороны обновляются инкрементально: в индекс попадают только новые и
+# изменившиеся товары (по хэшу текста), а заново сопоставляются новые строки
+# смет, строки, кандидаты которых подбирались по термам изменившихся товаров,
+# и строки, в тексте которых есть термы, впервые появившиеся в индексе (так
+# находятся товары для строк, у которых раньше не было ни кандидатов, ни совпадений).
+
+import hashlib
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from src.common import database
+from tqdm import tqdm
+
+# Сколько первых букв слова считается его основой ("цементный", "цемента" -> "цемент")
+STEM_LENGTH = 6
+# Кандидаты подбираются по самым редким термам строки сметы, пока их суммарная
+# частота (сколько записей индекса читается) не превысит этот бюджет
+CANDIDATE_POSTINGS_BUDGET = 2000
+# Сколько кандидатов на строку сметы переоценивается точной формулой
+CANDIDATES_PER_ESTIMATE = 50
+# Сколько лучших совпадений на строку сметы сохраняется и с какой минимальной оценкой
+MATCHES_PER_ESTIMATE = 3
+MIN_SCORE = 0.2
+# Сколько строк сметы сопоставляется за один запрос кандидатов / одну транзакцию
+MATCH_BATCH_SIZE = 500
+# Сколько товаров обновляется в индексе за одну транзакцию
+INDEX_BATCH_SIZE = 5000
+
+_TOKEN_RE = re.compile(r'[a-zа-я]+|\d+(?:[.,]\d+)?')
+
+
+# --- Нормализация текста и термы ---
+
+def normalize_text(text) -> str:
+    """Нижний регистр, ё -> е, надстрочные степени -> цифры."""
+    if text is None:
+        return ''
+    return str(text).lower().replace('ё', 'е').replace('²', '2').replace('³', '3')
+
+
+def normalize_unit(unit) -> str:
+    """Единица измерения без пробелов, точек и множителя: '100 шт.' -> 'шт', 'м³' -> 'м3'."""
+    unit = re.sub(r'^[\d\s.,]+', '', normalize_text(unit))
+    return re.sub(r'[\s.]', '', unit)
+
+
+def _tokens(text) -> list:
+    """Слова и числа текста. Однобуквенные слова (предлоги, "д", "х") ничего не различают."""
+    return [token for token in _TOKEN_RE.findall(normalize_text(text)) if len(token) > 1 or token.isdigit()]
+
+
+def _stem_term(token: str) -> str:
+    """Терм основы слова ('w:'); число — целиком."""
+    if token[0].isdigit():
+        return 'w:' + token.replace(',', '.')
+    return 'w:' + token[:STEM_LENGTH]
+
+
+def _trigram_terms(token: str) -> list:
+    """Символьные триграммы слова из букв ('t:'), с границами слова."""
+    if token[0].isdigit():
+        return []
+    padded = f' {token} '
+    return ['t:' + padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+@lru_cache(maxsize=200_000)
+def text_terms(text: str, unit: str = None) -> frozenset:
+    """Множество термов текста и единицы измерения (одинаково для товаров и строк смет)."""
+    terms = set()
+    for token in _tokens(text):
+        terms.add(_stem_term(token))
+        terms.update(_trigram_terms(token))
+    unit = normalize_unit(unit)
+    if unit:
+        terms.add('u:' + unit)
+    return frozenset(terms)
+
+
+def _document_hash(text: str, unit) -> str:
+    return hashlib.blake2b(f"{text}|{unit}".encode('utf-8'), digest_size=8).hexdigest()
+
+
+# --- Таблицы ---
+
+def init_matching_tables(conn, source_name: str):
+    """Создает таблицы индекса и результатов сопоставления для источника."""
+    s = source_name
+    text_terms_exist = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'{s}_estimate_text_terms',)).fetchone()
+    conn.executescript(f'''
+    -- Проиндексированные товары: текст, по которому построены термы, и его хэш
+    CREATE TABLE IF NOT EXISTS {s}_match_documents (
+        product_key INTEGER PRIMARY KEY,
+        product_id TEXT,
+        doc_text TEXT,
+        unit TEXT,
+        doc_hash TEXT NOT NULL
+    );
+    -- Инвертированный индекс: терм -> товары
+    CREATE TABLE IF NOT EXISTS {s}_match_postings (
+        term TEXT NOT NULL,
+        product_key INTEGER NOT NULL,
+        PRIMARY KEY (term, product_key)
+    ) WITHOUT ROWID;
+    -- В скольких товарах встречается терм (для idf)
+    CREATE TABLE IF NOT EXISTS {s}_match_term_stats (
+        term TEXT PRIMARY KEY,
+        doc_freq INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    -- Термы изменившихся товаров: строки смет, чьи кандидаты подбирались по ним, сопоставляются заново
+    CREATE TABLE IF NOT EXISTS {s}_match_dirty_terms (
+        term TEXT PRIMARY KEY
+    ) WITHOUT ROWID;
+    -- Термы, которых до изменения товаров в индексе не было: строки смет с ними сопоставляются заново
+    CREATE TABLE IF NOT EXISTS {s}_match_new_terms (
+        term TEXT PRIMARY KEY
+    ) WITHOUT ROWID;
+    -- Термы, по которым подбирались кандидаты строки сметы (чтобы найти строки, затронутые изменением товаров)
+    CREATE TABLE IF NOT EXISTS {s}_estimate_terms (
+        term TEXT NOT NULL,
+        estimate_key INTEGER NOT NULL,
+        PRIMARY KEY (term, estimate_key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_{s}_estimate_terms_key ON {s}_estimate_terms (estimate_key);
+    -- Все термы текста строки сметы (чтобы найти строки с термами, впервые появившимися в индексе)
+    CREATE TABLE IF NOT EXISTS {s}_estimate_text_terms (
+        term TEXT NOT NULL,
+        estimate_key INTEGER NOT NULL,
+        PRIMARY KEY (term, estimate_key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_{s}_estimate_text_terms_key ON {s}_estimate_text_terms (estimate_key);
+    -- Какие строки смет уже сопоставлены
+    CREATE TABLE IF NOT EXISTS {s}_estimate_match_state (
+        estimate_key INTEGER PRIMARY KEY,
+        matched_at TIMESTAMP NOT NULL
+    );
+    -- Результат: лучшие товары для строки сметы
+    CREATE TABLE IF NOT EXISTS {s}_estimate_matches (
+        estimate_key INTEGER NOT NULL,
+        match_rank INTEGER NOT NULL,
+        product_id TEXT NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (estimate_key, match_rank)
+    );
+    CREATE INDEX IF NOT EXISTS idx_{s}_estimate_matches_product ON {s}_estimate_matches (product_id);
+    ''')
+    if not text_terms_exist:
+        # У строк, сопоставленных раньше, термы текста не сохранены: сопоставляем их заново
+        with conn:
+            conn.execute(f'DELETE FROM {s}_estimate_match_state')
+
+
+# --- Индекс товаров ---
+
+def _apply_document_changes(conn, source_name: str, changes: list):
+    """
+    Применяет пачку изменений индекса [(product_key, product_id, старые термы, новые термы, text, unit, hash)].
+    Новые термы None — товар удален из витрины. Коммит — на вызывающей стороне.
+    """
+    s = source_name
+    removed_postings, added_postings = [], []
+    doc_freq_delta = Counter()
+    dirty_terms = set()
+    for product_key, _, old_terms, new_terms, _, _, _ in changes:
+        old_terms, new_terms = old_terms or frozenset(), new_terms or frozenset()
+        for term in old_terms - new_terms:
+            removed_postings.append((term, product_key))
+            doc_freq_delta[term] -= 1
+        for term in new_terms - old_terms:
+            added_postings.append((term, product_key))
+            doc_freq_delta[term] += 1
+        dirty_terms.update(term for term in old_terms | new_terms if not term.startswith('u:'))
+
+    conn.executemany(f'DELETE FROM {s}_match_postings WHERE term = ? AND product_key = ?', removed_postings)
+    conn.executemany(f'INSERT OR IGNORE INTO {s}_match_postings (term, product_key) VALUES (?, ?)', added_postings)
+    conn.executemany(f'''
+        INSERT OR IGNORE INTO {s}_match_new_terms (term)
+        SELECT ? WHERE NOT EXISTS (SELECT 1 FROM {s}_match_term_stats WHERE term = ?)
+    ''', [(term, term) for term, delta in doc_freq_delta.items() if delta > 0 and not term.startswith('u:')])
+    conn.executemany(f'''
+        INSERT INTO {s}_match_term_stats (term, doc_freq) VALUES (?, ?)
+        ON CONFLICT (term) DO UPDATE SET doc_freq = doc_freq + excluded.doc_freq
+    ''', [(term, delta) for term, delta in doc_freq_delta.items() if delta])
+    conn.executemany(f'DELETE FROM {s}_match_term_stats WHERE term = ? AND doc_freq <= 0',
+                     [(term,) for term, delta in doc_freq_delta.items() if delta < 0])
+    conn.executemany(f'INSERT OR IGNORE INTO {s}_match_dirty_terms (term) VALUES (?)',
+                     [(term,) for term in dirty_terms])
+    conn.executemany(f'DELETE FROM {s}_match_documents WHERE product_key = ?',
+                     [(change[0],) for change in changes if change[3] is None])
+    conn.executemany(f'''
+        INSERT INTO {s}_match_documents (product_key, product_id, doc_text, unit, doc_hash) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (product_key) DO UPDATE SET
+            product_id = excluded.product_id, doc_text = excluded.doc_text,
+            unit = excluded.unit, doc_hash = excluded.doc_hash
+    ''', [(product_key, product_id, text, unit, doc_hash)
+          for product_key, product_id, _, new_terms, text, unit, doc_hash in changes if new_terms is not None])
+
+
+def update_product_index(conn, source_name: str, batch_size: int = INDEX_BATCH_SIZE) -> tuple:
+    """
+    Приводит индекс товаров в соответствие с витриной фактов: добавляет новые
+    товары, переиндексирует товары с изменившимся названием, брендом или
+    единицей и убирает исчезнувшие. Возвращает (обновлено, удалено).
+    """
+    s = source_name
+    indexed = {
+        product_key: (doc_hash, doc_text, unit)
+        for product_key, doc_hash, doc_text, unit in conn.execute(
+            f'SELECT product_key, doc_hash, doc_text, unit FROM {s}_match_documents')
+    }
+    changes, updated = [], 0
+
+    def flush():
+        nonlocal changes
+        if changes:
+            with conn:
+                _apply_document_changes(conn, source_name, changes)
+            changes = []
+
+    for product_key, product_id, title, brand_name, unit in conn.execute(f'''
+        SELECT f.product_key, f.product_id, f.title, b.brand_name, f.unit
+        FROM {s}_fact_products f LEFT JOIN {s}_dim_brands b ON b.brand_key = f.brand_key
+    ''').fetchall():
+        # Бренд добавляется к названию, если в названии его нет
+        text = title or ''
+        if brand_name and normalize_text(brand_name) not in normalize_text(text):
+            text = f"{text} {brand_name}"
+        doc_hash = _document_hash(text, unit)
+        previous = indexed.pop(product_key, None)
+        if previous is not None and previous[0] == doc_hash:
+            continue
+        old_terms = text_terms(previous[1], previous[2]) if previous is not None else None
+        changes.append((product_key, product_id, old_terms, text_terms(text, unit), text, unit, doc_hash))
+        updated += 1
+        if len(changes) >= batch_size:
+            flush()
+
+    # Товары, которых больше нет в витрине
+    for product_key, (_, doc_text, unit) in indexed.items():
+        changes.append((product_key, None, text_terms(doc_text, unit), None, None, None, None))
+        if len(changes) >= batch_size:
+            flush()
+    flush()
+    return updated, len(indexed)
+
+
+# --- Сопоставление строк смет ---
+
+class _TermWeights:
+    """idf термов индекса: ln(1 + N / df). Термы, которых нет в индексе, получают наибольший вес."""
+
+    def __init__(self, conn, source_name: str):
+        self.doc_freq = dict(conn.execute(f'SELECT term, doc_freq FROM {source_name}_match_term_stats'))
+        self.documents_count = conn.execute(f'SELECT COUNT(*) FROM {source_name}_match_documents').fetchone()[0]
+        self._squared_weights = {}
+        self._norms = {}
+
+    def weight(self, term: str) -> float:
+        return math.log(1 + self.documents_count / self.doc_freq.get(term, 1))
+
+    def squared_weight(self, term: str) -> float:
+        squared = self._squared_weights.get(term)
+        if squared is None:
+            squared = self._squared_weights[term] = self.weight(term) ** 2
+        return squared
+
+    def norm(self, terms: frozenset) -> float:
+        norm = self._norms.get(terms)
+        if norm is None:
+            norm = self._norms[terms] = math.sqrt(sum(map(self.squared_weight, terms)))
+        return norm
+
+    def candidate_terms(self, text: str) -> list:
+        """
+        Термы для подбора кандидатов: основы слов, а для слов, основы которых
+        в индексе нет (опечатки, сокращения), — их триграммы. Берутся самые
+        редкие термы в пределах CANDIDATE_POSTINGS_BUDGET (но хотя бы один).
+        """
+        eligible = set()
+        for token in _tokens(text):
+            stem = _stem_term(token)
+            if stem in self.doc_freq:
+                eligible.add(stem)
+            else:
+                eligible.update(term for term in _trigram_terms(token) if term in self.doc_freq)
+        selected, postings = [], 0
+        for term in sorted(eligible, key=lambda term: (self.doc_freq[term], term)):
+            if selected and postings + self.doc_freq[term] > CANDIDATE_POSTINGS_BUDGET:
+                break
+            selected.append(term)
+            postings += self.doc_freq[term]
+        return selected
+
+    def cosine(self, query_terms: frozenset, document_terms: frozenset) -> float:
+        shared = query_terms & document_terms
+        if not shared:
+            return 0.0
+        dot = sum(map(self.squared_weight, shared))
+        return dot / (self.norm(query_terms) * self.norm(document_terms))
+
+
+def _estimates_to_match(conn, source_name: str, full_rematch: bool) -> list:
+    """
+    Строки смет, которые нужно сопоставить: новые, затронутые изменившимися
+    товарами (общие основы с match_dirty_terms), содержащие впервые появившиеся
+    в индексе термы (estimate_text_terms x match_new_terms) или все при full_rematch.
+    Заодно убирает результаты строк, которых больше нет в fact_estimates.
+    """
+    s = source_name
+    with conn:
+        for table in (f'{s}_estimate_matches', f'{s}_estimate_terms', f'{s}_estimate_text_terms',
+                      f'{s}_estimate_match_state'):
+            conn.execute(f'DELETE FROM {table} WHERE estimate_key NOT IN (SELECT estimate_key FROM fact_estimates)')
+    if full_rematch:
+        where_sql = ''
+    else:
+        where_sql = f'''
+            WHERE e.estimate_key NOT IN (SELECT estimate_key FROM {s}_estimate_match_state)
+               OR e.estimate_key IN (
+                   SELECT t.estimate_key FROM {s}_estimate_terms t
+                   JOIN {s}_match_dirty_terms d ON d.term = t.term
+               )
+               -- Строки без кандидатов не оставили термов в estimate_terms, поэтому сверяется весь их текст
+               OR e.estimate_key IN (
+                   SELECT t.estimate_key FROM {s}_match_new_terms n
+                   JOIN {s}_estimate_text_terms t ON t.term = n.term
+               )
+        '''
+    return conn.execute(f'''
+        SELECT e.estimate_key, e.item_name, e.unit FROM fact_estimates e {where_sql} ORDER BY e.estimate_key
+    ''').fetchall()
+
+
+def _match_batch(conn, source_name: str, weights: _TermWeights, batch: list) -> list:
+    """Сопоставляет пачку строк смет. Возвращает [(estimate_key, rank, product_id, score)]."""
+    s = source_name
+    query_terms = {estimate_key: text_terms(item_name or '', unit) for estimate_key, item_name, unit in batch}
+    conn.execute('DELETE FROM temp.match_query')
+    conn.executemany('INSERT INTO temp.match_query (estimate_key, term, weight) VALUES (?, ?, ?)', [
+        (estimate_key, term, weights.weight(term))
+        for estimate_key, item_name, _ in batch
+        for term in weights.candidate_terms(item_name or '')
+    ])
+    candidates = conn.execute(f'''
+        SELECT c.estimate_key, d.product_id, d.doc_text, d.unit FROM (
+            SELECT q.estimate_key, p.product_key,
+                   ROW_NUMBER() OVER (PARTITION BY q.estimate_key
+                                      ORDER BY SUM(q.weight) DESC, p.product_key) AS candidate_rank
+            FROM temp.match_query q
+            JOIN {s}_match_postings p ON p.term = q.term
+            GROUP BY q.estimate_key, p.product_key
+        ) c
+        JOIN {s}_match_documents d ON d.product_key = c.product_key
+        WHERE c.candidate_rank <= ?
+    ''', (CANDIDATES_PER_ESTIMATE,)).fetchall()
+
+    scored = {}
+    for estimate_key, product_id, doc_text, unit in candidates:
+        score = weights.cosine(query_terms[estimate_key], text_terms(doc_text, unit))
+        if score >= MIN_SCORE:
+            scored.setdefault(estimate_key, []).append((score, product_id))
+    matches = []
+    for estimate_key, product_scores in scored.items():
+        product_scores.sort(key=lambda pair: (-pair[0], pair[1]))
+        matches.extend((estimate_key, rank, product_id, round(score, 6))
+                       for rank, (score, product_id) in enumerate(product_scores[:MATCHES_PER_ESTIMATE], start=1))
+    return matches
+
+
+def match_estimates(conn, source_name: str, full_rematch: bool = False, batch_size: int = MATCH_BATCH_SIZE,
+                    progress=None) -> int:
+    """
+    Сопоставляет строки fact_estimates с проиндексированными товарами
+    (сначала вызовите update_product_index). Каждая пачка строк записывается
+    одной транзакцией. progress — необязательный tqdm. Возвращает число сопоставленных строк.
+    """
+    s = source_name
+    estimates = _estimates_to_match(conn, source_name, full_rematch)
+    weights = _TermWeights(conn, source_name)
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS match_query (estimate_key INTEGER, term TEXT, weight REAL)')
+    if progress is not None:
+        progress.reset(total=len(estimates))
+
+    for start in range(0, len(estimates), batch_size):
+        batch = estimates[start:start + batch_size]
+        matches = _match_batch(conn, source_name, weights, batch)
+        keys = [(estimate_key,) for estimate_key, _, _ in batch]
+        with conn:
+            conn.executemany(f'DELETE FROM {s}_estimate_matches WHERE estimate_key = ?', keys)
+            conn.executemany(f'DELETE FROM {s}_estimate_terms WHERE estimate_key = ?', keys)
+            conn.executemany(f'DELETE FROM {s}_estimate_text_terms WHERE estimate_key = ?', keys)
+            conn.executemany(f'''
+                INSERT INTO {s}_estimate_matches (estimate_key, match_rank, product_id, score) VALUES (?, ?, ?, ?)
+            ''', matches)
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {s}_estimate_terms (term, estimate_key)
+                SELECT term, estimate_key FROM temp.match_query
+            ''')
+            conn.executemany(f'INSERT OR IGNORE INTO {s}_estimate_text_terms (term, estimate_key) VALUES (?, ?)', [
+                (term, estimate_key)
+                for estimate_key, item_name, unit in batch
+                for term in text_terms(item_name or '', unit) if not term.startswith('u:')
+            ])
+            conn.executemany(f'''
+                INSERT INTO {s}_estimate_match_state (estimate_key, matched_at) VALUES (?, CURRENT_TIMESTAMP)
+                ON CONFLICT (estimate_key) DO UPDATE SET matched_at = CURRENT_TIMESTAMP
+            ''', keys)
+        if progress is not None:
+            progress.update(len(batch))
+
+    # Все затронутые строки сопоставлены заново — метки изменений больше не нужны
+    with conn:
+        conn.execute(f'DELETE FROM {s}_match_dirty_terms')
+        conn.execute(f'DELETE FROM {s}_match_new_terms')
+    return len(estimates)
+
+
+# --- Запросы к результатам ---
+
+def get_estimate_price_comparison(conn, source_name: str, min_score: float = MIN_SCORE) -> list:
+    """
+    Строки смет с лучшим найденным товаром: (estimate_key, source_file, item_name,
+    единица и цена по смете, product_id, название, единица и розничная цена товара, оценка).
+    """
+    s = source_name
+    return conn.execute(f'''
+        SELECT e.estimate_key, e.source_file, e.item_name, e.unit, e.price_per_unit,
+               m.product_id, f.title, f.unit, f.retail_price, m.score
+        FROM fact_estimates e
+        JOIN {s}_estimate_matches m ON m.estimate_key = e.estimate_key AND m.match_rank = 1
+        JOIN {s}_fact_products f ON f.product_id = m.product_id
+        WHERE m.score >= ?
+        ORDER BY e.estimate_key
+    ''', (min_score,)).fetchall()
+
+
+# --- Оркестратор ---
+
+def run_estimate_matching(source_name: str, is_test: bool = False, full_rematch: bool = False):
+    """
+    Обновляет индекс товаров источника и сопоставляет с ним строки смет
+    в analytics.db. Ничего не делает, если сметы еще не загружались (upload_excel.py).
+    full_rematch=True сопоставляет заново все строки смет.
+    """
+    conn = database.get_db_connection(database.get_dds_db_path(is_test=is_test))
+    try:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if 'fact_estimates' not in tables or f'{source_name}_fact_products' not in tables:
+            print("Сметы или витрина товаров еще не загружены — сопоставление пропущено.")
+            return
+        init_matching_tables(conn, source_name)
+
+        print(f"Обновляю индекс товаров '{source_name}' для сопоставления со сметами...")
+        updated, removed = update_product_index(conn, source_name)
+        print(f"Индекс обновлен: переиндексировано товаров {updated}, удалено {removed}.")
+
+        with tqdm(desc="Сопоставление смет с каталогом") as progress:
+            matched = match_estimates(conn, source_name, full_rematch=full_rematch, progress=progress)
+        linked = conn.execute(f'SELECT COUNT(DISTINCT estimate_key) FROM {source_name}_estimate_matches').fetchone()[0]
+        print(f"Сопоставлено строк смет: {matched}. Строк смет с найденными товарами всего: {linked}.")
+    finally:
+        conn.close()
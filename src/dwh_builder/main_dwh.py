@@ -1,75 +1,167 @@
 # src/dwh_builder/main_dwh.py
 import sqlite3
 from src.common import database
+from src.dwh_builder import attributes
+from src.dwh_builder import dds_sql
+from src.dwh_builder import dimension_cache
+from src.dwh_builder import parallel_transform
+from src.dwh_builder import price_history
 from src.dwh_builder import transformer
 from tqdm import tqdm
 
-def _get_or_create_dimension_key(cursor, table_name_with_prefix: str, key_column: str, value_column: str, value):
-    """Вспомогательная универсальная функция для получения ключа измерения (например, бренда)."""
-    if value is None:
-        return None
-    cursor.execute(f'SELECT {key_column} FROM {table_name_with_prefix} WHERE {value_column} = ?', (value,))
-    result = cursor.fetchone()
-    if result:
-        return result[0]
-    cursor.execute(f'INSERT INTO {table_name_with_prefix} ({value_column}) VALUES (?)', (value,))
-    return cursor.lastrowid
-
-def _get_or_create_category_key(cursor, table_name_with_prefix: str, categories: dict):
-    """Вспомогательная функция для получения ключа категории."""
-    cat_values = tuple(categories.values())
-    # SQL-запрос для поиска существующей категории
-    select_sql = f'''
-        SELECT category_key FROM {table_name_with_prefix}
-        WHERE COALESCE(category_l1, '') = COALESCE(?, '')
-          AND COALESCE(category_l2, '') = COALESCE(?, '')
-          AND COALESCE(category_l3, '') = COALESCE(?, '')
-          AND COALESCE(category_l4, '') = COALESCE(?, '')
-    '''
-    cursor.execute(select_sql, cat_values)
-    result = cursor.fetchone()
-    if result:
-        return result[0]
-    # Если не нашли, вставляем новую
-    insert_sql = f'INSERT INTO {table_name_with_prefix} (category_l1, category_l2, category_l3, category_l4) VALUES (?, ?, ?, ?)'
-    cursor.execute(insert_sql, cat_values)
-    return cursor.lastrowid
-
-def run_dwh_build(source_name: str, is_test: bool = False):
+# Имена этапов в таблице водяных знаков etl_watermarks
+RAW_TO_ODS_STAGE = 'raw_to_ods'
+ODS_TO_DDS_STAGE = 'ods_to_dds'
+
+# Движки построения DDS: построчно через Python или целиком SQL-запросами внутри SQLite
+DDS_ENGINES = ('python', 'sql')
+
+# Размер порции по умолчанию для потокового чтения и пакетной записи
+DEFAULT_CHUNK_SIZE = 5000
+
+# Колонки, которые действительно нужны каждому этапу (raw_html и прочее не читаем)
+RAW_COLUMNS = ('product_id', 'url', 'title', 'gold_price', 'retail_price', 'unit',
+               'categories', 'features', 'parsed_at')
+ODS_COLUMNS = ('product_id', 'url', 'title', 'gold_price', 'retail_price', 'unit', 'brand', 'model',
+               'category_l1', 'category_l2', 'category_l3', 'category_l4', 'parsed_at', 'features_text')
+DDS_SOURCE_COLUMNS = ('product_id', 'title', 'gold_price', 'retail_price', 'unit', 'brand',
+                      'category_l1', 'category_l2', 'category_l3', 'category_l4', 'parsed_at')
+
+# Upsert вместо INSERT OR REPLACE: row_id строки сохраняется, и триггеры
+# полнотекстового индекса ods_products_fts видят обычный UPDATE (см. database.py)
+ODS_INSERT_SQL = f'''
+    INSERT INTO ods_products ({', '.join(ODS_COLUMNS)})
+    VALUES ({', '.join('?' * len(ODS_COLUMNS))})
+    ON CONFLICT(product_id) DO UPDATE SET
+        {', '.join(f'{column} = excluded.{column}' for column in ODS_COLUMNS if column != 'product_id')}
+'''
+
+def _ods_values(ods_product: dict) -> tuple:
+    """Значения ODS-объекта в порядке ODS_COLUMNS."""
+    return tuple(ods_product[column] for column in ODS_COLUMNS)
+
+def _advance_watermark(conn, source_name: str, stage: str, old_watermark, new_watermark):
+    """
+    Сдвигает водяной знак этапа вперед (назад он не двигается никогда).
+    Возвращает актуальное значение водяного знака.
+    """
+    if new_watermark is None:
+        return old_watermark
+    if old_watermark is None or new_watermark > old_watermark:
+        database.set_watermark(conn, source_name, stage, new_watermark)
+        return new_watermark
+    return old_watermark
+
+def _stream_chunks(conn, sql: str, params: tuple, chunk_size: int):
+    """Генератор: выполняет запрос и отдает результат порциями по chunk_size строк (fetchmany)."""
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+def _incremental_query(table_name: str, columns: tuple, watermark) -> tuple:
+    """Собирает SELECT нужных колонок (строки не старше водяного знака, по возрастанию parsed_at) и COUNT к нему."""
+    where_sql, params = ("WHERE parsed_at >= ?", (watermark,)) if watermark else ("", ())
+    # rowid делает порядок строк с одинаковым parsed_at детерминированным
+    select_sql = f"SELECT {', '.join(columns)} FROM {table_name} {where_sql} ORDER BY parsed_at, rowid"
+    count_sql = f"SELECT COUNT(*) FROM {table_name} {where_sql}"
+    return select_sql, count_sql, params
+
+def run_dwh_build(source_name: str, is_test: bool = False, full_refresh: bool = False,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, transform_workers: int = 1,
+                  dds_engine: str = 'python'):
     """
     Главная функция для построения ODS и DDS слоев для конкретного источника.
+
+    По умолчанию сборка инкрементальная: каждый этап берет только строки,
+    у которых parsed_at не старше водяного знака прошлой успешной сборки
+    (таблица etl_watermarks). full_refresh=True пересобирает все заново.
+
+    Оба этапа потоковые: источник читается порциями по chunk_size строк,
+    каждая порция записывается одной транзакцией вместе с водяным знаком,
+    так что потребление памяти не зависит от размера каталога.
+
+    При transform_workers > 1 трансформация RAW -> ODS выполняется в пуле
+    процессов (см. parallel_transform.py); результат совпадает с последовательным.
+
+    dds_engine='sql' строит DDS одной транзакцией из INSERT ... SELECT
+    над подключенной через ATTACH базой ODS (см. dds_sql.py); таблицы
+    получаются те же, что и у построчного движка 'python'.
     """
+    if dds_engine not in DDS_ENGINES:
+        raise ValueError(f"Неизвестный движок DDS '{dds_engine}'. Допустимые: {', '.join(DDS_ENGINES)}")
     print(f"\nЗапуск построения DWH для источника: '{source_name.upper()}'")
     if is_test:
         print("--- РЕЖИМ ТЕСТИРОВАНИЯ: используются тестовые базы данных ---")
+    if full_refresh:
+        print("--- ПОЛНАЯ ПЕРЕСБОРКА: водяные знаки игнорируются ---")
+
+    build_ods(source_name, is_test=is_test, full_refresh=full_refresh, chunk_size=chunk_size,
+              transform_workers=transform_workers)
+    build_dds(source_name, is_test=is_test, full_refresh=full_refresh, chunk_size=chunk_size, dds_engine=dds_engine)
 
+def build_ods(source_name: str, is_test: bool = False, full_refresh: bool = False,
+              chunk_size: int = DEFAULT_CHUNK_SIZE, transform_workers: int = 1):
+    """Этап RAW -> ODS сборки DWH (см. run_dwh_build)."""
     # --- ЭТАП 2.1: Перенос из RAW в ODS ---
     database.init_ods_db(source_name, is_test=is_test)
     raw_conn = database.get_db_connection(database.get_raw_db_path(source_name, is_test=is_test))
     raw_conn.row_factory = sqlite3.Row
     ods_conn = database.get_db_connection(database.get_ods_db_path(source_name, is_test=is_test))
-    all_raw_products = raw_conn.cursor().execute("SELECT * FROM products").fetchall()
-
-    if not all_raw_products:
-        print(f"В RAW слое для '{source_name}' нет данных для обработки.")
-        raw_conn.close()
-        ods_conn.close()
-        return
-
-    print(f"Начинаю перенос {len(all_raw_products)} записей из RAW в ODS...")
-    for row in tqdm(all_raw_products, desc=f"RAW -> ODS для {source_name}"):
-        ods_product, _ = transformer.transform_row(row)
-        ods_conn.cursor().execute('''
-            INSERT OR REPLACE INTO ods_products 
-            (product_id, url, title, gold_price, retail_price, unit, brand, model,
-             category_l1, category_l2, category_l3, category_l4, parsed_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', tuple(ods_product.values()))
-    ods_conn.commit()
-    print("Перенос в ODS завершен.")
+
+    raw_watermark = None if full_refresh else database.get_watermark(ods_conn, source_name, RAW_TO_ODS_STAGE)
+    # Сравнение нестрогое: строки с parsed_at, равным водяному знаку, переносятся повторно,
+    # зато не теряются записи, попавшие в RAW в ту же секунду, что и прошлая сборка
+    if raw_watermark:
+        print(f"Инкрементальный режим: беру из RAW строки с parsed_at >= {raw_watermark}")
+    select_sql, count_sql, params = _incremental_query('products', RAW_COLUMNS, raw_watermark)
+    raw_count = raw_conn.execute(count_sql, params).fetchone()[0]
+
+    # Словарь ключей характеристик читается один раз на сборку
+    attribute_keys = attributes.AttributeKeyCache(ods_conn)
+    if not raw_count:
+        print(f"В RAW слое для '{source_name}' нет новых данных для обработки.")
+    elif transform_workers > 1:
+        # Порции идут по rowid, а не по parsed_at, поэтому водяной знак
+        # фиксируется только после того, как перенесены все порции
+        print(f"Начинаю перенос {raw_count} записей из RAW в ODS в {transform_workers} процессах...")
+        max_parsed_at = None
+        with tqdm(total=raw_count, desc=f"RAW -> ODS для {source_name}") as progress:
+            for ods_products, chunk_max_parsed_at in parallel_transform.iter_transformed_chunks(
+                    database.get_raw_db_path(source_name, is_test=is_test), RAW_COLUMNS,
+                    raw_watermark, chunk_size, transform_workers):
+                with ods_conn:
+                    ods_conn.executemany(ODS_INSERT_SQL, [_ods_values(p) for p in ods_products])
+                    attributes.write_product_attributes(ods_conn, attribute_keys, ods_products)
+                if chunk_max_parsed_at and (max_parsed_at is None or chunk_max_parsed_at > max_parsed_at):
+                    max_parsed_at = chunk_max_parsed_at
+                progress.update(len(ods_products))
+        with ods_conn:
+            _advance_watermark(ods_conn, source_name, RAW_TO_ODS_STAGE, raw_watermark, max_parsed_at)
+        print("Перенос в ODS завершен.")
+    else:
+        print(f"Начинаю перенос {raw_count} записей из RAW в ODS...")
+        with tqdm(total=raw_count, desc=f"RAW -> ODS для {source_name}") as progress:
+            for rows in _stream_chunks(raw_conn, select_sql, params, chunk_size):
+                ods_products = [transformer.transform_row(row)[0] for row in rows]
+                with ods_conn:
+                    ods_conn.executemany(ODS_INSERT_SQL, [_ods_values(p) for p in ods_products])
+                    attributes.write_product_attributes(ods_conn, attribute_keys, ods_products)
+                    raw_watermark = _advance_watermark(ods_conn, source_name, RAW_TO_ODS_STAGE,
+                                                       raw_watermark, rows[-1]['parsed_at'])
+                progress.update(len(rows))
+        print("Перенос в ODS завершен.")
     raw_conn.close()
     ods_conn.close()
 
+def build_dds(source_name: str, is_test: bool = False, full_refresh: bool = False,
+              chunk_size: int = DEFAULT_CHUNK_SIZE, dds_engine: str = 'python'):
+    """Этап ODS -> DDS сборки DWH (см. run_dwh_build)."""
+    if dds_engine not in DDS_ENGINES:
+        raise ValueError(f"Неизвестный движок DDS '{dds_engine}'. Допустимые: {', '.join(DDS_ENGINES)}")
     # --- ЭТАП 2.2: Построение DDS из ODS ---
     
     # ИСПРАВЛЕНИЯ БЫЛИ В ЭТОМ БЛОКЕ
@@ -78,30 +170,58 @@ def run_dwh_build(source_name: str, is_test: bool = False):
     ods_conn.row_factory = sqlite3.Row
     dds_conn = database.get_db_connection(database.get_dds_db_path(is_test=is_test))
     # КОНЕЦ ИСПРАВЛЕНИЙ
+    with dds_conn:
+        backfilled = price_history.backfill_from_facts(dds_conn, source_name)
+    if backfilled:
+        print(f"История цен заполнена текущими ценами из витрины фактов: {backfilled} товаров.")
+
+    ods_watermark = None if full_refresh else database.get_watermark(dds_conn, source_name, ODS_TO_DDS_STAGE)
 
-    all_ods_products = ods_conn.cursor().execute("SELECT * FROM ods_products").fetchall()
+    if dds_engine == 'sql':
+        print("Начинаю построение витрин DDS из ODS средствами SQLite...")
+        ods_count, max_parsed_at = dds_sql.build_dds(
+            dds_conn, database.get_ods_db_path(source_name, is_test=is_test), source_name, ods_watermark)
+        with dds_conn:
+            _advance_watermark(dds_conn, source_name, ODS_TO_DDS_STAGE, ods_watermark, max_parsed_at)
+        print(f"Перенесено записей: {ods_count}.")
+    else:
+        select_sql, count_sql, params = _incremental_query('ods_products', DDS_SOURCE_COLUMNS, ods_watermark)
+        ods_count = ods_conn.execute(count_sql, params).fetchone()[0]
     
-    print(f"Начинаю построение витрин DDS из ODS ({len(all_ods_products)} записей)...")
-    for row in tqdm(all_ods_products, desc=f"ODS -> DDS для {source_name}"):
-        dds_cursor = dds_conn.cursor()
-        brand_key = _get_or_create_dimension_key(dds_cursor, f'{source_name}_dim_brands', 'brand_key', 'brand_name', row['brand'])
-        category_key = _get_or_create_category_key(dds_cursor, f'{source_name}_dim_categories', {
-            'l1': row['category_l1'], 'l2': row['category_l2'],
-            'l3': row['category_l3'], 'l4': row['category_l4']
-        })
-        
-        fact_values = (
-            row['product_id'], row['title'], category_key, brand_key,
-            row['gold_price'], row['retail_price'], row['unit'], row['parsed_at']
-        )
-        dds_cursor.execute(f'''
-            INSERT OR REPLACE INTO {source_name}_fact_products
+        # Измерения читаются в память один раз, дальше ключи ищутся в словарях;
+        # открытые строки истории цен — только для товаров текущей порции
+        dim_keys = dimension_cache.DimensionKeyCache(dds_conn.cursor(), source_name)
+        price_changes = price_history.PriceHistoryTracker(source_name)
+        fact_insert_sql = f'''
+            INSERT INTO {source_name}_fact_products
                 (product_id, title, category_key, brand_key, gold_price, retail_price, unit, parsed_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', fact_values)
+            {dds_sql.FACT_UPSERT_SQL}
+        '''
+
+        print(f"Начинаю построение витрин DDS из ODS ({ods_count} записей)...")
+        with tqdm(total=ods_count, desc=f"ODS -> DDS для {source_name}") as progress:
+            for rows in _stream_chunks(ods_conn, select_sql, params, chunk_size):
+                fact_rows = [(
+                    row['product_id'], row['title'],
+                    dim_keys.category_key(row['category_l1'], row['category_l2'], row['category_l3'], row['category_l4']),
+                    dim_keys.brand_key(row['brand']),
+                    row['gold_price'], row['retail_price'], row['unit'], row['parsed_at']
+                ) for row in rows]
+                price_changes.load(dds_conn.cursor(), [row['product_id'] for row in rows])
+                for row in rows:
+                    price_changes.add(row['product_id'], row['gold_price'], row['retail_price'],
+                                      row['unit'], row['parsed_at'])
+                with dds_conn:
+                    dds_cursor = dds_conn.cursor()
+                    dim_keys.flush(dds_cursor)
+                    dds_cursor.executemany(fact_insert_sql, fact_rows)
+                    price_changes.flush(dds_cursor)
+                    ods_watermark = _advance_watermark(dds_conn, source_name, ODS_TO_DDS_STAGE,
+                                                       ods_watermark, rows[-1]['parsed_at'])
+                progress.update(len(rows))
+        print(f"Изменений цен записано в историю: {price_changes.total_changed}.")
 
-    dds_conn.commit()
     print("Построение DDS завершено.")
     ods_conn.close()
     dds_conn.close()
-
@@ -0,0 +1,61 @@
+# src/dwh_builder/parallel_transform.py
+
+# Параллельная трансформация RAW -> ODS: диапазон rowid таблицы products
+# режется на порции, каждая порция читается и трансформируется в отдельном
+# процессе, а результаты возвращаются в главный процесс (единственный писатель ODS).
+
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from src.common import database
+from src.dwh_builder import transformer
+
+# Соединение с RAW базой внутри процесса-воркера (открывается один раз на процесс)
+_worker_raw_conn = None
+
+def _init_worker(raw_db_path: str):
+    global _worker_raw_conn
+    _worker_raw_conn = database.get_db_connection(raw_db_path)
+    _worker_raw_conn.row_factory = sqlite3.Row
+
+def _transform_rowid_range(columns: tuple, first_rowid: int, last_rowid: int, watermark):
+    """
+    Выполняется в воркере: трансформирует строки RAW с rowid в [first_rowid, last_rowid].
+    Возвращает (список ODS-объектов, максимальный parsed_at среди прочитанных строк).
+    """
+    sql = f"SELECT {', '.join(columns)} FROM products WHERE rowid BETWEEN ? AND ?"
+    params = (first_rowid, last_rowid)
+    if watermark:
+        sql += " AND parsed_at >= ?"
+        params += (watermark,)
+    ods_products = []
+    max_parsed_at = None
+    for row in _worker_raw_conn.execute(sql, params):
+        ods_products.append(transformer.transform_row(row)[0])
+        if row['parsed_at'] and (max_parsed_at is None or row['parsed_at'] > max_parsed_at):
+            max_parsed_at = row['parsed_at']
+    return ods_products, max_parsed_at
+
+def iter_transformed_chunks(raw_db_path: str, columns: tuple, watermark, chunk_size: int, workers: int):
+    """
+    Генератор: отдает (список ODS-объектов, максимальный parsed_at порции) по мере
+    готовности, в порядке возрастания rowid. Одновременно в работе не больше
+    2 * workers порций, поэтому память ограничена независимо от размера RAW.
+    """
+    conn = database.get_db_connection(raw_db_path)
+    where_sql, params = ("WHERE parsed_at >= ?", (watermark,)) if watermark else ("", ())
+    min_rowid, max_rowid = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM products {where_sql}", params).fetchone()
+    conn.close()
+    if min_rowid is None:
+        return
+
+    ranges = ((start, min(start + chunk_size - 1, max_rowid))
+              for start in range(min_rowid, max_rowid + 1, chunk_size))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(raw_db_path,)) as executor:
+        in_flight = deque()
+        for first_rowid, last_rowid in ranges:
+            in_flight.append(executor.submit(_transform_rowid_range, columns, first_rowid, last_rowid, watermark))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
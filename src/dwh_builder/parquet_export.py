@@ -0,0 +1,180 @@
+# src/dwh_builder/parquet_export.py
+
+# Выгрузка витрины DDS в Parquet для BI и ноутбуков: факты товаров вместе
+# с брендом и категориями одной денормализованной таблицей, разбитой на
+# партиции data/parquet/source=<источник>/crawl_date=<дата обхода>/.
+# Партиция crawl_date=D — товары, собранные в день D. Выгрузка инкрементальная и
+# только дописывает: водяной знак (etl_watermarks, этап dds_to_parquet) хранит
+# последний выгруженный parsed_at, каждая выгрузка пишет строки новее него
+# отдельным файлом part-<водяной знак>.parquet в партиции их дней, а уже
+# записанные файлы не меняются. Поэтому товар, обойденный снова (в другой день
+# или в тот же после прошлой выгрузки), попадает в выгрузку еще раз, а прежняя
+# строка хранит его прежние цены (актуальная строка товара — с наибольшим parsed_at).
+# Полная выгрузка пишет по одному файлу part-0.parquet на партицию.
+# Бренд, категории и единица измерения хранятся словарными колонками (dictionary).
+# Чтение: pyarrow.dataset.dataset(путь, partitioning='hive') или pandas.read_parquet(путь).
+
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+from src.common import database
+
+PARQUET_EXPORT_STAGE = 'dds_to_parquet'
+
+# Сколько строк читается из SQLite и пишется в Parquet за раз (одна row group — несколько порций)
+EXPORT_CHUNK_SIZE = 50000
+# Файл партиции при полной выгрузке; инкрементальные выгрузки дописывают part-<водяной знак>.parquet
+PARTITION_FILE_NAME = 'part-0.parquet'
+
+_DICTIONARY_STRING = pa.dictionary(pa.int32(), pa.string())
+EXPORT_SCHEMA = pa.schema([
+    ('product_id', pa.string()),
+    ('title', pa.string()),
+    ('brand', _DICTIONARY_STRING),
+    ('category_l1', _DICTIONARY_STRING),
+    ('category_l2', _DICTIONARY_STRING),
+    ('category_l3', _DICTIONARY_STRING),
+    ('category_l4', _DICTIONARY_STRING),
+    ('gold_price', pa.float64()),
+    ('retail_price', pa.float64()),
+    ('unit', _DICTIONARY_STRING),
+    ('parsed_at', pa.timestamp('us')),
+])
+
+
+def get_source_export_dir(source_name: str, is_test: bool = False) -> str:
+    """Каталог с партициями источника: data/parquet[_test]/source=<источник>."""
+    return os.path.join(database.get_parquet_data_dir(is_test=is_test), f'source={source_name}')
+
+
+def _partition_file_name(watermark) -> str:
+    """
+    Имя файла выгрузки в партиции: зависит только от нижней границы выгрузки,
+    поэтому повтор прерванной выгрузки (водяной знак не сдвинулся) подменяет
+    свои же файлы, а не дублирует строки.
+    """
+    if not watermark:
+        return PARTITION_FILE_NAME
+    return f"part-{''.join(filter(str.isdigit, watermark))}.parquet"
+
+
+def _to_record_batch(rows: list) -> pa.RecordBatch:
+    """Порция строк запроса (в порядке EXPORT_SCHEMA, плюс дата партиции в конце) -> RecordBatch."""
+    columns = list(zip(*rows))
+    arrays = []
+    for index, field in enumerate(EXPORT_SCHEMA):
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[index], pa.string()).dictionary_encode())
+        elif pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(columns[index], pa.string()).cast(field.type))
+        else:
+            arrays.append(pa.array(columns[index], field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+
+
+class _PartitionWriter:
+    """
+    Пишет файл партиции во временный файл; commit() переименовывает его в
+    file_name, поэтому читатель никогда не видит недописанный файл.
+    """
+
+    def __init__(self, export_dir: str, crawl_date: str, file_name: str = PARTITION_FILE_NAME):
+        self.crawl_date = crawl_date
+        partition_dir = os.path.join(export_dir, f'crawl_date={crawl_date}')
+        os.makedirs(partition_dir, exist_ok=True)
+        self.path = os.path.join(partition_dir, file_name)
+        self.tmp_path = self.path + '.tmp'
+        self.writer = pq.ParquetWriter(self.tmp_path, EXPORT_SCHEMA, compression='zstd')
+
+    def write(self, rows: list):
+        """Дописывает порцию строк в партицию."""
+        self.writer.write_batch(_to_record_batch(rows))
+
+    def commit(self):
+        """Закрывает файл и публикует его в партиции."""
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def export_source_to_parquet(source_name: str, is_test: bool = False, full_refresh: bool = False,
+                             chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Дописывает в Parquet товары источника, собранные после прошлой выгрузки.
+    Возвращает число партиций, в которые записаны файлы.
+    full_refresh=True удаляет выгрузку источника и пишет все партиции заново.
+    """
+    print(f"\nВыгрузка витрины '{source_name}' в Parquet...")
+    export_dir = get_source_export_dir(source_name, is_test=is_test)
+    dds_conn = database.get_db_connection(database.get_dds_db_path(is_test=is_test))
+    try:
+        if full_refresh:
+            shutil.rmtree(export_dir, ignore_errors=True)
+            watermark = None
+        else:
+            watermark = database.get_watermark(dds_conn, source_name, PARQUET_EXPORT_STAGE)
+
+        # Только строки новее водяного знака: выгруженные раньше строки остаются в своих файлах
+        where_sql, params = ("AND f.parsed_at > ?", (watermark,)) if watermark else ("", ())
+        file_name = _partition_file_name(watermark)
+        count_sql = f'''
+            SELECT COUNT(*), MAX(f.parsed_at) FROM {source_name}_fact_products f
+            WHERE f.parsed_at IS NOT NULL {where_sql}
+        '''
+        rows_count, max_parsed_at = dds_conn.execute(count_sql, params).fetchone()
+        if not rows_count:
+            print("Новых данных для выгрузки в Parquet нет.")
+            return 0
+
+        cursor = dds_conn.execute(f'''
+            SELECT f.product_id, f.title, b.brand_name,
+                   c.category_l1, c.category_l2, c.category_l3, c.category_l4,
+                   f.gold_price, f.retail_price, f.unit, f.parsed_at, date(f.parsed_at) AS crawl_date
+            FROM {source_name}_fact_products f
+            LEFT JOIN {source_name}_dim_brands b ON b.brand_key = f.brand_key
+            LEFT JOIN {source_name}_dim_categories c ON c.category_key = f.category_key
+            WHERE f.parsed_at IS NOT NULL {where_sql}
+            ORDER BY crawl_date, f.product_id
+        ''', params)
+
+        partitions_count = 0
+        partition = None
+        try:
+            with tqdm(total=rows_count, desc=f"DDS -> Parquet для {source_name}") as progress:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    # Строки отсортированы по дате, поэтому партиции идут одна за другой
+                    start = 0
+                    while start < len(rows):
+                        crawl_date = rows[start][-1]
+                        end = start
+                        while end < len(rows) and rows[end][-1] == crawl_date:
+                            end += 1
+                        if partition is None or partition.crawl_date != crawl_date:
+                            if partition is not None:
+                                partition.commit()
+                                partitions_count += 1
+                            partition = _PartitionWriter(export_dir, crawl_date, file_name)
+                        partition.write(rows[start:end])
+                        start = end
+                    progress.update(len(rows))
+            if partition is not None:
+                partition.commit()
+                partitions_count += 1
+        except BaseException:
+            if partition is not None:
+                partition.writer.close()
+                os.remove(partition.tmp_path)
+            raise
+
+        with dds_conn:
+            database.set_watermark(dds_conn, source_name, PARQUET_EXPORT_STAGE, max_parsed_at)
+        print(f"Выгружено партиций: {partitions_count} ({rows_count} строк) в {export_dir}.")
+        return partitions_count
+    finally:
+        dds_conn.close()
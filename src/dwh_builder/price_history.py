@@ -0,0 +1,156 @@
+# src/dwh_builder/price_history.py
+
+# История цен DDS: таблица {source}_fact_price_history (ключ product_id + valid_from).
+# При сборке для каждого товара сравнивается хэш (gold_price, retail_price, unit)
+# с хэшем открытой строки истории: если он не изменился, ничего не пишется,
+# иначе открытая строка закрывается (valid_to) и добавляется новая.
+
+import hashlib
+
+# Имя SQL-функции, через которую хэш считается внутри запросов (см. dds_sql.py)
+PRICE_HASH_FUNCTION = 'price_hash'
+
+
+def compute_price_hash(gold_price, retail_price, unit) -> str:
+    """Короткий хэш цены товара. Одинаков для Python- и SQL-движка сборки."""
+    return hashlib.blake2b(f"{gold_price!r}|{retail_price!r}|{unit!r}".encode('utf-8'), digest_size=8).hexdigest()
+
+
+def register_sql_functions(conn):
+    """Регистрирует compute_price_hash в соединении как SQL-функцию price_hash(gold, retail, unit)."""
+    conn.create_function(PRICE_HASH_FUNCTION, 3, compute_price_hash, deterministic=True)
+
+
+def backfill_from_facts(conn, source_name: str) -> int:
+    """
+    Если история цен пуста, а витрина фактов уже заполнена (база, собранная до
+    появления истории), заводит по открытой строке на каждый товар из фактов.
+    Возвращает количество добавленных строк. Коммит — на вызывающей стороне.
+    """
+    history_table = f'{source_name}_fact_price_history'
+    if conn.execute(f'SELECT 1 FROM {history_table} LIMIT 1').fetchone():
+        return 0
+    register_sql_functions(conn)
+    cursor = conn.execute(f'''
+        INSERT INTO {history_table} (product_id, valid_from, valid_to, gold_price, retail_price, unit, price_hash)
+        SELECT product_id, parsed_at, NULL, gold_price, retail_price, unit,
+               {PRICE_HASH_FUNCTION}(gold_price, retail_price, unit)
+        FROM {source_name}_fact_products
+        WHERE product_id IS NOT NULL AND parsed_at IS NOT NULL
+    ''')
+    return cursor.rowcount
+
+
+class PriceHistoryTracker:
+    """
+    Хэши открытых строк истории для текущей порции ODS.
+    Использование: load(cursor, product_ids) для товаров порции, add() для каждой
+    ее строки, затем flush(cursor) в транзакции порции — он закрывает старые
+    строки и пишет новые. В памяти держатся только товары одной порции.
+    """
+
+    def __init__(self, source_name: str):
+        self.history_table = f'{source_name}_fact_price_history'
+        self.current = {}
+        self.total_changed = 0
+        self._closed = []
+        self._corrected = []
+        self._opened = []
+
+    def load(self, cursor, product_ids: list, chunk_size: int = 500):
+        """Читает открытые строки истории для товаров порции (по частичному индексу valid_to IS NULL)."""
+        keys = list({product_id for product_id in product_ids if product_id is not None} - self.current.keys())
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            for product_id, price_hash, valid_from in cursor.execute(f'''
+                SELECT product_id, price_hash, valid_from FROM {self.history_table}
+                WHERE product_id IN ({', '.join('?' * len(chunk))}) AND valid_to IS NULL
+            ''', chunk):
+                self.current[product_id] = (price_hash, valid_from)
+
+    def add(self, product_id, gold_price, retail_price, unit, parsed_at):
+        """
+        Сравнивает цену товара с текущей строкой истории и откладывает нужные изменения до flush().
+        Открытая строка товара должна быть заранее прочитана load().
+        """
+        if product_id is None or parsed_at is None:
+            return
+        price_hash = compute_price_hash(gold_price, retail_price, unit)
+        current = self.current.get(product_id)
+        if current is not None:
+            current_hash, valid_from = current
+            if price_hash == current_hash or parsed_at < valid_from:
+                # Цена не изменилась либо строка старше текущей — ничего не пишем
+                return
+            if parsed_at == valid_from:
+                # Тот же момент времени: исправляем открытую строку на месте
+                self._corrected.append((gold_price, retail_price, unit, price_hash, product_id, valid_from))
+                self.current[product_id] = (price_hash, valid_from)
+                self.total_changed += 1
+                return
+            self._closed.append((parsed_at, product_id, valid_from))
+        self._opened.append((product_id, parsed_at, gold_price, retail_price, unit, price_hash))
+        self.current[product_id] = (price_hash, parsed_at)
+        self.total_changed += 1
+
+    def flush(self, cursor):
+        """Пакетно записывает накопленные изменения истории (коммит — на вызывающей стороне)."""
+        if self._closed:
+            cursor.executemany(f'''
+                UPDATE {self.history_table} SET valid_to = ? WHERE product_id = ? AND valid_from = ?
+            ''', self._closed)
+            self._closed = []
+        if self._corrected:
+            cursor.executemany(f'''
+                UPDATE {self.history_table} SET gold_price = ?, retail_price = ?, unit = ?, price_hash = ?
+                WHERE product_id = ? AND valid_from = ?
+            ''', self._corrected)
+            self._corrected = []
+        if self._opened:
+            cursor.executemany(f'''
+                INSERT INTO {self.history_table} (product_id, valid_from, gold_price, retail_price, unit, price_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', self._opened)
+            self._opened = []
+        # Изменения записаны в базу: следующая порция прочитает свои строки через load()
+        self.current = {}
+
+# --- Запросы к истории цен ---
+
+def get_prices_as_of(conn, source_name: str, moment: str, product_id: str = None) -> list:
+    """
+    Цены на момент `moment` ('YYYY-MM-DD' или 'YYYY-MM-DD HH:MM:SS'):
+    для одного товара (поиск по первичному ключу) или для всех товаров.
+    Возвращает список кортежей (product_id, valid_from, valid_to, gold_price, retail_price, unit).
+    """
+    history_table = f'{source_name}_fact_price_history'
+    columns = 'product_id, valid_from, valid_to, gold_price, retail_price, unit'
+    if product_id is not None:
+        return conn.execute(f'''
+            SELECT {columns} FROM {history_table}
+            WHERE product_id = ? AND valid_from <= ?
+            ORDER BY valid_from DESC LIMIT 1
+        ''', (str(product_id), moment)).fetchall()
+    return conn.execute(f'''
+        SELECT {columns} FROM {history_table}
+        WHERE valid_from <= ? AND (valid_to IS NULL OR valid_to > ?)
+        ORDER BY product_id
+    ''', (moment, moment)).fetchall()
+
+
+def get_price_changes(conn, source_name: str, date_from: str, date_to: str) -> list:
+    """
+    Изменения цен с date_from (включительно) по date_to (не включительно).
+    Возвращает список кортежей (product_id, changed_at, old_gold_price, new_gold_price,
+    old_retail_price, new_retail_price, old_unit, new_unit); для первой цены товара old_* = None.
+    """
+    history_table = f'{source_name}_fact_price_history'
+    return conn.execute(f'''
+        SELECT h.product_id, h.valid_from,
+               prev.gold_price, h.gold_price, prev.retail_price, h.retail_price, prev.unit, h.unit
+        FROM {history_table} h
+        LEFT JOIN {history_table} prev
+               ON prev.product_id = h.product_id AND prev.valid_to = h.valid_from
+        WHERE h.valid_from >= ? AND h.valid_from < ?
+        ORDER BY h.valid_from, h.product_id
+    ''', (date_from, date_to)).fetchall()
@@ -0,0 +1,65 @@
+# src/dwh_builder/search.py
+
+# Полнотекстовый поиск товаров по ODS. Индекс ods_products_fts (FTS5) создается
+# и поддерживается в актуальном состоянии самой ODS-базой (database.init_ods_db):
+# триггеры обновляют его при каждом переносе RAW -> ODS, отдельной перестройки не нужно.
+# Результаты ранжируются по bm25 с весами колонок: совпадение в названии
+# значит больше, чем в категории или характеристиках.
+
+import re
+
+from src.common import database
+
+# Веса колонок для bm25 в порядке database.ODS_FTS_COLUMNS
+COLUMN_WEIGHTS = {
+    'title': 10.0,
+    'brand': 5.0,
+    'model': 5.0,
+    'category_l1': 1.0,
+    'category_l2': 1.5,
+    'category_l3': 2.0,
+    'category_l4': 2.0,
+    'features_text': 1.0,
+}
+
+DEFAULT_LIMIT = 20
+
+# Слова запроса: буквы и цифры; все остальное (кавычки, операторы FTS5) отбрасывается
+TOKEN_RE = re.compile(r'\w+')
+
+
+def build_match_query(text: str):
+    """
+    Превращает пользовательскую строку в выражение MATCH для FTS5: каждое слово
+    берется в кавычки и ищется по префиксу, слова объединяются через AND.
+    Возвращает None, если в строке нет ни одного слова.
+    """
+    tokens = TOKEN_RE.findall((text or '').lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_products(source_name: str, query: str, limit: int = DEFAULT_LIMIT, is_test: bool = False) -> list:
+    """
+    Ищет товары источника по названию, бренду, модели, категориям и характеристикам.
+    Возвращает список (product_id, title, score), отсортированный по релевантности
+    (score — bm25, чем меньше, тем лучше).
+    """
+    match_query = build_match_query(query)
+    if match_query is None:
+        return []
+    weights = ', '.join(str(COLUMN_WEIGHTS[column]) for column in database.ODS_FTS_COLUMNS)
+    fts_table = database.ODS_FTS_TABLE
+    conn = database.get_db_connection(database.get_ods_db_path(source_name, is_test=is_test))
+    try:
+        return conn.execute(f'''
+            SELECT p.product_id, p.title, bm25({fts_table}, {weights}) AS score
+            FROM {fts_table}
+            JOIN ods_products p ON p.row_id = {fts_table}.rowid
+            WHERE {fts_table} MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ''', (match_query, limit)).fetchall()
+    finally:
+        conn.close()
@@ -2,6 +2,8 @@
 
 import json
 
+from src.dwh_builder import attributes
+
 def transform_row(raw_row):
     """
     Трансформирует одну сырую строку из RAW в структурированный 
@@ -32,6 +34,9 @@ def transform_row(raw_row):
     # 3. Извлечем и ОЧИСТИМ ключевые характеристики
     brand = features_dict.get('Бренд')
     model = features_dict.get('Модель')
+    # Все характеристики одной строкой «ключ: значение; ...» — для полнотекстового поиска по ODS
+    features_text = '; '.join(f"{key}: {value}" for key, value in features_dict.items()
+                              if value not in (None, '')) or None
     
     # ## >> ИСПРАВЛЕННАЯ ЛОГИКА << ##
     # Считываем значение из raw_row...
@@ -51,6 +56,9 @@ def transform_row(raw_row):
         'brand': brand,
         'model': model,
         'parsed_at': raw_row['parsed_at'],
+        'features_text': features_text,
+        # Характеристики для ods_product_attributes: (название, значение, число, единица)
+        'attributes': attributes.parse_attributes(features_dict),
         **cat_levels
     }
 
@@ -1,9 +1,14 @@
 # src/dwh_builder/upload_excel.py
 
-import pandas as pd
+import openpyxl
 import sqlite3
 import sys
 import os
+import hashlib
+import itertools
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import glob # Библиотека для поиска файлов по шаблону
 
@@ -19,67 +24,295 @@ from src.common import database
 # Папка, куда нужно класть Excel-файлы для загрузки
 ESTIMATES_FOLDER = os.path.join(BASE_DIR, 'data', 'estimates')
 
-def find_header_row(file_path: str) -> int:
+# Сколько первых строк листа просматривается в поисках строки заголовков
+HEADER_SEARCH_ROWS = 30
+# Сколько строк сметы вставляется одним executemany: память ограничена размером пачки
+INSERT_BATCH_SIZE = 5000
+# Сколько процессов читают файлы смет параллельно (писатель в базу всегда один)
+ESTIMATE_WORKERS = min(4, os.cpu_count() or 1)
+# Сколько пачек строк на воркер может ждать писателя в очереди
+RESULT_QUEUE_BATCHES_PER_WORKER = 4
+# Как часто (в секундах) писатель проверяет, живы ли воркеры
+RESULT_POLL_TIMEOUT = 5
+# Размер блока чтения при хешировании файла
+FILE_HASH_BLOCK_SIZE = 1024 * 1024
+
+# Колонки сметы -> колонки fact_estimates
+COLUMNS_MAP = {
+    'Код ресурса, услуги': 'item_code',
+    'Наименование строительного ресурса, услуги': 'item_name',
+    'Единица измерения': 'unit',
+    'Сметная цена в текущем уровне цен, руб.': 'price_per_unit'
+}
+
+def is_header_row(row) -> bool:
+    """Проверяет, что строка листа — заголовок таблицы сметы (по ключевым словам)."""
+    row_as_string = ' '.join(map(str, row))
+    return 'Код ресурса, услуги' in row_as_string and 'Наименование строительного ресурса' in row_as_string
+
+def find_header(rows) -> tuple:
     """
-    Находит номер строки, в которой находится заголовок таблицы.
-    Это нужно, чтобы пропустить "шапку" в файлах смет.
+    Ищет строку заголовков среди первых HEADER_SEARCH_ROWS строк итератора,
+    чтобы пропустить "шапку" в файлах смет. Итератор остается на первой
+    строке после заголовка. Возвращает строку заголовков или None.
     """
-    try:
-        # Читаем первые 30 строк для надежности и ищем ключевые слова в заголовках
-        df_header_check = pd.read_excel(file_path, header=None, nrows=30, engine='openpyxl')
-        for i, row in df_header_check.iterrows():
-            row_as_string = ' '.join(map(str, row.values))
-            if 'Код ресурса, услуги' in row_as_string and 'Наименование строительного ресурса' in row_as_string:
-                return i
-    except Exception as e:
-        print(f"  - Не удалось прочитать шапку файла {os.path.basename(file_path)}: {e}")
+    for row_num, row in enumerate(rows):
+        if row_num >= HEADER_SEARCH_ROWS:
+            break
+        if is_header_row(row):
+            return row
     return None
 
-def process_excel_file(file_path: str, conn: sqlite3.Connection) -> int:
-    """Обрабатывает один Excel-файл и загружает его в базу данных."""
-    filename = os.path.basename(file_path)
-    print(f"\n--- Обработка файла: {filename} ---")
-    
-    header_row_index = find_header_row(file_path)
-    if header_row_index is None:
-        print("  - Ошибка: Не удалось найти строку с заголовками в Excel. Файл пропущен.")
-        return 0
+def _to_price(value):
+    """Цена как число (аналог pd.to_numeric(errors='coerce')). None, если это не число."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return None
+
+def _to_text(value):
+    """Значение ячейки как текст; пустые ячейки — None."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value)
+    return text if text.strip() else None
+
+def iter_estimate_rows(rows, header: tuple):
+    """
+    Отдает строки сметы (item_code, item_name, unit, price_per_unit) из итератора
+    строк листа, идущих после заголовка. Строки без числовой цены пропускаются.
+    """
+    positions = {name: header.index(name) for name in COLUMNS_MAP}
+    code_pos, name_pos, unit_pos, price_pos = (positions[name] for name in COLUMNS_MAP)
+    for row in rows:
+        if len(row) <= price_pos:
+            continue
+        price = _to_price(row[price_pos])
+        if price is None:
+            continue
+        yield (_to_text(row[code_pos]), _to_text(row[name_pos]), _to_text(row[unit_pos]), price)
+
+class EstimateFileError(Exception):
+    """Файл сметы не подходит для загрузки (нет строки заголовков или нужных колонок)."""
+
+def read_estimate_batches(file_path: str, batch_size: int = INSERT_BATCH_SIZE):
+    """
+    Читает файл сметы один раз в режиме openpyxl read_only и отдает строки
+    (item_code, item_name, unit, price_per_unit) пачками по batch_size: память
+    ограничена размером пачки. Выполняется и в процессах-воркерах.
+    Выбрасывает EstimateFileError, если таблицу сметы найти не удалось.
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = find_header(rows)
+        if header is None:
+            raise EstimateFileError("Не удалось найти строку с заголовками в Excel")
+        header = tuple(header)
+        if not all(col in header for col in COLUMNS_MAP):
+            raise EstimateFileError(f"В файле отсутствуют необходимые колонки ({', '.join(COLUMNS_MAP)})")
+        estimate_rows = iter_estimate_rows(rows, header)
+        while batch := list(itertools.islice(estimate_rows, batch_size)):
+            yield batch
+    finally:
+        workbook.close()
+
+# --- Манифест загруженных файлов ---
+# Таблица estimate_files хранит хеш содержимого каждого загруженного файла.
+# Файл с уже известным хешем пропускается, а измененный файл (то же имя,
+# другой хеш) заменяет свои прежние строки в fact_estimates одной транзакцией.
+# Размер и время изменения позволяют не хешировать заново нетронутые файлы.
+
+def compute_file_hash(file_path: str) -> str:
+    """Хеш содержимого файла (читается блоками, целиком в память не загружается)."""
+    file_hash = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(FILE_HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+class EstimateFile:
+    """Файл сметы, который нужно загрузить: путь, имя, размер, время изменения и хеш содержимого."""
+
+    def __init__(self, path: str, file_hash: str):
+        self.path = path
+        self.source_file = os.path.basename(path)
+        self.file_size = os.path.getsize(path)
+        self.file_mtime = os.path.getmtime(path)
+        self.file_hash = file_hash
+
+def find_new_files(conn: sqlite3.Connection, file_paths: list) -> list:
+    """
+    Отбирает файлы, которых еще нет в манифесте. Файл с тем же именем, размером
+    и временем изменения пропускается без хеширования; у остальных считается
+    хеш, и файл загружается, только если такого содержимого в манифесте нет.
+    """
+    known = {
+        source_file: (file_size, file_mtime)
+        for source_file, file_size, file_mtime in conn.execute(
+            'SELECT source_file, file_size, file_mtime FROM estimate_files')
+    }
+    new_files = {}
+    for path in file_paths:
+        source_file = os.path.basename(path)
+        if known.get(source_file) == (os.path.getsize(path), os.path.getmtime(path)):
+            continue
+        file_hash = compute_file_hash(path)
+        loaded_as = conn.execute('SELECT source_file FROM estimate_files WHERE file_hash = ?',
+                                 (file_hash,)).fetchone()
+        if loaded_as:
+            if loaded_as[0] == source_file:
+                # Содержимое то же (файл скопировали заново) — запоминаем новые размер и время
+                with conn:
+                    conn.execute('UPDATE estimate_files SET file_size = ?, file_mtime = ? WHERE file_hash = ?',
+                                 (os.path.getsize(path), os.path.getmtime(path), file_hash))
+            continue
+        new_files.setdefault(file_hash, EstimateFile(path, file_hash))
+    return list(new_files.values())
+
+# --- Единственный писатель в analytics.db ---
+
+class EstimatesWriter:
+    """
+    Принимает строки смет пачками (в любом порядке файлов) во временную
+    таблицу estimates_staging, а когда файл прочитан целиком, одной транзакцией
+    заменяет его строки в fact_estimates и записывает файл в манифест.
+    Недочитанный из-за ошибки файл не оставляет в fact_estimates ничего.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS estimates_staging (
+                file_hash TEXT NOT NULL,
+                item_code TEXT,
+                item_name TEXT,
+                unit TEXT,
+                price_per_unit REAL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS temp.idx_estimates_staging_hash ON estimates_staging (file_hash)')
+
+    def add_rows(self, file_hash: str, rows: list):
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO estimates_staging (file_hash, item_code, item_name, unit, price_per_unit)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(file_hash, *row) for row in rows])
+
+    def commit_file(self, estimate_file: EstimateFile) -> int:
+        """Заменяет строки файла в fact_estimates строками из staging. Возвращает их количество."""
+        upload_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.conn:
+            self.conn.execute('DELETE FROM fact_estimates WHERE source_file = ?', (estimate_file.source_file,))
+            rows_count = self.conn.execute('''
+                INSERT INTO fact_estimates (upload_date, source_file, item_code, item_name, unit, price_per_unit)
+                SELECT ?, ?, item_code, item_name, unit, price_per_unit
+                FROM estimates_staging WHERE file_hash = ? ORDER BY rowid
+            ''', (upload_date, estimate_file.source_file, estimate_file.file_hash)).rowcount
+            self.conn.execute('DELETE FROM estimate_files WHERE source_file = ? OR file_hash = ?',
+                              (estimate_file.source_file, estimate_file.file_hash))
+            self.conn.execute('''
+                INSERT INTO estimate_files (file_hash, source_file, file_size, file_mtime, rows_count, loaded_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (estimate_file.file_hash, estimate_file.source_file, estimate_file.file_size,
+                  estimate_file.file_mtime, rows_count, upload_date))
+            self.conn.execute('DELETE FROM estimates_staging WHERE file_hash = ?', (estimate_file.file_hash,))
+        return rows_count
+
+    def discard_file(self, file_hash: str):
+        with self.conn:
+            self.conn.execute('DELETE FROM estimates_staging WHERE file_hash = ?', (file_hash,))
+
+# --- Параллельное чтение файлов ---
+# Файлы читаются в пуле процессов, пачки строк приходят в главный процесс
+# через ограниченную очередь (воркер ждет, если писатель не успевает).
 
+# Очередь пачек строк от воркеров к писателю (задается один раз на процесс-воркер)
+_worker_queue = None
+
+def _init_worker(result_queue):
+    global _worker_queue
+    _worker_queue = result_queue
+
+def _read_file_in_worker(file_hash: str, file_path: str):
+    """Выполняется в воркере: отправляет писателю пачки строк файла, затем 'done' (или 'error')."""
     try:
-        df = pd.read_excel(file_path, header=header_row_index, engine='openpyxl')
-        
-        columns_map = {
-            'Код ресурса, услуги': 'item_code',
-            'Наименование строительного ресурса, услуги': 'item_name',
-            'Единица измерения': 'unit',
-            'Сметная цена в текущем уровне цен, руб.': 'price_per_unit'
-        }
-
-        if not all(col in df.columns for col in columns_map.keys()):
-            print(f"  - Ошибка: в файле отсутствуют необходимые колонки ({', '.join(columns_map.keys())}). Файл пропущен.")
-            return 0
-
-        df = df.rename(columns=columns_map)
-        df = df[list(columns_map.values())] # Оставляем только нужные колонки
-        
-        df.dropna(subset=['item_code', 'price_per_unit'], how='all', inplace=True)
-        df['price_per_unit'] = pd.to_numeric(df['price_per_unit'], errors='coerce')
-        df.dropna(subset=['price_per_unit'], inplace=True)
-        
-        df['upload_date'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        df['source_file'] = filename
-        
-        df.to_sql('fact_estimates', conn, if_exists='append', index=False)
-        
-        print(f"  - Успешно загружено {len(df)} строк.")
-        return len(df)
-        
+        for batch in read_estimate_batches(file_path):
+            _worker_queue.put(('rows', file_hash, batch))
+        _worker_queue.put(('done', file_hash, None))
     except Exception as e:
-        print(f"  - Произошла ошибка при обработке файла: {e}")
-        return 0
+        _worker_queue.put(('error', file_hash, str(e)))
+
+def _report_file(estimate_file: EstimateFile, kind: str, payload) -> str:
+    """Строки отчета о загрузке файла."""
+    report = f"\n--- Обработка файла: {estimate_file.source_file} ---\n"
+    if kind == 'done':
+        return report + f"  - Успешно загружено {payload} строк."
+    return report + f"  - Ошибка: {payload}. Файл пропущен."
+
+def load_estimate_files(conn: sqlite3.Connection, estimate_files: list, workers: int = 1) -> int:
+    """
+    Загружает файлы смет через единственного писателя (EstimatesWriter).
+    При workers > 1 файлы читаются параллельно в пуле процессов.
+    Возвращает количество загруженных строк.
+    """
+    writer = EstimatesWriter(conn)
+    total_rows = 0
+
+    if workers <= 1 or len(estimate_files) <= 1:
+        for estimate_file in estimate_files:
+            try:
+                for batch in read_estimate_batches(estimate_file.path):
+                    writer.add_rows(estimate_file.file_hash, batch)
+                rows_count = writer.commit_file(estimate_file)
+                total_rows += rows_count
+                print(_report_file(estimate_file, 'done', rows_count))
+            except Exception as e:
+                writer.discard_file(estimate_file.file_hash)
+                print(_report_file(estimate_file, 'error', e))
+        return total_rows
+
+    context = multiprocessing.get_context()
+    result_queue = context.Queue(maxsize=workers * RESULT_QUEUE_BATCHES_PER_WORKER)
+    pending = {estimate_file.file_hash: estimate_file for estimate_file in estimate_files}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(result_queue,)) as pool:
+        futures = [pool.submit(_read_file_in_worker, estimate_file.file_hash, estimate_file.path)
+                   for estimate_file in estimate_files]
+        while pending:
+            try:
+                kind, file_hash, payload = result_queue.get(timeout=RESULT_POLL_TIMEOUT)
+            except queue.Empty:
+                # Воркер мог упасть, не успев сообщить о завершении файла
+                if all(future.done() for future in futures):
+                    break
+                continue
+            if kind == 'rows':
+                writer.add_rows(file_hash, payload)
+                continue
+            estimate_file = pending.pop(file_hash)
+            if kind == 'done':
+                rows_count = writer.commit_file(estimate_file)
+                total_rows += rows_count
+                print(_report_file(estimate_file, kind, rows_count))
+            else:
+                writer.discard_file(file_hash)
+                print(_report_file(estimate_file, kind, payload))
+
+    for file_hash, estimate_file in pending.items():
+        writer.discard_file(file_hash)
+        print(_report_file(estimate_file, 'error', "Процесс-воркер завершился, не дочитав файл"))
+    return total_rows
 
 def init_estimates_table(conn: sqlite3.Connection):
-    """Создает таблицу для хранения смет, если она еще не существует."""
+    """Создает таблицу для хранения смет и манифест загруженных файлов, если они еще не существуют."""
     cursor = conn.cursor()
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS fact_estimates (
@@ -92,11 +325,26 @@ def init_estimates_table(conn: sqlite3.Connection):
         price_per_unit REAL
     )
     ''')
+    # Замена строк измененного файла ищет их по имени файла
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fact_estimates_source_file ON fact_estimates (source_file)')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS estimate_files (
+        file_hash TEXT PRIMARY KEY,
+        source_file TEXT NOT NULL UNIQUE,
+        file_size INTEGER,
+        file_mtime REAL,
+        rows_count INTEGER,
+        loaded_at TIMESTAMP NOT NULL
+    )
+    ''')
     conn.commit()
     print("Проверено/создано: таблица 'fact_estimates' для хранения смет готова.")
 
-def main():
-    """Главная функция для поиска и загрузки всех смет из папки."""
+def main(workers: int = ESTIMATE_WORKERS):
+    """
+    Главная функция для поиска и загрузки всех смет из папки.
+    Загружаются только новые и измененные файлы (см. манифест estimate_files).
+    """
     print("="*50)
     print("--- Запуск модуля загрузки смет из Excel ---")
     
@@ -112,16 +360,18 @@ def main():
 
     db_path = database.get_dds_db_path()
     conn = database.get_db_connection(db_path)
-    
-    # 1. Гарантируем, что таблица существует
-    init_estimates_table(conn)
-    
-    # 2. Обрабатываем каждый найденный файл
-    total_rows_uploaded = 0
-    for file in excel_files:
-        total_rows_uploaded += process_excel_file(file, conn)
+    try:
+        # 1. Гарантируем, что таблицы существуют
+        init_estimates_table(conn)
+
+        # 2. Отбираем новые и измененные файлы по манифесту
+        new_files = find_new_files(conn, excel_files)
+        print(f"Найдено файлов: {len(excel_files)}, новых или измененных: {len(new_files)}.")
 
-    conn.close()
+        # 3. Загружаем их
+        total_rows_uploaded = load_estimate_files(conn, new_files, workers=workers)
+    finally:
+        conn.close()
     print("="*50)
     print(f"Загрузка завершена. Всего добавлено {total_rows_uploaded} строк в таблицу 'fact_estimates'.")
 
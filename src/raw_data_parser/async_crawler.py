@@ -0,0 +1,298 @@
+# src/raw_data_parser/async_crawler.py
+
+# Импортируем наши модули
+from src.common import database
+from src.raw_data_parser import fast_parser
+from src.raw_data_parser import fetchers
+from src.raw_data_parser import fingerprints
+from src.raw_data_parser import frontier
+from src.raw_data_parser import parser
+
+# Импортируем служебные библиотеки
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+from tqdm import tqdm
+import aiohttp
+import asyncio
+import time
+
+# Сколько раз повторять запрос, получивший 429/5xx или сетевую ошибку
+MAX_ATTEMPTS = 4
+REQUEST_TIMEOUT = 30
+# Сколько страниц категории загружать наперед, когда известно их число
+DEFAULT_PREFETCH_PAGES = 4
+
+# --- Адаптивный ограничитель частоты запросов ---
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket для одного хоста, скорость которого подстраивается под сайт
+    (AIMD): при быстрых ответах скорость понемногу растет, при медленных
+    ответах снижается, а на 429/5xx — падает вдвое, с учетом Retry-After.
+    """
+
+    def __init__(self, rate: float = 0.5, min_rate: float = 0.1, max_rate: float = 3.0,
+                 burst: int = 1, target_latency: float = 2.0, increase_step: float = 0.05):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.target_latency = target_latency
+        self.increase_step = increase_step
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Ждет, пока в ведре появится токен на следующий запрос."""
+        async with self._lock:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def record(self, latency: float, status: int, retry_after: float = None):
+        """Подстраивает скорость по результату очередного запроса."""
+        if status == 429 or status >= 500:
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        elif latency > self.target_latency:
+            self.rate = max(self.min_rate, self.rate * 0.8)
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# --- Загрузка и обход категорий ---
+
+class AsyncCrawler:
+    """
+    Асинхронный обход категорий по HTTP: `concurrency` корутин-воркеров берут
+    категории в аренду из фронтира обхода (frontier.py), так что одновременно
+    в полете не больше `concurrency` запросов. Парсинг HTML выполняется в пуле
+    процессов, запись в RAW и работа с фронтиром — в единственном потоке
+    писателя, чтобы не блокировать цикл событий.
+    """
+
+    def __init__(self, raw_writer, crawl_frontier, parse_executor, db_executor, concurrency: int = 8,
+                 limiter_options: dict = None, parse_listing=None,
+                 fingerprint_pages: int = fingerprints.DEFAULT_CHECK_PAGES,
+                 full_refresh_days: float = fingerprints.DEFAULT_FULL_REFRESH_DAYS,
+                 prefetch_pages: int = DEFAULT_PREFETCH_PAGES):
+        self.raw_writer = raw_writer
+        self.prefetch_pages = max(1, prefetch_pages)
+        self.crawl_frontier = crawl_frontier
+        self.fingerprint_pages = fingerprint_pages
+        self.full_refresh_days = full_refresh_days
+        self.parse_listing = parse_listing or parser.parse_listing_page
+        self.parse_executor = parse_executor
+        self.db_executor = db_executor
+        self.concurrency = concurrency
+        self.limiter_options = limiter_options or {}
+        self.limiters = {}
+        self.pages_fetched = 0
+
+    def _limiter_for(self, url: str) -> AdaptiveRateLimiter:
+        host = urlsplit(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = AdaptiveRateLimiter(**self.limiter_options)
+        return self.limiters[host]
+
+    async def fetch_html(self, session, url: str, request_headers: dict = None):
+        """
+        Загружает страницу с учетом лимита хоста и повторами на 429/5xx.
+        Возвращает (html, заголовки ответа); для отсутствующей страницы — (None, {}),
+        на условный запрос (request_headers), если страница не изменилась, — (parser.NOT_MODIFIED, заголовки).
+        """
+        limiter = self._limiter_for(url)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            await limiter.acquire()
+            started = time.monotonic()
+            try:
+                async with session.get(url, headers=request_headers) as response:
+                    html = await response.text(errors='replace')
+                    limiter.record(time.monotonic() - started, response.status,
+                                   _parse_retry_after(response.headers.get('Retry-After')))
+                    if response.status == 404:
+                        return None, {}
+                    if response.status == 304:
+                        return parser.NOT_MODIFIED, dict(response.headers)
+                    if response.status == 429 or response.status >= 500:
+                        if attempt == MAX_ATTEMPTS:
+                            response.raise_for_status()
+                        continue
+                    response.raise_for_status()
+                    self.pages_fetched += 1
+                    return html, dict(response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                limiter.record(time.monotonic() - started, 503)
+                if attempt == MAX_ATTEMPTS:
+                    raise
+        return None, {}
+
+    async def crawl_category(self, session, item, page_check):
+        """
+        Обходит страницы одной категории (см. parser.iter_category_pages).
+        Когда число страниц известно, следующие prefetch_pages страниц
+        загружаются параллельно, но разбираются и записываются по порядку.
+        """
+        loop = asyncio.get_running_loop()
+        page_num = item.next_page
+        parsed_in_category_urls = item.seen_first_urls
+        page_count = None
+        fetches = {}
+
+        def prefetch(first_page: int, last_page: int):
+            for number in range(first_page, last_page + 1):
+                if number not in fetches:
+                    fetches[number] = asyncio.create_task(self.fetch_html(
+                        session, f"{item.category_url}?p={number}", parser.conditional_headers(page_check, number)))
+
+        prefetch(page_num, page_num)
+        try:
+            while True:
+                html, headers = await fetches.pop(page_num)
+                if html is parser.NOT_MODIFIED:
+                    if not page_check.not_modified(page_num): break
+                    page_num += 1
+                    prefetch(page_num, page_num)
+                    continue
+                if not html: break
+
+                cards = await loop.run_in_executor(self.parse_executor, self.parse_listing, html)
+                if parser.is_last_page(cards, parsed_in_category_urls): break
+
+                page_count = max(filter(None, (page_count, parser.get_page_count(html, len(cards)))), default=None)
+                keep_going = page_check(page_num, cards, headers)
+                has_next_page = keep_going and (page_count is None or page_num < page_count)
+                if has_next_page:
+                    prefetch(page_num + 1, min(page_count, page_num + self.prefetch_pages) if page_count else page_num + 1)
+
+                products = [card for card in cards if card.get('product_id')]
+                checkpoint = self.crawl_frontier.page_checkpoint(item, page_num, parsed_in_category_urls)
+                await loop.run_in_executor(self.db_executor, _write_page, self.raw_writer, products, checkpoint)
+                if not has_next_page: break
+                page_num += 1
+        finally:
+            # Страницы, загруженные наперед, но уже не нужные (категория пропущена или ошибка)
+            for task in fetches.values():
+                task.cancel()
+            await asyncio.gather(*fetches.values(), return_exceptions=True)
+
+        await loop.run_in_executor(self.db_executor, _finish_category,
+                                   self.raw_writer, self.crawl_frontier, item, page_check)
+
+    async def _worker(self, session, progress):
+        loop = asyncio.get_running_loop()
+        while True:
+            item, page_check = await loop.run_in_executor(
+                self.db_executor, _lease_next, self.raw_writer, self.crawl_frontier,
+                self.fingerprint_pages, self.full_refresh_days)
+            if item is None:
+                return
+            try:
+                await self.crawl_category(session, item, page_check)
+                progress.update(1)
+            except frontier.LeaseLostError as e:
+                tqdm.write(f"\n{e}")
+            except Exception as e:
+                # Категория вернется в очередь с той же страницы (см. frontier.release)
+                tqdm.write(f"\nОшибка при обработке категории {item.category_url}: {e}")
+                await loop.run_in_executor(self.db_executor, _release_category,
+                                           self.raw_writer, self.crawl_frontier, item, str(e))
+
+    async def run(self, total_categories: int = None):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=fetchers.HTTP_HEADERS) as session:
+            with tqdm(total=total_categories, desc="Обработка категорий") as progress:
+                workers = [asyncio.create_task(self._worker(session, progress))
+                           for _ in range(self.concurrency)]
+                try:
+                    await asyncio.gather(*workers)
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+
+# --- Функции, выполняемые в потоке писателя RAW ---
+
+def _lease_next(raw_writer, crawl_frontier, fingerprint_pages: int, full_refresh_days: float):
+    item = crawl_frontier.lease_next()
+    if item is None:
+        return None, None
+    page_check = fingerprints.load_checks(raw_writer.conn, [item.category_url],
+                                          fingerprint_pages, full_refresh_days)[item.category_url]
+    return item, page_check
+
+def _write_page(raw_writer, products: list, checkpoint):
+    for product_data in products:
+        raw_writer.add(product_data)
+    raw_writer.flush(checkpoint=checkpoint)
+
+def _finish_category(raw_writer, crawl_frontier, item, page_check):
+    raw_writer.flush()
+    fingerprints.save_check(raw_writer.conn, page_check)
+    crawl_frontier.complete(item)
+
+def _release_category(raw_writer, crawl_frontier, item, error: str):
+    raw_writer.flush()
+    crawl_frontier.release(item, error=error)
+
+# --- Точка входа ---
+
+def run_async_crawl(source_name: str, is_test: bool = False, concurrency: int = 8,
+                    total_categories: int = None, parse_workers: int = None, parse_engine: str = 'lxml',
+                    limiter_options: dict = None,
+                    fingerprint_pages: int = fingerprints.DEFAULT_CHECK_PAGES,
+                    full_refresh_days: float = fingerprints.DEFAULT_FULL_REFRESH_DAYS,
+                    lease_seconds: int = frontier.DEFAULT_LEASE_SECONDS,
+                    prefetch_pages: int = DEFAULT_PREFETCH_PAGES) -> int:
+    """
+    Обходит категории из фронтира обхода асинхронно (только HTTP, без браузера).
+    limiter_options — параметры AdaptiveRateLimiter (rate, max_rate, ...).
+    fingerprint_pages / full_refresh_days — см. fingerprints.load_checks.
+    prefetch_pages — сколько страниц категории загружать параллельно наперед.
+    Возвращает количество сохраненных в RAW товаров.
+    """
+    # sqlite3-соединение привязано к потоку, поэтому писатель создается,
+    # используется и закрывается в одном и том же потоке
+    db_executor = ThreadPoolExecutor(max_workers=1)
+    raw_writer = db_executor.submit(database.RawWriter, source_name, is_test).result()
+    crawl_frontier = frontier.CrawlFrontier(raw_writer.conn, lease_seconds=lease_seconds)
+    crawler = None
+    started = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=parse_workers) as parse_executor:
+            crawler = AsyncCrawler(raw_writer, crawl_frontier, parse_executor, db_executor,
+                                   concurrency=concurrency, limiter_options=limiter_options,
+                                   parse_listing=fast_parser.get_listing_parser(parse_engine),
+                                   fingerprint_pages=fingerprint_pages, full_refresh_days=full_refresh_days,
+                                   prefetch_pages=prefetch_pages)
+            asyncio.run(crawler.run(total_categories))
+    finally:
+        db_executor.submit(raw_writer.close).result()
+        db_executor.shutdown()
+        if crawler:
+            elapsed = time.monotonic() - started
+            print(f"\nЗагружено {crawler.pages_fetched} страниц за {elapsed:.0f} с "
+                  f"({crawler.pages_fetched / max(elapsed, 1e-9):.2f} стр/с).")
+    return raw_writer.total_written
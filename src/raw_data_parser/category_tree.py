@@ -0,0 +1,166 @@
+# src/raw_data_parser/category_tree.py
+
+# Дерево категорий каталога, закэшированное на диске. Страница /catalog/
+# загружается не на каждом запуске, а раз в ttl_hours часов (или по
+# требованию force_refresh); между запусками список категорий берется из
+# JSON-файла в data/. Для каждой категории верхнего уровня сохраняется
+# глубина вложенных подкатегорий и число товаров, если каталог их показывает:
+# по числу товаров фронтир (frontier.py) раздает большие категории первыми.
+
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+from bs4 import BeautifulSoup
+
+from src.raw_data_parser import parser
+
+# Как долго (в часах) закэшированное дерево категорий считается свежим
+DEFAULT_TTL_HOURS = 24
+
+CATALOG_URL = f"{parser.BASE_URL}/catalog/"
+# Страница каталога готова, когда на ней появились ссылки на категории
+# (в браузере или уже в HTTP-ответе); ссылка меню на сам /catalog/ не в счет
+CATALOG_READY_SELECTOR = 'a[href^="/catalog/"]:not([href="/catalog/"])'
+
+
+def get_tree_cache_path(is_test: bool = False) -> str:
+    """Возвращает путь к файлу с деревом категорий (рабочему или тестовому)."""
+    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    filename = 'category_tree_test.json' if is_test else 'category_tree.json'
+    return os.path.join(base_dir, 'data', filename)
+
+
+# --- Разбор страницы каталога ---
+
+def _catalog_path_ids(href: str):
+    """Числовые идентификаторы из ссылки вида /catalog/123/456/. None для прочих ссылок."""
+    if not href or not href.startswith('/catalog/'):
+        return None
+    ids = [part for part in href.split('?')[0].split('/')[2:] if part]
+    if not ids or not all(part.isdigit() for part in ids):
+        return None
+    return ids
+
+
+def _title_and_item_count(tag) -> tuple:
+    """
+    Название категории и число товаров из ссылки. Число берется из счетчика
+    внутри ссылки (элемент с 'count' в data-test или классе), в название он не входит.
+    """
+    counter = tag.find(lambda t: 'count' in (t.get('data-test') or '')
+                       or any('count' in class_name for class_name in t.get('class') or []))
+    counter_strings = set(counter.stripped_strings) if counter is not None else set()
+    title = ' '.join(text for text in tag.stripped_strings if text not in counter_strings) or None
+    digits = re.sub(r'\D', '', ''.join(counter_strings))
+    return title, (int(digits) if digits else None)
+
+
+def parse_category_tree(html) -> list:
+    """
+    Разбирает HTML страницы каталога. Возвращает категории верхнего уровня
+    (ссылки /catalog/<id>/) в порядке их появления на странице:
+    [{'url', 'title', 'depth', 'subcategories', 'item_count'}, ...].
+    depth — глубина вложенности подкатегорий (1 — подкатегорий на странице нет),
+    subcategories — число найденных подкатегорий, item_count — число товаров или None.
+    """
+    if not html:
+        return []
+    soup = BeautifulSoup(html, 'lxml')
+    categories = {}
+    nested_links = []
+    for tag in soup.find_all('a', href=True):
+        ids = _catalog_path_ids(tag['href'])
+        if ids is None:
+            continue
+        if len(ids) > 1:
+            nested_links.append(ids)
+            continue
+        url = f"{parser.BASE_URL}/catalog/{ids[0]}/"
+        category = categories.setdefault(url, {'url': url, 'title': None, 'depth': 1,
+                                               'subcategories': 0, 'item_count': None})
+        title, item_count = _title_and_item_count(tag)
+        category['title'] = category['title'] or title
+        if item_count is not None:
+            category['item_count'] = max(item_count, category['item_count'] or 0)
+
+    # Подкатегории: ссылки, путь которых продолжает путь категории верхнего уровня
+    seen_nested = set()
+    for ids in nested_links:
+        category = categories.get(f"{parser.BASE_URL}/catalog/{ids[0]}/")
+        if category is None or tuple(ids) in seen_nested:
+            continue
+        seen_nested.add(tuple(ids))
+        category['subcategories'] += 1
+        category['depth'] = max(category['depth'], len(ids))
+    return list(categories.values())
+
+
+# --- Кэш на диске ---
+
+def load_cached_tree(cache_path: str, ttl_hours: float = DEFAULT_TTL_HOURS, allow_stale: bool = False):
+    """
+    Читает дерево категорий из кэша. Возвращает список категорий или None,
+    если кэша нет, он поврежден или старше ttl_hours (allow_stale=True
+    отдает и устаревший кэш).
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        fetched_at = datetime.fromisoformat(cached['fetched_at'])
+        categories = cached['categories']
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Кэш дерева категорий {cache_path} поврежден ({e}), загружаю каталог заново.")
+        return None
+    if not allow_stale and datetime.now() - fetched_at > timedelta(hours=ttl_hours):
+        return None
+    return categories
+
+
+def save_tree(cache_path: str, categories: list):
+    """Сохраняет дерево категорий; файл подменяется целиком, чтобы не оставить его недописанным."""
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fetched_at': datetime.now().isoformat(timespec='seconds'), 'categories': categories},
+                  f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, cache_path)
+
+
+def get_category_tree(fetcher_factory, is_test: bool = False, ttl_hours: float = DEFAULT_TTL_HOURS,
+                      force_refresh: bool = False) -> list:
+    """
+    Возвращает дерево категорий: из кэша, если он свежее ttl_hours, иначе
+    загружает страницу каталога и обновляет кэш. fetcher_factory() вызывается
+    только при загрузке и должен вернуть загрузчик страниц (см. fetchers.py) —
+    тот же загрузчик затем можно использовать для обхода категорий.
+    Если каталог загрузить не удалось, используется устаревший кэш (если он есть).
+    """
+    cache_path = get_tree_cache_path(is_test)
+    if not force_refresh:
+        categories = load_cached_tree(cache_path, ttl_hours)
+        if categories:
+            print(f"Список категорий взят из кэша {cache_path}: {len(categories)} категорий.")
+            return categories
+
+    categories = []
+    try:
+        fetcher = fetcher_factory()
+        if fetcher:
+            categories = parse_category_tree(fetcher.fetch_html(CATALOG_URL, CATALOG_READY_SELECTOR))
+    except Exception as e:
+        print(f"Ошибка при загрузке страницы каталога: {e}")
+
+    if categories:
+        print(f"Найдено {len(categories)} уникальных ТОП-уровневых категорий.")
+        save_tree(cache_path, categories)
+        return categories
+
+    stale_categories = load_cached_tree(cache_path, allow_stale=True)
+    if stale_categories:
+        print(f"Каталог загрузить не удалось, использую устаревший кэш: {len(stale_categories)} категорий.")
+        return stale_categories
+    return []
@@ -0,0 +1,227 @@
+# src/raw_data_parser/fast_parser.py
+
+# Альтернативный движок извлечения карточек на lxml.
+# Страница листинга парсится один раз, поля всех карточек достаются заранее
+# скомпилированными XPath-выражениями, дерево не изменяется.
+# Результат совпадает с parser.parse_listing_page / parser.parse_product_card
+# один в один (включая raw_html), поэтому движки можно сверять между собой.
+
+# Импортируем наши модули
+from src.raw_data_parser import parser
+
+# Импортируем служебные библиотеки
+from lxml import etree
+import json
+import re
+
+# --- Скомпилированные XPath-выражения ---
+
+_CARDS = etree.XPath("//div[@data-test='product-card-catalog-wide']")
+_LINK = etree.XPath(".//a[@data-test='product-link']")
+_TITLE = etree.XPath(".//span[@data-test='product-title']")
+_CODE = etree.XPath(".//p[@data-test='product-code']")
+_GOLD_PRICE = etree.XPath(".//p[@data-test='product-gold-price']")
+_RETAIL_PRICE = etree.XPath(".//p[@data-test='product-retail-price']")
+_ACTIVE_UNIT = etree.XPath(".//div[contains(@class, 'tab-active') and contains(@class, 'price-switcher-tab')]")
+_BREADCRUMBS = etree.XPath(".//div[@data-test='product-breadcrumbs']")
+_BREADCRUMB_LINKS = etree.XPath(".//a")
+_DESCRIPTION = etree.XPath(".//p[@data-test='product-description']")
+# BeautifulSoup.get_text() не учитывает комментарии и содержимое script/style/template
+_TEXTS = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+_TEXTS_AND_BRS = etree.XPath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)] | .//br")
+
+# --- Сериализация в том же виде, что str(tag) у BeautifulSoup ---
+
+# Теги, которые BeautifulSoup выводит как <tag/>, если у них нет содержимого
+_VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link',
+    'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'nextid', 'spacer',
+}
+# Теги, внутри которых BeautifulSoup не экранирует текст
+_RAW_TEXT_TAGS = {'script', 'style'}
+# Многозначные атрибуты: BeautifulSoup разбивает их по пробелам и склеивает через один пробел
+_LIST_ATTRIBUTES = {
+    '*': {'class', 'accesskey', 'dropzone'},
+    'a': {'rel', 'rev'}, 'link': {'rel', 'rev'}, 'td': {'headers'}, 'th': {'headers'},
+    'form': {'accept-charset'}, 'object': {'archive'}, 'area': {'rel'},
+    'icon': {'sizes'}, 'iframe': {'sandbox'}, 'output': {'for'},
+}
+_NON_WHITESPACE = re.compile(r"\S+")
+# BeautifulSoup схлопывает строки из одних ASCII-пробелов в '\n' или ' ' (кроме как внутри pre/textarea)
+_ASCII_SPACES = str.maketrans('', '', '\x20\x0a\x09\x0c\x0d')
+_PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+_IN_PRESERVE_WHITESPACE = etree.XPath("boolean(ancestor-or-self::pre or ancestor-or-self::textarea)")
+
+
+def _collapse_whitespace(text: str) -> str:
+    if text.translate(_ASCII_SPACES) == '':
+        return '\n' if '\n' in text else ' '
+    return text
+
+def _escape(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def _quote_attribute(value: str) -> str:
+    value = _escape(value)
+    if '"' in value:
+        if "'" in value:
+            return '"' + value.replace('"', '&quot;') + '"'
+        return "'" + value + "'"
+    return '"' + value + '"'
+
+def _serialize(element, parts: list, raw_text: bool = False, preserve: bool = False):
+    tag = element.tag
+    if tag is etree.Comment:
+        parts.append(f"<!--{element.text or ''}-->")
+    elif tag is etree.ProcessingInstruction:
+        parts.append(f"<?{element.target} {element.text or ''}>")
+    else:
+        list_attributes = _LIST_ATTRIBUTES['*'] | _LIST_ATTRIBUTES.get(tag, set())
+        parts.append('<' + tag)
+        for name, value in sorted(element.attrib.items()):
+            if name in list_attributes:
+                value = ' '.join(_NON_WHITESPACE.findall(value))
+            parts.append(f" {name}={_quote_attribute(value)}")
+        if tag in _VOID_TAGS and element.text is None and len(element) == 0:
+            parts.append('/>')
+        else:
+            parts.append('>')
+            inner_raw = raw_text or tag in _RAW_TEXT_TAGS
+            inner_preserve = preserve or tag in _PRESERVE_WHITESPACE_TAGS
+            if element.text:
+                text = element.text if inner_preserve else _collapse_whitespace(element.text)
+                parts.append(text if inner_raw else _escape(text))
+            for child in element:
+                _serialize(child, parts, inner_raw, inner_preserve)
+            parts.append(f"</{tag}>")
+    if element.tail:
+        tail = element.tail if preserve else _collapse_whitespace(element.tail)
+        parts.append(tail if raw_text else _escape(tail))
+
+def to_soup_html(element) -> str:
+    """HTML элемента (без хвостового текста) в точности как str() у BeautifulSoup."""
+    parts = []
+    tail, element.tail = element.tail, None
+    try:
+        _serialize(element, parts, preserve=_IN_PRESERVE_WHITESPACE(element.getparent())
+                   if element.getparent() is not None else False)
+    finally:
+        element.tail = tail
+    return ''.join(parts)
+
+# --- Извлечение текста так же, как в BeautifulSoup ---
+
+def _soup_string(node) -> str:
+    """Текстовый узел lxml в том виде, в каком его хранит BeautifulSoup."""
+    if node.translate(_ASCII_SPACES) != '':
+        return node
+    parent = node.getparent()
+    if node.is_tail:
+        parent = parent.getparent()
+    if parent is not None and _IN_PRESERVE_WHITESPACE(parent):
+        return node
+    return _collapse_whitespace(node)
+
+def _text(element) -> str:
+    """Аналог tag.text / tag.get_text()."""
+    return ''.join(_soup_string(node) for node in _TEXTS(element))
+
+def _stripped_text(element) -> str:
+    """Аналог tag.get_text(strip=True)."""
+    return ''.join(text.strip() for text in _TEXTS(element))
+
+def _first(xpath, element):
+    found = xpath(element)
+    return found[0] if found else None
+
+# --- Публичный интерфейс ---
+
+def parse_product_card(card) -> dict:
+    """Парсит одну карточку (lxml-элемент). Результат совпадает с parser.parse_product_card."""
+    data = {
+        'url': None, 'title': None, 'product_id': None, 'gold_price': None,
+        'retail_price': None, 'unit': None, 'categories': [], 'features': {},
+        'raw_html': to_soup_html(card)
+    }
+
+    link_tag = _first(_LINK, card)
+    if link_tag is not None and 'href' in link_tag.attrib:
+        data['url'] = parser.BASE_URL + link_tag.get('href')
+
+    title_tag = _first(_TITLE, card)
+    if title_tag is not None:
+        data['title'] = _text(title_tag).strip()
+
+    code_tag = _first(_CODE, card)
+    if code_tag is not None:
+        data['product_id'] = parser.product_id_from_text(_text(code_tag))
+
+    gold_price_tag = _first(_GOLD_PRICE, card)
+    if gold_price_tag is not None:
+        data['gold_price'] = parser.price_from_text(_stripped_text(gold_price_tag))
+
+    retail_price_tag = _first(_RETAIL_PRICE, card)
+    if retail_price_tag is not None:
+        data['retail_price'] = parser.price_from_text(_stripped_text(retail_price_tag))
+
+    active_unit_tag = _first(_ACTIVE_UNIT, card)
+    if active_unit_tag is not None:
+        data['unit'] = _stripped_text(active_unit_tag)
+
+    breadcrumbs_div = _first(_BREADCRUMBS, card)
+    if breadcrumbs_div is not None:
+        data['categories'] = [_stripped_text(cat) for cat in _BREADCRUMB_LINKS(breadcrumbs_div)]
+
+    description_p = _first(_DESCRIPTION, card)
+    if description_p is not None:
+        # Вместо замены <br> в дереве подставляем разделитель при обходе
+        full_text = ''.join(
+            parser.FEATURES_SEPARATOR if isinstance(node, etree._Element) else node.strip()
+            for node in _TEXTS_AND_BRS(description_p)
+        )
+        data['features'] = parser.features_from_text(full_text)
+
+    data['features'] = json.dumps(data['features'], ensure_ascii=False)
+    data['categories'] = json.dumps(data['categories'], ensure_ascii=False)
+    return data
+
+
+def parse_listing_page(html) -> list:
+    """Парсит страницу листинга за один проход. Результат совпадает с parser.parse_listing_page."""
+    if not html:
+        return []
+    root = etree.fromstring(html, etree.HTMLParser())
+    if root is None:
+        return []
+    return [parse_product_card(card) for card in _CARDS(root)]
+
+
+def find_mismatches(html) -> list:
+    """
+    Сверяет движок lxml с эталонным parser.parse_listing_page на одной странице.
+    Возвращает список (номер карточки, поле) для расхождений; пустой — движки совпали.
+    """
+    expected = parser.parse_listing_page(html)
+    actual = parse_listing_page(html)
+    if len(expected) != len(actual):
+        return [(None, 'cards_count')]
+    return [
+        (index, field)
+        for index, (expected_card, actual_card) in enumerate(zip(expected, actual))
+        for field in expected_card
+        if expected_card[field] != actual_card.get(field)
+    ]
+
+# --- Выбор движка извлечения ---
+
+PARSE_ENGINES = {
+    'bs4': parser.parse_listing_page,
+    'lxml': parse_listing_page,
+}
+
+def get_listing_parser(engine: str = 'lxml'):
+    """Возвращает функцию html -> список карточек для движка 'bs4' или 'lxml'."""
+    if engine not in PARSE_ENGINES:
+        raise ValueError(f"Неизвестный движок извлечения '{engine}'. Допустимые: {', '.join(PARSE_ENGINES)}")
+    return PARSE_ENGINES[engine]
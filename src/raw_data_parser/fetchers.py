@@ -0,0 +1,249 @@
+# src/raw_data_parser/fetchers.py
+
+# Импортируем наши модули
+from src.raw_data_parser import parser
+
+# Импортируем служебные библиотеки
+import threading
+import time
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+# Маркер карточки товара в HTML листинга. Если его нет в ответе сервера,
+# значит карточки дорисовываются скриптами и нужен настоящий браузер.
+PRODUCT_CARD_MARKER = 'product-card-catalog-wide'
+
+# Сколько страниц подряд HTTP должен вернуть неготовыми (см. is_page_ready), чтобы мы перестали
+# пробовать его и сразу шли в браузер
+HTTP_MISSES_BEFORE_DISABLE = 5
+
+FETCH_MODES = ('selenium', 'http', 'auto')
+
+# Минимальный интервал (в секундах) между началами двух запросов одного загрузчика — вежливость к сайту
+DEFAULT_MIN_REQUEST_INTERVAL = 1.0
+# Сколько секунд браузер ждет готовности страницы, прежде чем перезагрузить ее (а затем сдаться)
+DEFAULT_READY_TIMEOUT = 20
+# Как часто (в секундах) браузер проверяет готовность страницы
+READY_POLL_INTERVAL = 0.1
+
+# Признаки пустой выдачи: страница за концом категории (или пустая категория)
+# показывает сообщение «товаров нет» вместо карточек
+LISTING_EMPTY_MARKERS = ('catalog-empty', 'empty-result', 'nothing-found')
+# Страница листинга готова, когда на ней есть карточки товаров или сообщение
+# о пустой выдаче. Пустая страница отдается сразу, без ожидания таймаута, и
+# parser.iter_category_pages завершает на ней обход категории. Таймаут — всегда
+# ошибка: категория вернется во фронтир и будет обойдена заново
+LISTING_READY_SELECTOR = ', '.join(
+    f'[data-test="{marker}"]' for marker in (PRODUCT_CARD_MARKER, *LISTING_EMPTY_MARKERS))
+
+# Заголовки для HTTP-загрузки (и синхронной, и асинхронной)
+HTTP_HEADERS = {
+    'User-Agent': parser.USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+}
+
+
+def has_product_cards(html) -> bool:
+    """Быстрая проверка (без парсинга), есть ли в HTML карточки товаров."""
+    return bool(html) and PRODUCT_CARD_MARKER in html
+
+
+def is_page_ready(html, ready_selector=None) -> bool:
+    """
+    Есть ли в HTML, полученном без браузера, то, чего браузер ждал бы по
+    ready_selector. Для листинга (по умолчанию) — быстрая проверка маркеров
+    без парсинга, для остальных страниц (каталог) — CSS-селектор по разобранному HTML.
+    """
+    if not html:
+        return False
+    if ready_selector is None or ready_selector == LISTING_READY_SELECTOR:
+        return any(marker in html for marker in (PRODUCT_CARD_MARKER, *LISTING_EMPTY_MARKERS))
+    return BeautifulSoup(html, 'lxml').select_one(ready_selector) is not None
+
+
+class PageNotReadyError(Exception):
+    """Страница не дорисовалась за отведенное время (нет ни карточек, ни признака пустой выдачи)."""
+
+
+class RequestThrottle:
+    """Выдерживает минимальный интервал между началами запросов (общий для потоков одного загрузчика)."""
+
+    def __init__(self, min_interval: float = DEFAULT_MIN_REQUEST_INTERVAL):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_request_at = None
+
+    def wait(self):
+        with self._lock:
+            if self._last_request_at is not None:
+                delay = self._last_request_at + self.min_interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self._last_request_at = time.monotonic()
+
+
+# --- Реализации загрузчиков ---
+# Любой загрузчик умеет fetch_html(url, ready_selector=None, request_headers=None) -> str | None
+# и close(), а также хранит заголовки последнего ответа в last_headers (если они доступны).
+# request_headers — заголовки условного запроса (If-None-Match / If-Modified-Since):
+# HTTP-загрузчики отправляют их и на ответ 304 возвращают parser.NOT_MODIFIED,
+# браузер их игнорирует.
+# ready_selector — CSS-селектор, появления которого браузер ждет после загрузки
+# страницы (по умолчанию LISTING_READY_SELECTOR); HTTP-загрузчики его игнорируют.
+
+class SeleniumFetcher:
+    """
+    Загружает страницы через браузер (полный рендеринг). После driver.get ждет
+    не фиксированную паузу, а появления ready_selector; если страница не готова
+    за ready_timeout секунд, перезагружает ее один раз и затем выбрасывает
+    PageNotReadyError — недорисованная страница не обрывает обход категории.
+    """
+
+    def __init__(self, driver, min_interval: float = DEFAULT_MIN_REQUEST_INTERVAL,
+                 ready_timeout: float = DEFAULT_READY_TIMEOUT, throttle: RequestThrottle = None):
+        self.driver = driver
+        self.ready_timeout = ready_timeout
+        self.throttle = throttle or RequestThrottle(min_interval)
+        self.last_headers = {}
+
+    def _load(self, url, ready_selector) -> bool:
+        """Загружает страницу и ждет ready_selector. False, если не дождались."""
+        self.throttle.wait()
+        self.driver.get(url)
+        try:
+            WebDriverWait(self.driver, self.ready_timeout, poll_frequency=READY_POLL_INTERVAL).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, ready_selector)))
+            return True
+        except TimeoutException:
+            return False
+
+    def fetch_html(self, url, ready_selector=None, request_headers=None):
+        if not self.driver:
+            print("Драйвер не инициализирован. Пропуск загрузки страницы.")
+            return None
+        ready_selector = ready_selector or LISTING_READY_SELECTOR
+        if not self._load(url, ready_selector) and not self._load(url, ready_selector):
+            raise PageNotReadyError(f"Страница {url} не загрузилась за {self.ready_timeout} с (ожидался '{ready_selector}')")
+        return self.driver.page_source
+
+    def close(self):
+        if self.driver:
+            self.driver.quit()
+            self.driver = None
+
+
+class HttpFetcher:
+    """
+    Загружает страницы обычными HTTP-запросами через requests.Session:
+    keep-alive пул соединений, сжатие gzip и повторы на 5xx.
+    """
+
+    def __init__(self, pool_size: int = 10, timeout: float = 30, retries: int = 3,
+                 min_interval: float = DEFAULT_MIN_REQUEST_INTERVAL, throttle: RequestThrottle = None):
+        self.timeout = timeout
+        self.throttle = throttle or RequestThrottle(min_interval)
+        self.last_headers = {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, backoff_factor=1, status_forcelist=(500, 502, 503, 504))
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(HTTP_HEADERS)
+
+    def fetch_html(self, url, ready_selector=None, request_headers=None):
+        self.throttle.wait()
+        response = self.session.get(url, timeout=self.timeout, headers=request_headers)
+        self.last_headers = dict(response.headers)
+        if response.status_code == 304:
+            return parser.NOT_MODIFIED
+        response.raise_for_status()
+        # Без charset в Content-Type requests считает страницу latin-1
+        if 'charset' not in response.headers.get('Content-Type', '').lower():
+            response.encoding = 'utf-8'
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+
+class HttpFirstFetcher:
+    """
+    Сначала пробует HTTP, а в браузер идет, только если в ответе нет того, чего
+    браузер ждал бы по ready_selector (карточек товаров или признака пустой
+    выдачи для листинга, ссылок категорий для каталога), или запрос не удался.
+    Браузер запускается лениво, при первой необходимости. Если HTTP несколько
+    раз подряд не дает готовой страницы, он отключается до конца сессии.
+    HTTP и браузер делят один интервал между запросами.
+    """
+
+    def __init__(self, http_fetcher: HttpFetcher, driver_factory=None, ready_timeout: float = DEFAULT_READY_TIMEOUT):
+        self.http_fetcher = http_fetcher
+        self.ready_timeout = ready_timeout
+        self.driver_factory = driver_factory or parser.get_driver
+        self.selenium_fetcher = None
+        self.http_enabled = True
+        self.http_misses = 0
+        self.last_headers = {}
+
+    def fetch_html(self, url, ready_selector=None, request_headers=None):
+        if self.http_enabled:
+            try:
+                html = self.http_fetcher.fetch_html(url, request_headers=request_headers)
+            except requests.RequestException as e:
+                print(f"HTTP-загрузка {url} не удалась ({e}), переключаюсь на браузер.")
+                html = None
+            self.last_headers = self.http_fetcher.last_headers
+            if html is parser.NOT_MODIFIED:
+                return html
+            if is_page_ready(html, ready_selector):
+                self.http_misses = 0
+                return html
+            self.http_misses += 1
+            if self.http_misses >= HTTP_MISSES_BEFORE_DISABLE:
+                print("HTTP-ответы не содержат готовых страниц. Дальше загружаю только через браузер.")
+                self.http_enabled = False
+
+        if self.selenium_fetcher is None:
+            self.selenium_fetcher = SeleniumFetcher(self.driver_factory(), ready_timeout=self.ready_timeout,
+                                                    throttle=self.http_fetcher.throttle)
+        self.last_headers = {}
+        return self.selenium_fetcher.fetch_html(url, ready_selector)
+
+    def close(self):
+        self.http_fetcher.close()
+        if self.selenium_fetcher:
+            self.selenium_fetcher.close()
+
+
+def create_fetcher(mode: str = 'auto', driver=None, min_interval: float = DEFAULT_MIN_REQUEST_INTERVAL,
+                   ready_timeout: float = DEFAULT_READY_TIMEOUT):
+    """
+    Создает загрузчик страниц:
+      'selenium' — только браузер;
+      'http'     — только HTTP-запросы;
+      'auto'     — HTTP с откатом на браузер.
+    Для 'selenium' можно передать уже запущенный driver.
+    min_interval — минимальный интервал между запросами (вежливость к сайту),
+    ready_timeout — сколько браузер ждет готовности страницы.
+    Возвращает None, если браузер запустить не удалось.
+    """
+    if mode not in FETCH_MODES:
+        raise ValueError(f"Неизвестный режим загрузки '{mode}'. Допустимые: {', '.join(FETCH_MODES)}")
+    if mode == 'http':
+        return HttpFetcher(min_interval=min_interval)
+    if mode == 'auto':
+        return HttpFirstFetcher(HttpFetcher(min_interval=min_interval), ready_timeout=ready_timeout)
+    driver = driver or parser.get_driver()
+    if not driver:
+        return None
+    return SeleniumFetcher(driver, min_interval=min_interval, ready_timeout=ready_timeout)
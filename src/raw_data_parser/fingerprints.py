@@ -0,0 +1,140 @@
+# src/raw_data_parser/fingerprints.py
+
+# Отпечатки страниц листинга. Для каждой страницы категории сохраняется хеш
+# артикулов и цен ее карточек (плюс ETag/Last-Modified, если сервер их отдал).
+# При повторном обходе первые check_pages страниц категории сравниваются с
+# прошлым обходом: если они не изменились, остальные страницы не загружаются.
+# Изменилась ли загруженная страница, решает только отпечаток: одинаковый ETag
+# у разного содержимого (CDN, общий шаблон) не должен скрывать смену цен.
+# ETag/Last-Modified используются лишь для условных запросов первых страниц:
+# ответ 304 означает, что страница не изменилась, и ее даже не нужно разбирать.
+# Раз в full_refresh_days дней категория все равно обходится целиком.
+
+import hashlib
+
+# Сколько первых страниц сверять с прошлым обходом (0 — всегда обходить целиком)
+DEFAULT_CHECK_PAGES = 1
+# Как часто (в днях) категория обходится полностью, даже если ее страницы не менялись
+DEFAULT_FULL_REFRESH_DAYS = 7
+
+
+def compute_page_fingerprint(cards: list) -> str:
+    """Хеш страницы листинга: артикулы и цены карточек в порядке их следования."""
+    content = '\n'.join(
+        f"{card.get('product_id')}|{card.get('gold_price')}|{card.get('retail_price')}|{card.get('unit')}"
+        for card in cards
+    )
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def _header(headers: dict, name: str):
+    """Заголовок ответа без учета регистра имени."""
+    name = name.lower()
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class CategoryFingerprintCheck:
+    """
+    Проверка одной категории во время обхода. Вызывается для каждой страницы
+    (см. parser.iter_category_pages) и возвращает False, когда дальше идти
+    не нужно: все первые check_pages страниц совпали с прошлым обходом.
+    Объект простой и передается в процессы-воркеры вместе с категорией.
+    """
+
+    def __init__(self, category_url: str, previous_pages: dict, check_pages: int, full_refresh: bool):
+        self.category_url = category_url
+        self.previous_pages = previous_pages
+        self.check_pages = check_pages
+        self.full_refresh = full_refresh or check_pages <= 0
+        self.pages = {}
+        self.skipped = False
+
+    def request_headers(self, page_num: int) -> dict:
+        """
+        Заголовки условного запроса страницы по ETag/Last-Modified прошлого обхода.
+        Пустые, если страница все равно загружается целиком (полный обход или страница за check_pages).
+        """
+        previous = self.previous_pages.get(page_num)
+        if self.full_refresh or page_num > self.check_pages or not previous:
+            return {}
+        _, etag, last_modified = previous
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def not_modified(self, page_num: int) -> bool:
+        """Сервер ответил на условный запрос 304: страница такая же, как в прошлом обходе."""
+        self.pages[page_num] = self.previous_pages[page_num]
+        return self._decide(page_num, matches_previous=True)
+
+    def __call__(self, page_num: int, cards: list, headers: dict = None) -> bool:
+        fingerprint = compute_page_fingerprint(cards)
+        etag, last_modified = _header(headers, 'ETag'), _header(headers, 'Last-Modified')
+        self.pages[page_num] = (fingerprint, etag, last_modified)
+        previous = self.previous_pages.get(page_num)
+        return self._decide(page_num, matches_previous=bool(previous) and previous[0] == fingerprint)
+
+    def _decide(self, page_num: int, matches_previous: bool) -> bool:
+        if self.full_refresh or page_num > self.check_pages:
+            return True
+        if not matches_previous:
+            # Категория изменилась — обходим ее целиком
+            self.full_refresh = True
+            return True
+        if page_num == self.check_pages:
+            self.skipped = True
+            return False
+        return True
+
+# --- Хранение отпечатков в RAW базе ---
+
+def load_checks(conn, category_urls: list, check_pages: int = DEFAULT_CHECK_PAGES,
+                full_refresh_days: float = DEFAULT_FULL_REFRESH_DAYS) -> dict:
+    """Готовит проверки для категорий по отпечаткам прошлого обхода: {category_url: CategoryFingerprintCheck}."""
+    checks = {}
+    for category_url in category_urls:
+        previous_pages = {
+            page_num: (fingerprint, etag, last_modified)
+            for page_num, fingerprint, etag, last_modified in conn.execute('''
+                SELECT page_num, fingerprint, etag, last_modified FROM listing_fingerprints
+                WHERE category_url = ? AND page_num <= ?
+            ''', (category_url, check_pages))
+        }
+        refresh_due = conn.execute('''
+            SELECT last_full_crawl_at IS NULL OR julianday('now') - julianday(last_full_crawl_at) >= ?
+            FROM category_crawl_state WHERE category_url = ?
+        ''', (full_refresh_days, category_url)).fetchone()
+        full_refresh = refresh_due is None or bool(refresh_due[0])
+        checks[category_url] = CategoryFingerprintCheck(category_url, previous_pages, check_pages, full_refresh)
+    return checks
+
+
+def save_check(conn, check: CategoryFingerprintCheck):
+    """Сохраняет отпечатки страниц после обхода категории (одной транзакцией)."""
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO listing_fingerprints
+                (category_url, page_num, fingerprint, etag, last_modified, checked_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', [(check.category_url, page_num, *page) for page_num, page in check.pages.items()])
+        if check.skipped:
+            conn.execute('''
+                INSERT INTO category_crawl_state (category_url, last_checked_at) VALUES (?, CURRENT_TIMESTAMP)
+                ON CONFLICT (category_url) DO UPDATE SET last_checked_at = CURRENT_TIMESTAMP
+            ''', (check.category_url,))
+        else:
+            # Категория пройдена целиком: отпечатки исчезнувших страниц больше не нужны
+            conn.execute('DELETE FROM listing_fingerprints WHERE category_url = ? AND page_num > ?',
+                         (check.category_url, max(check.pages, default=0)))
+            conn.execute('''
+                INSERT INTO category_crawl_state (category_url, last_full_crawl_at, last_checked_at)
+                VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (category_url) DO UPDATE SET
+                    last_full_crawl_at = CURRENT_TIMESTAMP, last_checked_at = CURRENT_TIMESTAMP
+            ''', (check.category_url,))
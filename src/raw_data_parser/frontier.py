@@ -0,0 +1,264 @@
+# src/raw_data_parser/frontier.py
+
+# Фронтир обхода: таблица crawl_frontier в RAW базе вместо файла
+# completed_categories.txt. Для каждой категории хранится статус и следующая
+# страница, поэтому прерванный обход продолжается с той же страницы.
+# Категорию берут в работу через аренду (lease) на ограниченное время:
+# несколько процессов (и хостов) могут разбирать один фронтир, не дублируя
+# работу, а аренда упавшего процесса по истечении срока достается другим.
+# Категории раздаются от больших к меньшим (по числу товаров из дерева
+# категорий или по числу страниц прошлого обхода), чтобы длинные категории
+# не достались воркерам в самом конце обхода.
+
+import json
+import os
+import socket
+import sqlite3
+import uuid
+
+# Срок аренды категории в секундах; продлевается на каждой записанной странице
+DEFAULT_LEASE_SECONDS = 600
+# После стольких неудачных попыток категория помечается как 'failed' до следующего запуска
+MAX_ATTEMPTS = 3
+# Оценка числа товаров на странице листинга: для категорий без известного
+# числа товаров размер оценивается по страницам прошлого обхода
+ESTIMATED_ITEMS_PER_PAGE = 20
+
+STATUS_PENDING = 'pending'
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class LeaseLostError(Exception):
+    """Аренда категории истекла и перешла к другому процессу."""
+
+
+def make_owner_id() -> str:
+    """Уникальный идентификатор владельца аренды: хост, pid и случайный суффикс."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def is_owner_alive(owner: str) -> bool:
+    """
+    Жив ли процесс-владелец аренды. Проверяются только процессы этого хоста
+    (и не под Windows, где os.kill завершает процесс): про остальных ничего
+    не известно, их аренда освобождается по истечении срока.
+    Текущий процесс считается мертвым владельцем: на старте сессии у него
+    еще нет аренд, а совпадение pid — это прошлый запуск (например, в контейнере).
+    """
+    try:
+        host, pid, _ = owner.rsplit(':', 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return True
+    if host != socket.gethostname() or os.name == 'nt':
+        return True
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class FrontierItem:
+    """Арендованная категория: с какой страницы продолжать и какие первые карточки уже встречались."""
+
+    def __init__(self, category_url: str, next_page: int, seen_first_urls: set, owner: str):
+        self.category_url = category_url
+        self.next_page = next_page
+        self.seen_first_urls = seen_first_urls
+        self.owner = owner
+
+
+class CrawlFrontier:
+    """
+    Работа с crawl_frontier через переданное соединение с RAW базой.
+    Чекпоинт страницы (page_checkpoint) выполняется внутри транзакции
+    RawWriter.flush, так что товары страницы и позиция обхода фиксируются вместе.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, owner: str = None, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+        self.conn = conn
+        self.owner = owner or make_owner_id()
+        self.lease_seconds = lease_seconds
+
+    # --- Подготовка фронтира перед запуском ---
+
+    def sync_categories(self, category_urls: list, item_counts: dict = None) -> int:
+        """
+        Добавляет новые категории и убирает еще не начатые категории, которых
+        больше нет в каталоге. item_counts ({category_url: число товаров})
+        обновляет размеры категорий для порядка раздачи; неизвестные размеры
+        (None) не затирают прежние. Возвращает количество добавленных категорий.
+        """
+        item_counts = item_counts or {}
+        with self.conn:
+            before = self.conn.execute('SELECT COUNT(*) FROM crawl_frontier').fetchone()[0]
+            self.conn.executemany('''
+                INSERT INTO crawl_frontier (category_url, item_count) VALUES (?, ?)
+                ON CONFLICT (category_url) DO UPDATE SET item_count = COALESCE(excluded.item_count, item_count)
+            ''', [(url, item_counts.get(url)) for url in category_urls])
+            added = self.conn.execute('SELECT COUNT(*) FROM crawl_frontier').fetchone()[0] - before
+            self.conn.execute('CREATE TEMP TABLE IF NOT EXISTS current_categories (category_url TEXT PRIMARY KEY)')
+            self.conn.execute('DELETE FROM current_categories')
+            self.conn.executemany('INSERT OR IGNORE INTO current_categories (category_url) VALUES (?)',
+                                  [(url,) for url in category_urls])
+            self.conn.execute('''
+                DELETE FROM crawl_frontier
+                WHERE status = ? AND next_page = 1
+                  AND category_url NOT IN (SELECT category_url FROM current_categories)
+            ''', (STATUS_PENDING,))
+        return added
+
+    def mark_done(self, category_urls) -> int:
+        """Помечает категории обработанными (перенос прогресса из completed_categories.txt)."""
+        with self.conn:
+            cursor = self.conn.executemany('''
+                UPDATE crawl_frontier SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE category_url = ? AND status != ?
+            ''', [(STATUS_DONE, url, STATUS_DONE) for url in category_urls])
+        return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        """Возвращает в очередь категории, исчерпавшие попытки в прошлых запусках."""
+        with self.conn:
+            cursor = self.conn.execute('''
+                UPDATE crawl_frontier SET status = ?, attempts = 0, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE status = ?
+            ''', (STATUS_PENDING, STATUS_FAILED))
+        return cursor.rowcount
+
+    def reset(self):
+        """Начинает обход заново: все категории снова ждут обработки с первой страницы."""
+        with self.conn:
+            self.conn.execute('''
+                UPDATE crawl_frontier SET status = ?, next_page = 1, seen_first_urls = NULL,
+                    lease_owner = NULL, lease_expires_at = NULL, attempts = 0, last_error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (STATUS_PENDING,))
+
+    def reclaim_abandoned(self) -> int:
+        """
+        Возвращает в очередь категории, арендованные процессами, которых уже нет
+        (падение или kill без снятия аренды): обход продолжится с сохраненной
+        страницы, не дожидаясь истечения срока аренды. Возвращает число категорий.
+        """
+        owners = [owner for (owner,) in self.conn.execute(
+            'SELECT DISTINCT lease_owner FROM crawl_frontier WHERE status = ? AND lease_owner IS NOT NULL',
+            (STATUS_IN_PROGRESS,)) if not is_owner_alive(owner)]
+        reclaimed = 0
+        with self.conn:
+            for owner in owners:
+                reclaimed += self.conn.execute('''
+                    UPDATE crawl_frontier SET status = ?, lease_owner = NULL, lease_expires_at = NULL,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE status = ? AND lease_owner = ?
+                ''', (STATUS_PENDING, STATUS_IN_PROGRESS, owner)).rowcount
+        return reclaimed
+
+    def counts(self) -> dict:
+        """Количество категорий по статусам."""
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM crawl_frontier GROUP BY status'))
+
+    def remaining(self) -> int:
+        """Сколько категорий еще ждут обработки или находятся в работе."""
+        counts = self.counts()
+        return counts.get(STATUS_PENDING, 0) + counts.get(STATUS_IN_PROGRESS, 0)
+
+    # --- Аренда и чекпоинты ---
+
+    def _lease_modifier(self) -> str:
+        """Модификатор datetime() для срока аренды, например '+600 seconds'."""
+        return f'{int(self.lease_seconds):+d} seconds'
+
+    def lease_next(self):
+        """
+        Берет в аренду следующую категорию: ожидающую обработки или с истекшей
+        чужой арендой, начиная с самых больших. Возвращает FrontierItem или None,
+        если работы больше нет.
+        """
+        # BEGIN IMMEDIATE сразу берет блокировку записи: два процесса не получат одну категорию
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute('''
+                SELECT category_url, next_page, seen_first_urls FROM crawl_frontier
+                WHERE status = ? OR (status = ? AND (lease_expires_at IS NULL OR lease_expires_at < datetime('now')))
+                ORDER BY COALESCE(
+                    item_count,
+                    (SELECT MAX(f.page_num) FROM listing_fingerprints f
+                     WHERE f.category_url = crawl_frontier.category_url) * ?,
+                    0) DESC, rowid
+                LIMIT 1
+            ''', (STATUS_PENDING, STATUS_IN_PROGRESS, ESTIMATED_ITEMS_PER_PAGE)).fetchone()
+            if row is None:
+                self.conn.commit()
+                return None
+            category_url, next_page, seen_first_urls = row
+            self.conn.execute('''
+                UPDATE crawl_frontier SET status = ?, lease_owner = ?,
+                    lease_expires_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+                WHERE category_url = ?
+            ''', (STATUS_IN_PROGRESS, self.owner, self._lease_modifier(), category_url))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return FrontierItem(category_url, next_page, set(json.loads(seen_first_urls or '[]')), self.owner)
+
+    def page_checkpoint(self, item: FrontierItem, page_num: int, seen_first_urls: set):
+        """
+        Возвращает функцию для RawWriter.flush(checkpoint=...): в той же транзакции,
+        что и товары страницы, сдвигает next_page и продлевает аренду.
+        Если аренду уже забрал другой процесс, транзакция откатывается (LeaseLostError).
+        """
+        def checkpoint(conn):
+            cursor = conn.execute('''
+                UPDATE crawl_frontier SET next_page = ?, seen_first_urls = ?,
+                    lease_expires_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+                WHERE category_url = ? AND lease_owner = ? AND status = ?
+            ''', (page_num + 1, json.dumps(sorted(seen_first_urls), ensure_ascii=False),
+                  self._lease_modifier(), item.category_url, item.owner, STATUS_IN_PROGRESS))
+            if cursor.rowcount == 0:
+                raise LeaseLostError(f"Аренда категории {item.category_url} перешла к другому процессу")
+            item.next_page = page_num + 1
+        return checkpoint
+
+    def complete(self, item: FrontierItem):
+        """Помечает категорию обработанной и снимает аренду."""
+        with self.conn:
+            self.conn.execute('''
+                UPDATE crawl_frontier SET status = ?, lease_owner = NULL, lease_expires_at = NULL,
+                    last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE category_url = ? AND lease_owner = ?
+            ''', (STATUS_DONE, item.category_url, item.owner))
+
+    def release(self, item: FrontierItem, error: str = None):
+        """
+        Снимает аренду после ошибки: категория вернется в очередь с той же
+        страницы, а после MAX_ATTEMPTS неудач будет помечена как 'failed'.
+        """
+        with self.conn:
+            self.conn.execute('''
+                UPDATE crawl_frontier SET
+                    status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END,
+                    attempts = attempts + 1, last_error = ?,
+                    lease_owner = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE category_url = ? AND lease_owner = ?
+            ''', (MAX_ATTEMPTS, STATUS_FAILED, STATUS_PENDING, error, item.category_url, item.owner))
+
+    def abandon(self, item: FrontierItem):
+        """
+        Снимает аренду при прерывании сессии (Ctrl-C, завершение процесса):
+        категория сразу возвращается в очередь с той же страницы, попытка не засчитывается.
+        """
+        with self.conn:
+            self.conn.execute('''
+                UPDATE crawl_frontier SET status = ?, lease_owner = NULL, lease_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE category_url = ? AND lease_owner = ? AND status = ?
+            ''', (STATUS_PENDING, item.category_url, item.owner, STATUS_IN_PROGRESS))
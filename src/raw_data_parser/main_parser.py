@@ -3,6 +3,13 @@
 # Импортируем наши модули
 from src.common import database
 from src.raw_data_parser import parser
+from src.raw_data_parser import async_crawler
+from src.raw_data_parser import category_tree
+from src.raw_data_parser import fast_parser
+from src.raw_data_parser import fetchers
+from src.raw_data_parser import fingerprints
+from src.raw_data_parser import frontier
+from src.raw_data_parser import worker_pool
 
 # Импортируем служебные библиотеки
 from tqdm import tqdm
@@ -10,7 +17,9 @@ import traceback
 import os
 import time
 
-# --- Функции для управления прогрессом парсинга ---
+# --- Прогресс парсинга ---
+# Прогресс хранится во фронтире обхода (таблица crawl_frontier, см. frontier.py).
+# Файл completed_categories.txt остался от прежней схемы и переносится во фронтир один раз.
 
 def get_progress_file_path(is_test: bool = False) -> str:
     """Возвращает путь к файлу прогресса (рабочему или тестовому)."""
@@ -19,13 +28,6 @@ def get_progress_file_path(is_test: bool = False) -> str:
     filename = 'completed_categories_test.txt' if is_test else 'completed_categories.txt'
     return os.path.join(base_dir, 'data', filename)
 
-def save_completed_category(category_url: str, is_test: bool = False):
-    """Дописывает URL успешно обработанной категории в правильный файл прогресса."""
-    progress_file = get_progress_file_path(is_test)
-    os.makedirs(os.path.dirname(progress_file), exist_ok=True)
-    with open(progress_file, 'a', encoding='utf-8') as f:
-        f.write(category_url + '\n')
-
 def load_completed_categories(is_test: bool = False) -> set:
     """Загружает МНОЖЕСТВО ранее обработанных категорий из правильного файла."""
     progress_file = get_progress_file_path(is_test)
@@ -34,103 +36,224 @@ def load_completed_categories(is_test: bool = False) -> set:
     with open(progress_file, 'r', encoding='utf-8') as f:
         return {line.strip() for line in f if line.strip()}
 
+def migrate_progress_file(crawl_frontier: frontier.CrawlFrontier, is_test: bool = False) -> int:
+    """
+    Переносит категории из completed_categories.txt во фронтир как обработанные,
+    после чего переименовывает файл, чтобы перенос не повторялся.
+    """
+    completed_categories = load_completed_categories(is_test=is_test)
+    if not completed_categories:
+        return 0
+    migrated = crawl_frontier.mark_done(completed_categories)
+    progress_file = get_progress_file_path(is_test)
+    os.replace(progress_file, progress_file + '.migrated')
+    return migrated
+
 # --- Основная функция-оркестратор парсера ---
 
-def run_petrovich_parser(is_test: bool = False):
+def run_petrovich_parser(is_test: bool = False, workers: int = 1, fetch_mode: str = 'auto',
+                         engine: str = 'sync', concurrency: int = 8, parse_engine: str = 'lxml',
+                         fingerprint_pages: int = fingerprints.DEFAULT_CHECK_PAGES,
+                         full_refresh_days: float = fingerprints.DEFAULT_FULL_REFRESH_DAYS,
+                         restart_crawl: bool = False, lease_seconds: int = frontier.DEFAULT_LEASE_SECONDS,
+                         category_tree_ttl_hours: float = category_tree.DEFAULT_TTL_HOURS,
+                         refresh_category_tree: bool = False,
+                         request_interval: float = fetchers.DEFAULT_MIN_REQUEST_INTERVAL):
     """
     Главная функция для парсинга сайта 'Петрович' с поддержкой тестового режима.
+
+    engine='sync'  — обход через загрузчик страниц; при workers > 1 категории
+                     раздаются пулу процессов, у каждого свой загрузчик.
+                     fetch_mode — способ загрузки (см. fetchers.create_fetcher).
+    engine='async' — асинхронный HTTP-обход, до `concurrency` запросов в полете
+                     с адаптивным ограничением частоты (см. async_crawler.py).
+    parse_engine — движок извлечения карточек: 'lxml' (fast_parser.py) или 'bs4'.
+    fingerprint_pages / full_refresh_days — сколько первых страниц категории
+                     сверять с прошлым обходом и как часто обходить ее целиком
+                     (см. fingerprints.py); fingerprint_pages=0 отключает пропуск.
+
+    Прогресс хранится во фронтире обхода (frontier.py): прерванная категория
+    продолжается с той же страницы, а несколько запущенных парсеров делят
+    категории между собой через аренду на lease_seconds секунд.
+    restart_crawl=True начинает обход всех категорий заново.
+
+    Список категорий берется из кэша data/category_tree.json, пока он свежее
+    category_tree_ttl_hours часов (refresh_category_tree=True загружает каталог
+    заново, см. category_tree.py). Загрузчик, открытый для страницы каталога,
+    затем используется последовательным обходом — второй браузер не запускается.
+    request_interval — минимальный интервал в секундах между запросами одного
+    загрузчика (для engine='sync'; у async-движка свой ограничитель частоты).
     """
     SOURCE_NAME = 'petrovich'
     
     # 1. Инициализация RAW базы данных с учетом тестового режима
     database.init_raw_db(SOURCE_NAME, is_test=is_test)
     
-    # 2. Получение списка категорий
+    # 2. Получение дерева категорий (из кэша или со страницы каталога)
     print("Получаю полный список категорий для парсинга...")
-    driver = None
-    all_category_links = []
+    # Последовательный обход продолжает работать с загрузчиком (и браузером),
+    # открытым для каталога; пулу процессов и async-движку он не нужен
+    reuse_fetcher = engine != 'async' and workers <= 1
+    fetcher = None
+
+    def open_fetcher():
+        nonlocal fetcher
+        fetcher = fetchers.create_fetcher(fetch_mode, min_interval=request_interval)
+        return fetcher
+
+    categories = []
     try:
-        driver = parser.get_driver()
-        if driver:
-            all_category_links = parser.get_category_links(driver)
+        categories = category_tree.get_category_tree(open_fetcher, is_test=is_test, ttl_hours=category_tree_ttl_hours,
+                                                     force_refresh=refresh_category_tree)
     except Exception as e:
         print(f"Критическая ошибка при получении списка категорий: {e}")
-    finally:
-        if driver:
-            driver.quit()
-            
-    if not all_category_links:
+    if fetcher and not (reuse_fetcher and categories):
+        fetcher.close()
+        fetcher = None
+
+    if not categories:
         print("Не удалось получить список категорий. Завершение работы.")
         return
-        
+    all_category_links = [category['url'] for category in categories]
+
     # --- ОГРАНИЧЕНИЕ ДЛЯ ТЕСТОВОГО РЕЖИМА ---
     if is_test:
         print("\n============== РЕЖИМ ТЕСТИРОВАНИЯ: будет обработана только 1 категория ==============\n")
         all_category_links = all_category_links[:1] # Берем только первую категорию
+    item_counts = {category['url']: category.get('item_count') for category in categories}
     
-    categories_to_parse_set = set(all_category_links)
+    # 3. Определение прогресса по фронтиру обхода
+    conn = database.get_db_connection(database.get_raw_db_path(SOURCE_NAME, is_test=is_test))
+    try:
+        crawl_frontier = frontier.CrawlFrontier(conn)
+        if restart_crawl:
+            print("Начинаю обход всех категорий заново.")
+            crawl_frontier.reset()
+        crawl_frontier.sync_categories(all_category_links, item_counts)
+        migrated = migrate_progress_file(crawl_frontier, is_test=is_test)
+        if migrated:
+            print(f"Прогресс из {get_progress_file_path(is_test)} перенесен во фронтир: {migrated} категорий.")
+        crawl_frontier.retry_failed()
+        reclaimed = crawl_frontier.reclaim_abandoned()
+        if reclaimed:
+            print(f"Возвращено в очередь категорий, брошенных прерванными запусками: {reclaimed}.")
+        remaining = crawl_frontier.remaining()
+    except Exception:
+        if fetcher:
+            fetcher.close()
+        raise
+    finally:
+        conn.close()
 
-    # 3. Определение прогресса с учетом тестового режима
-    completed_categories = load_completed_categories(is_test=is_test)
-    categories_to_parse = list(categories_to_parse_set - completed_categories)
-    
-    if not categories_to_parse:
+    if not remaining:
         print("Отлично! Все категории уже были успешно обработаны!")
+        if fetcher:
+            fetcher.close()
         return
 
-    print(f"Осталось обработать {len(categories_to_parse)} из {len(categories_to_parse_set)} категорий.")
+    print(f"Осталось обработать {remaining} из {len(all_category_links)} категорий.")
     time.sleep(2)
 
     # 4. Главный цикл парсинга
-    driver = None
+    if engine == 'async':
+        print(f"\n--- Запуск асинхронной сессии парсинга (до {concurrency} запросов одновременно) ---")
+        try:
+            total_saved_count = async_crawler.run_async_crawl(
+                SOURCE_NAME, is_test=is_test, concurrency=concurrency, total_categories=remaining,
+                parse_engine=parse_engine, lease_seconds=lease_seconds, fingerprint_pages=fingerprint_pages,
+                full_refresh_days=full_refresh_days
+            )
+            print(f"\n\n--- Сбор данных с сайта 'Петрович' завершен! ---")
+            print(f"Всего сохранено/обновлено в RAW базу за эту сессию: {total_saved_count} товаров.")
+        except Exception as e:
+            print(f"\nПроизошла непредвиденная ошибка в процессе парсинга: {e}")
+            traceback.print_exc()
+            print("\nПопробуйте запустить скрипт снова, он должен продолжить с места остановки.")
+        return
+
+    if workers > 1:
+        print(f"\n--- Запуск сессии парсинга в {workers} процессах ---")
+        try:
+            total_saved_count = worker_pool.run_category_pool(
+                SOURCE_NAME, workers=workers, is_test=is_test, fetch_mode=fetch_mode,
+                total_categories=remaining, parse_engine=parse_engine, lease_seconds=lease_seconds, fingerprint_pages=fingerprint_pages,
+                full_refresh_days=full_refresh_days, request_interval=request_interval
+            )
+            print(f"\n\n--- Сбор данных с сайта 'Петрович' завершен! ---")
+            print(f"Всего сохранено/обновлено в RAW базу за эту сессию: {total_saved_count} товаров.")
+        except Exception as e:
+            print(f"\nПроизошла непредвиденная ошибка в процессе парсинга: {e}")
+            traceback.print_exc()
+            print("\nПопробуйте запустить скрипт снова, он должен продолжить с места остановки.")
+        return
+
+    parse_listing = fast_parser.get_listing_parser(parse_engine)
     try:
         print("\n--- Запуск сессии парсинга ---")
-        driver = parser.get_driver()
-        total_saved_count = 0
-        
-        for category_url in tqdm(categories_to_parse, desc="Обработка категорий"):
-            page_num = 1
-            parsed_in_category_urls = set()
-            while True:
-                paginated_url = f"{category_url}?p={page_num}"
-                try:
-                    soup = parser.get_page_soup_selenium(driver, paginated_url)
-                except Exception as e:
-                    tqdm.write(f"\nОшибка при загрузке страницы {paginated_url}: {e}")
-                    raise e
-
-                if not soup: break
-                
-                product_containers = soup.find_all('div', attrs={'data-test': 'product-card-catalog-wide'})
-                if not product_containers: break
-                
-                first_product_link = product_containers[0].find('a', attrs={'data-test': 'product-link'})
-                current_first_url = first_product_link['href'] if first_product_link else None
-                if current_first_url and current_first_url in parsed_in_category_urls:
-                    break
-                if current_first_url:
-                    parsed_in_category_urls.add(current_first_url)
-                
-                for container in product_containers:
-                    product_data = parser.parse_product_card(container)
-                    if product_data.get('product_id'):
-                        # Сохраняем в правильную базу с учетом тестового режима
-                        database.save_product_to_raw_db(SOURCE_NAME, product_data, is_test=is_test)
-                        total_saved_count += 1
-                
-                page_num += 1
-
-            # Сохраняем прогресс в правильный файл
-            save_completed_category(category_url, is_test=is_test)
+        # Загрузчик мог остаться от загрузки каталога; если список категорий взят из кэша — создаем
+        fetcher = fetcher or fetchers.create_fetcher(fetch_mode, min_interval=request_interval)
+        if not fetcher:
+            print("Не удалось запустить загрузчик страниц. Завершение работы.")
+            return
+        # Одно соединение с RAW базой на всю сессию; при выходе из with
+        # (в том числе по ошибке или Ctrl-C) несохраненный буфер будет записан
+        with database.RawWriter(SOURCE_NAME, is_test=is_test) as raw_writer:
+            crawl_frontier = frontier.CrawlFrontier(raw_writer.conn, lease_seconds=lease_seconds)
+            skipped_count = 0
+            with tqdm(total=remaining, desc="Обработка категорий") as progress:
+                while True:
+                    item = crawl_frontier.lease_next()
+                    if item is None:
+                        break
+                    category_url = item.category_url
+                    try:
+                        page_check = fingerprints.load_checks(raw_writer.conn, [category_url],
+                                                              fingerprint_pages, full_refresh_days)[category_url]
+                        for page_num, products in parser.iter_category_pages(
+                                fetcher, category_url, parse_listing, page_check,
+                                start_page=item.next_page, parsed_in_category_urls=item.seen_first_urls):
+                            for product_data in products:
+                                raw_writer.add(product_data)
+                            # Одна транзакция на страницу листинга, вместе с позицией обхода
+                            raw_writer.flush(checkpoint=crawl_frontier.page_checkpoint(
+                                item, page_num, item.seen_first_urls))
+                    except frontier.LeaseLostError as e:
+                        tqdm.write(f"\n{e}")
+                        continue
+                    except Exception as e:
+                        # Как в worker_pool: категория вернется в очередь с той же страницы (см. frontier.release),
+                        # а обход продолжается со следующей категории
+                        tqdm.write(f"\nОшибка при обработке категории {category_url}: {e}")
+                        crawl_frontier.release(item, error=str(e))
+                        # После ошибки браузер может быть в неисправном состоянии — перезапускаем загрузчик
+                        fetcher.close()
+                        fetcher = fetchers.create_fetcher(fetch_mode, min_interval=request_interval)
+                        if not fetcher:
+                            tqdm.write("Не удалось перезапустить загрузчик страниц. Завершение работы.")
+                            return
+                        continue
+                    except BaseException:
+                        # Ctrl-C: категория сразу возвращается в очередь и продолжится со следующего запуска
+                        crawl_frontier.abandon(item)
+                        raise
+
+                    # Категория отмечается обработанной только после того, как все ее товары записаны в базу
+                    raw_writer.flush()
+                    fingerprints.save_check(raw_writer.conn, page_check)
+                    skipped_count += page_check.skipped
+                    crawl_frontier.complete(item)
+                    progress.update(1)
         
         print(f"\n\n--- Сбор данных с сайта 'Петрович' успешно завершен! ---")
-        print(f"Всего сохранено/обновлено в RAW базу за эту сессию: {total_saved_count} товаров.")
+        print(f"Всего сохранено/обновлено в RAW базу за эту сессию: {raw_writer.total_written} товаров "
+              f"(без изменений с прошлого обхода: {raw_writer.total_unchanged}).")
+        print(f"Категорий без изменений на первых страницах (обход прерван): {skipped_count}.")
 
     except Exception as e:
         print(f"\nПроизошла непредвиденная ошибка в процессе парсинга: {e}")
         traceback.print_exc()
         print("\nПопробуйте запустить скрипт снова, он должен продолжить с места остановки.")
     finally:
-        if driver:
-            driver.quit()
-            print("\nБраузер успешно закрыт.")
+        if fetcher:
+            fetcher.close()
+            print("\nЗагрузчик страниц (браузер/HTTP-сессия) успешно закрыт.")
@@ -1,7 +1,9 @@
 import os
 import json
-import time
-import random
+import functools
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service  # <-- Используем именно Service
 from selenium.webdriver.chrome.options import Options
@@ -11,15 +13,88 @@ from webdriver_manager.chrome import ChromeDriverManager
 
 
 BASE_URL = "https://moscow.petrovich.ru"
-def get_driver():
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36"
+
+# --- Профиль браузера ---
+# 'lean' (по умолчанию) — браузер без окна, без картинок, шрифтов, медиа и
+# сторонних счетчиков, со стратегией загрузки 'eager' (не ждем подгрузки
+# ресурсов, достаточно готового DOM): карточки листинга все равно читаются
+# только из HTML. 'full' — обычный браузер с окном, как раньше (удобно для отладки).
+# Профиль задается переменной BROWSER_PROFILE в .env.
+BROWSER_PROFILES = ('lean', 'full')
+
+# Что браузер не загружает в профиле 'lean' (шаблоны для CDP Network.setBlockedURLs)
+BLOCKED_URL_PATTERNS = [
+    # Картинки, шрифты, медиа
+    '*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.svg*', '*.ico*', '*.avif*',
+    '*.woff*', '*.ttf*', '*.otf*', '*.eot*',
+    '*.mp4*', '*.webm*', '*.mp3*',
+    # Сторонние счетчики, реклама и виджеты
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*mc.yandex.ru*', '*an.yandex.ru*', '*yastatic.net/metrika*', '*top-fwz1.mail.ru*',
+    '*vk.com*', '*facebook.net*', '*criteo*', '*mindbox*', '*jivosite*', '*flocktory*',
+]
+
+# Настройки Chrome: 2 — запретить загрузку ресурса данного типа
+_LEAN_CONTENT_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+    'profile.managed_default_content_settings.notifications': 2,
+    'profile.managed_default_content_settings.geolocation': 2,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_chromedriver_path(driver_version: str = None) -> str:
+    """
+    Путь к chromedriver: из CHROMEDRIVER_PATH в .env, иначе через
+    ChromeDriverManager. Определяется один раз на процесс, а не при каждом запуске браузера.
+    """
+    chromedriver_path = os.getenv('CHROMEDRIVER_PATH')
+    if chromedriver_path and os.path.exists(chromedriver_path):
+        return chromedriver_path
+    # Передаем версию напрямую в ChromeDriverManager
+    return ChromeDriverManager(driver_version=driver_version).install()
+
+
+def _apply_lean_profile(options: Options):
+    """Настройки 'lean'-профиля, которые задаются до запуска браузера."""
+    options.add_argument("--headless=new")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--mute-audio")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_experimental_option('prefs', _LEAN_CONTENT_PREFS)
+    # Не ждем картинок, стилей и фреймов: driver.get возвращается после DOMContentLoaded
+    options.page_load_strategy = 'eager'
+
+
+def _block_resources(driver):
+    """Включает блокировку ресурсов по BLOCKED_URL_PATTERNS через Chrome DevTools Protocol."""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        print(f"Не удалось включить блокировку ресурсов через CDP: {e}")
+
+
+def get_driver(profile: str = None):
     """
     Настраивает и возвращает экземпляр веб-драйвера для Яндекс.Браузера,
     используя правильную версию chromedriver.
+    profile — 'lean' или 'full' (см. BROWSER_PROFILES); по умолчанию берется
+    из BROWSER_PROFILE в .env, а если его нет — 'lean'.
     """
     load_dotenv()
+    profile = profile or os.getenv('BROWSER_PROFILE') or 'lean'
+    if profile not in BROWSER_PROFILES:
+        raise ValueError(f"Неизвестный профиль браузера '{profile}'. Допустимые: {', '.join(BROWSER_PROFILES)}")
     options = Options()
     options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36")
+    options.add_argument(f"user-agent={USER_AGENT}")
+    if profile == 'lean':
+        _apply_lean_profile(options)
     
     # --- БЛОК РАБОТЫ С ЯНДЕКС.БРАУЗЕРОМ ---
     yandex_path = os.getenv('YANDEX_BROWSER_PATH')
@@ -33,13 +108,14 @@ def get_driver():
     
     # --- УКАЗЫВАЕМ ВЕРСИЮ ДРАЙВЕРА ---
     driver_version = os.getenv('CHROME_DRIVER_VERSION')
-    if not driver_version:
+    if not driver_version and not os.getenv('CHROMEDRIVER_PATH'):
         print("Версия драйвера CHROME_DRIVER_VERSION не найдена в .env. Менеджер попробует угадать.")
 
     try:
-        # Передаем версию напрямую в ChromeDriverManager
-        service = Service(executable_path=ChromeDriverManager(driver_version=driver_version).install())
+        service = Service(executable_path=get_chromedriver_path(driver_version))
         driver = webdriver.Chrome(service=service, options=options)
+        if profile == 'lean':
+            _block_resources(driver)
         return driver
     except Exception as e:
         print(f"Критическая ошибка при инициализации драйвера: {e}")
@@ -47,32 +123,181 @@ def get_driver():
         return None
     
 
-def get_page_soup_selenium(driver, url):
-    """Загружает страницу с помощью Selenium и возвращает BeautifulSoup объект."""
-    if not driver:
-        print("Драйвер не инициализирован. Пропуск загрузки страницы.")
+# --- Число страниц категории ---
+
+# Блок пагинации листинга: <nav class="pagination">, <ul class="pagination__list"> и т.п.
+_PAGINATION_OPEN_RE = re.compile(r'<(nav|ul|div)\b[^>]*\b(?:class|data-test)="(?:[^"]*\s)?pagination(?:__list)?[\s"][^>]*>')
+# Ссылки пагинации вида ...?p=N / ...&p=N (ищутся только внутри блока пагинации)
+_PAGE_LINK_RE = re.compile(r'href="[^"]*[?&](?:amp;)?p=(\d+)')
+# Счетчик товаров самого листинга (не счетчики корзины, избранного и т.п. в шапке):
+# элемент data-test="products-count", в котором только число и, возможно, слово «товаров»
+_TOTAL_ITEMS_RE = re.compile(r'data-test="products-count"[^>]*>\s*(\d[\d\s\u00a0]*?)\s*(?:товар[а-я]*)?\s*<')
+
+
+def _pagination_html(html: str):
+    """HTML блока пагинации (до парного закрывающего тега) или None, если блока нет."""
+    opening = _PAGINATION_OPEN_RE.search(html)
+    if not opening:
         return None
-    driver.get(url)
-    time.sleep(random.uniform(2, 4))
-    return BeautifulSoup(driver.page_source, 'lxml')
+    tag_re = re.compile(r'<(/?)%s\b' % opening.group(1))
+    depth = 1
+    for tag in tag_re.finditer(html, opening.end()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return html[opening.end():tag.start()]
+    return html[opening.end():]
 
 
-def get_category_links(driver):
-    """Собирает все уникальные ссылки на категории товаров."""
-    catalog_url = f"{BASE_URL}/catalog/"
-    soup = get_page_soup_selenium(driver, catalog_url)
-    
-    if not soup:
-        return []
-        
-    links = set()
-    all_a_tags = soup.find_all('a', href=True)
-    for tag in all_a_tags:
-        href = tag.get('href')
-        if href and href.startswith('/catalog/') and href.count('/') == 3 and href.split('/')[-2].isdigit():
-            links.add(BASE_URL + href)
-    print(f"Найдено {len(links)} уникальных ТОП-уровневых категорий.")
-    return list(links)
+def get_page_count(html, cards_on_page: int):
+    """
+    Число страниц категории по HTML любой ее страницы: максимальный номер
+    в ссылках блока пагинации, а если их нет — число товаров из счетчика
+    листинга, деленное на число карточек на странице. Ссылки и счетчики вне
+    листинга (меню, шапка) не учитываются. None, если определить не удалось.
+    """
+    if not html:
+        return None
+    pagination = _pagination_html(html)
+    page_numbers = [int(number) for number in _PAGE_LINK_RE.findall(pagination or '')]
+    if page_numbers:
+        return max(page_numbers)
+    total_match = _TOTAL_ITEMS_RE.search(html)
+    if total_match and cards_on_page:
+        total_items = int(re.sub(r'\D', '', total_match.group(1)) or 0)
+        if total_items:
+            return math.ceil(total_items / cards_on_page)
+    return None
+
+
+# Что загрузчик возвращает вместо HTML, если на условный запрос сервер ответил
+# 304 Not Modified (страница не изменилась с прошлого обхода)
+NOT_MODIFIED = object()
+
+
+def _fetch_with_headers(fetcher, url, request_headers=None):
+    """Загружает страницу и сразу забирает заголовки ответа (до следующей загрузки)."""
+    html = fetcher.fetch_html(url, request_headers=request_headers)
+    return html, dict(getattr(fetcher, 'last_headers', None) or {})
+
+
+def conditional_headers(page_check, page_num: int):
+    """Заголовки условного запроса страницы от проверки отпечатков (None, если ее нет)."""
+    return page_check.request_headers(page_num) if hasattr(page_check, 'request_headers') else None
+
+
+def iter_category_pages(fetcher, category_url, parse_listing=None, page_check=None,
+                        start_page: int = 1, parsed_in_category_urls: set = None):
+    """
+    Обходит страницы категории (?p=1, ?p=2, ...) через загрузчик страниц
+    (см. fetchers.py) и для каждой страницы отдает пару (номер страницы,
+    список распарсенных карточек с заполненным product_id). parse_listing —
+    функция извлечения карточек из HTML (по умолчанию parse_listing_page на BeautifulSoup).
+
+    Число страниц берется из пагинации (get_page_count): следующая страница
+    загружается в фоне, пока текущая разбирается и записывается, а лишняя
+    страница за концом категории не запрашивается. Если число страниц
+    неизвестно, обход, как и раньше, останавливается на пустой странице или
+    когда сайт снова отдает уже виденную первую карточку — эта проверка
+    остается страховкой и при известном числе страниц.
+
+    page_check(page_num, cards, headers) может остановить обход раньше,
+    вернув False (см. fingerprints.CategoryFingerprintCheck). Первые страницы
+    запрашиваются условно (ETag/Last-Modified прошлого обхода); на ответ 304
+    страница не разбирается и не отдается, а решение принимает page_check.not_modified.
+    start_page и parsed_in_category_urls позволяют продолжить прерванный обход
+    (см. frontier.py); множество первых URL пополняется по ходу обхода.
+    """
+    page_num = start_page
+    if parsed_in_category_urls is None:
+        parsed_in_category_urls = set()
+    page_count = None
+    # Один поток загрузки: запросы к загрузчику по-прежнему идут строго по одному
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        next_page = prefetcher.submit(_fetch_with_headers, fetcher, f"{category_url}?p={page_num}",
+                                      conditional_headers(page_check, page_num))
+        while True:
+            html, headers = next_page.result()
+            next_page = None
+            if html is NOT_MODIFIED:
+                if not page_check.not_modified(page_num): break
+                page_num += 1
+                next_page = prefetcher.submit(_fetch_with_headers, fetcher, f"{category_url}?p={page_num}",
+                                              conditional_headers(page_check, page_num))
+                continue
+            if not html: break
+
+            cards = (parse_listing or parse_listing_page)(html)
+            if is_last_page(cards, parsed_in_category_urls): break
+
+            # Пагинация может показывать не все номера сразу, поэтому число страниц уточняется на каждой
+            page_count = max(filter(None, (page_count, get_page_count(html, len(cards)))), default=None)
+            keep_going = page_check is None or page_check(page_num, cards, headers)
+            has_next_page = keep_going and (page_count is None or page_num < page_count)
+            if has_next_page:
+                next_page = prefetcher.submit(_fetch_with_headers, fetcher, f"{category_url}?p={page_num + 1}",
+                                              conditional_headers(page_check, page_num + 1))
+
+            yield page_num, [card for card in cards if card.get('product_id')]
+            if not has_next_page: break
+
+            page_num += 1
+
+
+def parse_listing_page(html):
+    """Парсит HTML страницы листинга и возвращает ВСЕ карточки (в том числе без product_id)."""
+    soup = BeautifulSoup(html, 'lxml')
+    product_containers = soup.find_all('div', attrs={'data-test': 'product-card-catalog-wide'})
+    return [parse_product_card(container) for container in product_containers]
+
+
+def is_last_page(cards, parsed_in_category_urls: set) -> bool:
+    """
+    Проверяет, что пагинация категории закончилась: страница пуста или ее
+    первая карточка уже встречалась. Запоминает URL первой карточки в
+    parsed_in_category_urls.
+    """
+    if not cards:
+        return True
+    current_first_url = cards[0]['url']
+    if current_first_url and current_first_url in parsed_in_category_urls:
+        return True
+    if current_first_url:
+        parsed_in_category_urls.add(current_first_url)
+    return False
+
+
+# --- Разбор текстовых значений карточки ---
+# Общие для всех движков извлечения (BeautifulSoup здесь и lxml в fast_parser.py)
+
+# Чем заменяются <br> в описании, чтобы потом разбить его на характеристики
+FEATURES_SEPARATOR = '|||'
+
+def product_id_from_text(text: str):
+    """ID товара: число, если код числовой, иначе строка (артикул). None, если разобрать не удалось."""
+    try:
+        # ID может быть не только числовым, например, артикул, поэтому лучше хранить как строку
+        product_id_text = text.strip()
+        if product_id_text.isdigit():
+            return int(product_id_text)
+        return product_id_text
+    except (ValueError, IndexError):
+        return None
+
+def price_from_text(text: str):
+    """Цена из текста вида '1 234,50 ₽'. None, если разобрать не удалось."""
+    price_str = text.replace('₽', '').replace('\u2009', '').replace(',', '.')
+    try: return float(price_str)
+    except (ValueError, TypeError): return None
+
+def features_from_text(full_text: str) -> dict:
+    """Характеристики из текста описания, где строки разделены FEATURES_SEPARATOR."""
+    features = {}
+    features_list = [item.strip() for item in full_text.split(FEATURES_SEPARATOR) if item.strip()]
+    for feature_item in features_list:
+        if ':' in feature_item:
+            key, value = feature_item.split(':', 1)
+            features[key.strip()] = value.strip()
+    return features
 
 
 def parse_product_card(card_soup):
@@ -99,28 +324,16 @@ def parse_product_card(card_soup):
     # ID товара
     code_tag = card_soup.find('p', attrs={'data-test': 'product-code'})
     if code_tag:
-        try:
-            # ID может быть не только числовым, например, артикул, поэтому лучше хранить как строку
-            product_id_text = code_tag.text.strip()
-            if product_id_text.isdigit():
-                data['product_id'] = int(product_id_text)
-            else:
-                 data['product_id'] = product_id_text
-        except (ValueError, IndexError):
-            pass
+        data['product_id'] = product_id_from_text(code_tag.text)
 
     # Цены и единица измерения
     gold_price_tag = card_soup.find('p', attrs={'data-test': 'product-gold-price'})
     if gold_price_tag:
-        price_str = gold_price_tag.get_text(strip=True).replace('₽', '').replace('\u2009', '').replace(',', '.')
-        try: data['gold_price'] = float(price_str)
-        except (ValueError, TypeError): pass
+        data['gold_price'] = price_from_text(gold_price_tag.get_text(strip=True))
 
     retail_price_tag = card_soup.find('p', attrs={'data-test': 'product-retail-price'})
     if retail_price_tag:
-        price_str = retail_price_tag.get_text(strip=True).replace('₽', '').replace('\u2009', '').replace(',', '.')
-        try: data['retail_price'] = float(price_str)
-        except (ValueError, TypeError): pass
+        data['retail_price'] = price_from_text(retail_price_tag.get_text(strip=True))
             
     active_unit_tag = card_soup.find('div', class_=lambda c: c and 'tab-active' in c and 'price-switcher-tab' in c)
     if active_unit_tag:
@@ -134,13 +347,8 @@ def parse_product_card(card_soup):
     # Характеристики
     description_p = card_soup.find('p', attrs={'data-test': 'product-description'})
     if description_p:
-        for br in description_p.find_all('br'): br.replace_with('|||')
-        full_text = description_p.get_text(strip=True)
-        features_list = [item.strip() for item in full_text.split('|||') if item.strip()]
-        for feature_item in features_list:
-            if ':' in feature_item:
-                key, value = feature_item.split(':', 1)
-                data['features'][key.strip()] = value.strip()
+        for br in description_p.find_all('br'): br.replace_with(FEATURES_SEPARATOR)
+        data['features'] = features_from_text(description_p.get_text(strip=True))
     
     # Сериализация для записи в БД
     data['features'] = json.dumps(data['features'], ensure_ascii=False)
@@ -0,0 +1,166 @@
+# src/raw_data_parser/worker_pool.py
+
+# Импортируем наши модули
+from src.common import database
+from src.raw_data_parser import fast_parser
+from src.raw_data_parser import fetchers
+from src.raw_data_parser import fingerprints
+from src.raw_data_parser import frontier
+from src.raw_data_parser import parser
+
+# Импортируем служебные библиотеки
+from tqdm import tqdm
+import multiprocessing
+import queue
+import traceback
+
+# Как часто (в секундах) главный процесс проверяет, живы ли воркеры
+RESULT_POLL_TIMEOUT = 5
+
+# --- Код, выполняемый в процессе-воркере ---
+
+def _worker_main(worker_id: int, fetch_mode: str, parse_engine: str, request_interval: float, task_queue, result_queue):
+    """
+    Процесс-воркер: держит один загрузчик страниц (браузер и/или HTTP-сессию)
+    на всю сессию и обрабатывает категории из очереди задач, пока не получит None.
+    Найденные товары отправляются в главный процесс постранично,
+    сам воркер в базу не пишет. Задача — пара (арендованная категория
+    frontier.FrontierItem, проверка отпечатков); заполненная проверка
+    возвращается в сообщении 'done'.
+    """
+    fetcher = None
+    parse_listing = fast_parser.get_listing_parser(parse_engine)
+    try:
+        fetcher = fetchers.create_fetcher(fetch_mode, min_interval=request_interval)
+        if not fetcher:
+            result_queue.put(('error', worker_id, None, "Не удалось запустить загрузчик страниц"))
+            return
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            item, page_check = task
+            category_url = item.category_url
+            try:
+                for page_num, products in parser.iter_category_pages(
+                        fetcher, category_url, parse_listing, page_check,
+                        start_page=item.next_page, parsed_in_category_urls=item.seen_first_urls):
+                    result_queue.put(('page', worker_id, category_url, (page_num, products, item.seen_first_urls)))
+                result_queue.put(('done', worker_id, category_url, page_check))
+            except Exception as e:
+                result_queue.put(('error', worker_id, category_url, f"{e}\n{traceback.format_exc()}"))
+                # После ошибки браузер может быть в неисправном состоянии — перезапускаем загрузчик
+                fetcher.close()
+                fetcher = fetchers.create_fetcher(fetch_mode, min_interval=request_interval)
+                if not fetcher:
+                    result_queue.put(('error', worker_id, None, "Не удалось перезапустить загрузчик страниц"))
+                    return
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fetcher:
+            fetcher.close()
+        result_queue.put(('exit', worker_id, None, None))
+
+# --- Код главного процесса ---
+
+def run_category_pool(source_name: str, workers: int, is_test: bool = False, fetch_mode: str = 'auto',
+                      total_categories: int = None, parse_engine: str = 'lxml',
+                      fingerprint_pages: int = fingerprints.DEFAULT_CHECK_PAGES,
+                      full_refresh_days: float = fingerprints.DEFAULT_FULL_REFRESH_DAYS,
+                      lease_seconds: int = frontier.DEFAULT_LEASE_SECONDS,
+                      request_interval: float = fetchers.DEFAULT_MIN_REQUEST_INTERVAL) -> int:
+    """
+    Раздает категории из фронтира обхода пулу из `workers` процессов и пишет
+    их результаты через единственный RawWriter. Главный процесс берет категорию
+    в аренду, только когда освобождается воркер, и фиксирует позицию обхода
+    вместе с товарами каждой страницы. Возвращает количество сохраненных товаров.
+    """
+    context = multiprocessing.get_context()
+    task_queue = context.Queue()
+    result_queue = context.Queue()
+    processes = [
+        context.Process(target=_worker_main, args=(worker_id, fetch_mode, parse_engine, request_interval, task_queue, result_queue), daemon=True)
+        for worker_id in range(workers)
+    ]
+
+    try:
+        with database.RawWriter(source_name, is_test=is_test) as raw_writer:
+            crawl_frontier = frontier.CrawlFrontier(raw_writer.conn, lease_seconds=lease_seconds)
+            leased = {}
+
+            def dispatch_next():
+                """Отдает освободившемуся воркеру следующую категорию (или None — сигнал завершения)."""
+                item = crawl_frontier.lease_next()
+                if item is None:
+                    task_queue.put(None)
+                    return
+                page_check = fingerprints.load_checks(raw_writer.conn, [item.category_url],
+                                                      fingerprint_pages, full_refresh_days)[item.category_url]
+                leased[item.category_url] = item
+                task_queue.put((item, page_check))
+
+            try:
+                for _ in range(workers):
+                    dispatch_next()
+                for process in processes:
+                    process.start()
+
+                alive_workers = workers
+                with tqdm(total=total_categories, desc="Обработка категорий") as progress:
+                    while alive_workers:
+                        try:
+                            kind, worker_id, category_url, payload = result_queue.get(timeout=RESULT_POLL_TIMEOUT)
+                        except queue.Empty:
+                            # Воркер мог упасть, не успев сообщить о завершении
+                            if not any(process.is_alive() for process in processes):
+                                break
+                            continue
+
+                        if kind == 'page':
+                            item = leased.get(category_url)
+                            if item is None:
+                                continue
+                            page_num, products, seen_first_urls = payload
+                            for product_data in products:
+                                raw_writer.add(product_data)
+                            try:
+                                raw_writer.flush(checkpoint=crawl_frontier.page_checkpoint(item, page_num, seen_first_urls))
+                            except frontier.LeaseLostError as e:
+                                # Категорию продолжает другой процесс, оставшиеся страницы этого воркера игнорируем
+                                tqdm.write(f"\n{e}")
+                                leased.pop(category_url)
+                        elif kind == 'done':
+                            item = leased.pop(category_url, None)
+                            if item is not None:
+                                raw_writer.flush()
+                                fingerprints.save_check(raw_writer.conn, payload)
+                                crawl_frontier.complete(item)
+                            progress.update(1)
+                            dispatch_next()
+                        elif kind == 'error':
+                            where = f"категории {category_url}" if category_url else "воркера"
+                            tqdm.write(f"\n[воркер {worker_id}] Ошибка при обработке {where}: {payload}")
+                            if category_url:
+                                # Категория вернется в очередь с той же страницы (см. frontier.release)
+                                item = leased.pop(category_url, None)
+                                if item is not None:
+                                    raw_writer.flush()
+                                    crawl_frontier.release(item, error=payload.splitlines()[0] if payload else None)
+                                dispatch_next()
+                        elif kind == 'exit':
+                            alive_workers -= 1
+                return raw_writer.total_written
+            finally:
+                # Прерывание (Ctrl-C) или падение главного процесса: недообработанные
+                # категории сразу возвращаются в очередь, не дожидаясь истечения аренды
+                for item in leased.values():
+                    crawl_frontier.abandon(item)
+    finally:
+        for process in processes:
+            if process.pid is None:
+                continue
+            process.join(timeout=RESULT_POLL_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,27 @@
+# tests/test_attributes.py
+
+import pytest
+
+from src.dwh_builder import attributes
+
+
+@pytest.mark.parametrize('raw_value, expected', [
+    ('1200x600', (None, None)),
+    ('10 шт/уп', (10.0, 'шт/уп')),
+    ('2,5 мм', (2.5, 'мм')),
+    ('1 200 кг', (1200.0, 'кг')),
+    ('100 200', (None, None)),
+    ('12 м²', (12.0, 'м2')),
+])
+def test_parse_numeric_value(raw_value, expected):
+    assert attributes.parse_numeric_value(raw_value) == expected
+
+
+def test_unit_from_attribute_name_only_if_known():
+    assert attributes.parse_numeric_value('12', 'Толщина, мм') == (12.0, 'мм')
+    assert attributes.parse_numeric_value('5', 'Цвет, оттенок') == (5.0, None)
+
+
+def test_ambiguous_letter_in_attribute_name_is_not_unit():
+    assert attributes.split_key_unit('Класс, А') == ('Класс, А', None)
+    assert attributes.split_key_unit('Площадь, м²') == ('Площадь', 'м2')
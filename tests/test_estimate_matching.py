@@ -0,0 +1,61 @@
+# tests/test_estimate_matching.py
+
+import pytest
+
+from src.common import database
+from src.dwh_builder import estimate_matching
+from src.dwh_builder import upload_excel
+
+SOURCE_NAME = 'petrovich'
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DDS_DATA_DIR', str(tmp_path))
+    database.init_dds_db(SOURCE_NAME)
+    conn = database.get_db_connection(database.get_dds_db_path())
+    upload_excel.init_estimates_table(conn)
+    estimate_matching.init_matching_tables(conn, SOURCE_NAME)
+    yield conn
+    conn.close()
+
+
+def _add_product(conn, product_id: str, title: str, unit: str):
+    with conn:
+        conn.execute(f'''
+            INSERT INTO {SOURCE_NAME}_fact_products (product_id, title, retail_price, unit, parsed_at)
+            VALUES (?, ?, 100.0, ?, '2026-01-01')
+        ''', (product_id, title, unit))
+
+
+def _match(conn):
+    estimate_matching.update_product_index(conn, SOURCE_NAME)
+    return estimate_matching.match_estimates(conn, SOURCE_NAME)
+
+
+def _top_match(conn, estimate_key: int):
+    row = conn.execute(f'''
+        SELECT product_id FROM {SOURCE_NAME}_estimate_matches WHERE estimate_key = ? AND match_rank = 1
+    ''', (estimate_key,)).fetchone()
+    return row[0] if row else None
+
+
+def test_unmatched_estimate_is_rematched_when_catalog_grows(conn):
+    _add_product(conn, '1001', 'Цемент ПЦ 500 Д0 50 кг', 'шт')
+    with conn:
+        conn.executemany('''
+            INSERT INTO fact_estimates (upload_date, source_file, item_code, item_name, unit, price_per_unit)
+            VALUES ('2026-01-01', 'smeta.xlsx', ?, ?, ?, 1.0)
+        ''', [('01', 'Цемент ПЦ 500 Д0', 'шт'), ('02', 'Гипсокартон влагостойкий 12,5 мм', 'лист')])
+    cement_key, drywall_key = [key for (key,) in conn.execute('SELECT estimate_key FROM fact_estimates ORDER BY 1')]
+
+    assert _match(conn) == 2
+    assert _top_match(conn, cement_key) == '1001'
+    assert _top_match(conn, drywall_key) is None
+    # Ничего не изменилось — сопоставлять нечего
+    assert _match(conn) == 0
+
+    _add_product(conn, '2002', 'Гипсокартон влагостойкий Knauf 12,5 мм 2500x1200', 'лист')
+    assert _match(conn) >= 1
+    assert _top_match(conn, drywall_key) == '2002'
+    assert _top_match(conn, cement_key) == '1001'
@@ -0,0 +1,18 @@
+# tests/test_fast_parser.py
+
+import os
+
+import pytest
+
+from benchmarks.run_benchmarks import FIXTURES_DIR
+from src.raw_data_parser import fast_parser
+
+FIXTURE_NAMES = sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith('.html'))
+
+
+@pytest.mark.parametrize('fixture_name', FIXTURE_NAMES)
+def test_lxml_engine_matches_bs4_on_fixture(fixture_name):
+    with open(os.path.join(FIXTURES_DIR, fixture_name), encoding='utf-8') as f:
+        html = f.read()
+    assert fast_parser.parse_listing_page(html)
+    assert fast_parser.find_mismatches(html) == []
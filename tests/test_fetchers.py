@@ -0,0 +1,131 @@
+# tests/test_fetchers.py
+
+import functools
+import http.server
+import os
+import threading
+
+import pytest
+
+from benchmarks.run_benchmarks import FIXTURES_DIR
+from src.raw_data_parser import category_tree
+from src.raw_data_parser import fetchers
+
+CATALOG_HTML = (
+    '<html><body><nav><a href="/catalog/">Каталог</a></nav><main>'
+    '<a href="/catalog/1281/">Сухие смеси</a><a href="/catalog/1281/1290/">Цемент</a>'
+    '</main></body></html>'
+)
+
+
+class StubHttpFetcher:
+    """HTTP-загрузчик, который всегда отдает один и тот же HTML."""
+
+    def __init__(self, html: str):
+        self.html = html
+        self.throttle = fetchers.RequestThrottle(0)
+        self.last_headers = {}
+
+    def fetch_html(self, url, ready_selector=None, request_headers=None):
+        return self.html
+
+    def close(self):
+        pass
+
+
+def _browser_must_not_start():
+    raise AssertionError("Браузер не должен запускаться")
+
+
+def test_catalog_page_over_http_does_not_start_browser():
+    fetcher = fetchers.HttpFirstFetcher(StubHttpFetcher(CATALOG_HTML), driver_factory=_browser_must_not_start)
+    html = fetcher.fetch_html(category_tree.CATALOG_URL, category_tree.CATALOG_READY_SELECTOR)
+    assert [category['url'] for category in category_tree.parse_category_tree(html)] == [
+        f"{category_tree.parser.BASE_URL}/catalog/1281/"]
+
+
+def test_catalog_menu_link_alone_is_not_ready():
+    html = '<html><body><nav><a href="/catalog/">Каталог</a></nav><main class="skeleton"></main></body></html>'
+    assert not fetchers.is_page_ready(html, category_tree.CATALOG_READY_SELECTOR)
+    assert fetchers.is_page_ready(CATALOG_HTML, category_tree.CATALOG_READY_SELECTOR)
+
+
+# --- Загрузка с локального HTTP-сервера фикстур ---
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Раздает файлы каталога без вывода журнала запросов."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def fixture_server():
+    """Раздает benchmarks/fixtures/*.html по HTTP на localhost. Возвращает базовый URL."""
+    handler = functools.partial(QuietHandler, directory=FIXTURES_DIR)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class StubDriver:
+    """Браузер-заглушка: отдает заранее заданный HTML и запоминает открытые URL."""
+
+    def __init__(self, page_source: str):
+        self.page_source = page_source
+        self.opened = []
+
+    def get(self, url):
+        self.opened.append(url)
+
+    def find_element(self, by, value):
+        return object()
+
+    def quit(self):
+        pass
+
+
+def _fixture_names() -> list:
+    return sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith('.html'))
+
+
+def _read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_http_fetcher_returns_fixture_page(fixture_server):
+    name = _fixture_names()[0]
+    fetcher = fetchers.HttpFetcher(min_interval=0)
+    try:
+        assert fetcher.fetch_html(f"{fixture_server}/{name}") == _read_fixture(name)
+    finally:
+        fetcher.close()
+
+
+def test_http_first_fetcher_keeps_http_page_with_cards(fixture_server):
+    name = _fixture_names()[0]
+    fetcher = fetchers.HttpFirstFetcher(fetchers.HttpFetcher(min_interval=0), driver_factory=_browser_must_not_start)
+    try:
+        html = fetcher.fetch_html(f"{fixture_server}/{name}")
+    finally:
+        fetcher.close()
+    assert html == _read_fixture(name)
+    assert fetcher.selenium_fetcher is None
+
+
+def test_http_first_fetcher_falls_back_to_browser_without_cards(fixture_server):
+    rendered = _read_fixture(_fixture_names()[0])
+    driver = StubDriver(rendered)
+    fetcher = fetchers.HttpFirstFetcher(fetchers.HttpFetcher(min_interval=0), driver_factory=lambda: driver)
+    # Оглавление каталога фикстур — обычная HTML-страница без карточек
+    url = f"{fixture_server}/"
+    try:
+        html = fetcher.fetch_html(url)
+    finally:
+        fetcher.close()
+    assert html == rendered
+    assert driver.opened == [url]
@@ -0,0 +1,52 @@
+# tests/test_fingerprints.py
+
+from benchmarks import generators
+from src.raw_data_parser import fast_parser
+from src.raw_data_parser import fingerprints
+from src.raw_data_parser import parser
+
+CATEGORY_URL = 'https://example.test/catalog/1/'
+
+
+def _cards(products: list) -> list:
+    return fast_parser.get_listing_parser('lxml')(generators.render_listing_page(products))
+
+
+def _check(previous_pages: dict) -> fingerprints.CategoryFingerprintCheck:
+    return fingerprints.CategoryFingerprintCheck(CATEGORY_URL, previous_pages, check_pages=1, full_refresh=False)
+
+
+def test_same_etag_with_changed_prices_is_not_skipped():
+    products = list(generators.iter_products(3))
+    previous = {1: (fingerprints.compute_page_fingerprint(_cards(products)), '"v1"', None)}
+    products[0] = dict(products[0], retail_price=products[0]['retail_price'] + 1)
+    check = _check(previous)
+    assert check(1, _cards(products), {'ETag': '"v1"'})
+    assert not check.skipped
+
+
+def test_unchanged_fingerprint_is_skipped():
+    cards = _cards(list(generators.iter_products(3)))
+    check = _check({1: (fingerprints.compute_page_fingerprint(cards), None, None)})
+    assert not check(1, cards, {})
+    assert check.skipped
+
+
+class NotModifiedFetcher:
+    """Отвечает 304 на условный запрос и запоминает отправленные заголовки."""
+
+    def __init__(self):
+        self.request_headers = []
+
+    def fetch_html(self, url, request_headers=None):
+        self.request_headers.append(request_headers)
+        return parser.NOT_MODIFIED if request_headers else None
+
+
+def test_not_modified_response_skips_category_without_parsing():
+    previous_page = ('fingerprint', '"v1"', 'Wed, 01 Jan 2026 00:00:00 GMT')
+    check = _check({1: previous_page})
+    fetcher = NotModifiedFetcher()
+    assert list(parser.iter_category_pages(fetcher, CATEGORY_URL, page_check=check)) == []
+    assert fetcher.request_headers == [{'If-None-Match': '"v1"', 'If-Modified-Since': previous_page[2]}]
+    assert check.skipped and check.pages == {1: previous_page}
@@ -0,0 +1,70 @@
+# tests/test_parser.py
+
+import pytest
+
+from benchmarks import generators
+from src.raw_data_parser import fast_parser
+from src.raw_data_parser import fetchers
+from src.raw_data_parser import parser
+
+
+class FakeFetcher:
+    """Отдает заранее заготовленные страницы; на страницах из not_ready браузер не дожидается готовности."""
+
+    def __init__(self, pages: list, not_ready: set = ()):
+        self.pages = pages
+        self.not_ready = set(not_ready)
+        self.requested = []
+
+    def fetch_html(self, url, request_headers=None):
+        page_num = int(url.rsplit('=', 1)[1])
+        self.requested.append(page_num)
+        if page_num in self.not_ready:
+            raise fetchers.PageNotReadyError(f"Страница {url} не загрузилась")
+        return self.pages[page_num - 1]
+
+
+def _listing_without_page_count(products: list) -> str:
+    """Страница листинга без пагинации и счетчика товаров: число страниц неизвестно."""
+    html = generators.render_listing_page(products)
+    return html.replace('?p=', '?page=').replace('data-test="products-count"', '')
+
+
+def _empty_listing() -> str:
+    """Страница за концом категории: вместо карточек сообщение о пустой выдаче."""
+    return _listing_without_page_count([]).replace(
+        '<div class="listing__items">', '<div class="listing__items"><p data-test="catalog-empty">Товаров нет</p>')
+
+
+def test_empty_tail_page_ends_category():
+    products = list(generators.iter_products(4))
+    fetcher = FakeFetcher([_listing_without_page_count(products[:2]), _listing_without_page_count(products[2:]),
+                           _empty_listing()])
+    pages = list(parser.iter_category_pages(fetcher, 'https://example.test/catalog/1/',
+                                            fast_parser.get_listing_parser('lxml')))
+    assert [(page_num, len(cards)) for page_num, cards in pages] == [(1, 2), (2, 2)]
+    assert fetcher.requested == [1, 2, 3]
+
+
+@pytest.mark.parametrize('not_ready_page', [1, 2])
+def test_not_ready_page_is_error(not_ready_page):
+    products = list(generators.iter_products(4))
+    fetcher = FakeFetcher([_listing_without_page_count(products[:2]), _listing_without_page_count(products[2:])],
+                          not_ready={not_ready_page})
+    with pytest.raises(fetchers.PageNotReadyError):
+        list(parser.iter_category_pages(fetcher, 'https://example.test/catalog/1/'))
+
+
+def test_page_count_ignores_counters_and_links_outside_listing():
+    products = list(generators.iter_products(2))
+    html = generators.render_listing_page(products, page_count=3).replace(
+        '<a href="/promo/">Акции</a>',
+        '<a href="/promo/?p=40">Акции</a><span data-test="cart-count" class="header__badge">99</span>')
+    assert parser.get_page_count(html, len(products)) == 3
+
+
+def test_page_count_from_listing_counter():
+    products = list(generators.iter_products(2))
+    html = generators.render_listing_page(products, page_count=5).replace('?p=', '?page=').replace(
+        '<nav class="header__menu">', '<nav class="header__menu"><span data-test="cart-total">7 000</span>')
+    assert parser.get_page_count(html, len(products)) == 5